@@ -24,7 +24,8 @@ function streamFile(path: string, options?: ReadableOptions): ReadableStream<Uin
 }
 
 /**
- * Serves the recorded sounds to be played by the client locally.
+ * Serves the recorded sounds to be played by the client locally, and the `.json`
+ * sidecars the sound detector writes next to them to draw them without the whole clip.
  *
  * E.g. `GET /api/sounds/2024/1/27/2024-01-27T10:12:00.431431_highheels.wav` would
  * return the sound file on the server in
@@ -45,7 +46,7 @@ export async function GET(request: NextRequest) {
       status: 200,
       headers: {
         "Content-Disposition": `attachment; filename="${path.basename(absFilePath)}"`,
-        "Content-Type": "audio/wav",
+        "Content-Type": absFilePath.endsWith(".json") ? "application/json" : "audio/wav",
         "Content-Length": fileStat.size.toString(),
       },
     }
@@ -0,0 +1,195 @@
+"""
+Load generator simulating many sound detectors notifying the distributor at once.
+
+Each simulated detector pushes detections like `sound_detector/inference.py` does (a
+PUSH socket with `DETECTION_SEND_HWM`, non-blocking sends dropped when the queue is
+full) at `--rate` detections per second with random (Poisson) arrivals, plus a burst
+of `--burst-size` detections every `--burst-every` seconds. Each one also subscribes to
+the playback events, as the `PlayEventsManager` of the detectors does.
+
+At the end it reports the detections sent and dropped by the senders, the ones whose
+playback event never arrived, and the latency from sending a detection to every
+detector receiving its playback event, split in the time queued before the distributor
+got it and the time until it published it (only against `mock_playback_distributor.py`,
+which reports both).
+
+    python mock_playback_distributor.py &
+    python load_test_detections.py --detectors 20 --rate 1 --duration 30 --binary
+"""
+
+import argparse
+import threading
+import time
+
+from typing import Dict, List
+
+import numpy as np
+import zmq
+
+from sound_detector import messages
+
+parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+parser.add_argument("--push-addr", default="tcp://localhost:5555")
+parser.add_argument("--sub-addr", default="tcp://localhost:5556")
+parser.add_argument("--detectors", type=int, default=5)
+parser.add_argument(
+    "--rate", type=float, default=0.5, help="Detections per second of each detector."
+)
+parser.add_argument("--burst-size", type=int, default=0)
+parser.add_argument("--burst-every", type=float, default=10.0)
+parser.add_argument("--duration", type=float, default=20.0, help="Seconds sending.")
+parser.add_argument(
+    "--grace", type=float, default=3.0, help="Seconds waiting for late events."
+)
+parser.add_argument("--hwm", type=int, default=10, help="Like `DETECTION_SEND_HWM`.")
+parser.add_argument(
+    "--binary",
+    action="store_true",
+    help="Send the binary format carrying the audio instead of JSON.",
+)
+parser.add_argument("--clip-seconds", type=float, default=4.875)
+args = parser.parse_args()
+
+context = zmq.Context()
+
+# Sound file path of each detection sent (unique) to the time it was sent.
+sent_at: Dict[str, float] = {}
+sent_at_lock = threading.Lock()
+dropped: List[int] = [0] * args.detectors
+
+clip = np.zeros(int(args.clip_seconds * 16000), dtype=np.int16).tobytes()
+
+
+def run_detector(index: int, started_at: float):
+    push_socket = context.socket(zmq.PUSH)
+    push_socket.setsockopt(zmq.SNDHWM, args.hwm)
+    push_socket.setsockopt(zmq.LINGER, 0)
+    push_socket.connect(args.push_addr)
+
+    rng = np.random.default_rng(index)
+    machine_id = f"load-{index}"
+    num_sent = 0
+    next_at = started_at + rng.exponential(1 / args.rate) if args.rate else None
+    next_burst_at = started_at + args.burst_every if args.burst_size else None
+
+    while time.time() < started_at + args.duration:
+        due = [at for at in (next_at, next_burst_at) if at]
+        if not due:
+            break
+        time.sleep(max(0.0, min(due) - time.time()))
+
+        count = 0
+        if next_at and time.time() >= next_at:
+            count += 1
+            next_at += rng.exponential(1 / args.rate)
+        if next_burst_at and time.time() >= next_burst_at:
+            count += args.burst_size
+            next_burst_at += args.burst_every
+
+        for _ in range(count):
+            num_sent += 1
+            path = f"load/{machine_id}/{num_sent}.wav"
+            now = time.time()
+            # Before sending, the event could otherwise arrive first.
+            with sent_at_lock:
+                sent_at[path] = now
+            try:
+                if args.binary:
+                    frames = messages.encode_detection(
+                        path, machine_id, clip, when=round(now), score=1.0, rate=16000
+                    )
+                    push_socket.send_multipart(frames, flags=zmq.NOBLOCK, copy=False)
+                else:
+                    push_socket.send_json(
+                        {
+                            "sound_file_path": path,
+                            "when": round(now),
+                            "detected_by": machine_id,
+                        },
+                        flags=zmq.NOBLOCK,
+                    )
+            except zmq.Again:
+                dropped[index] += 1
+                with sent_at_lock:
+                    del sent_at[path]
+
+    push_socket.close()
+
+
+sub_sockets = []
+poller = zmq.Poller()
+for _ in range(args.detectors):
+    sub_socket = context.socket(zmq.SUB)
+    sub_socket.setsockopt_string(zmq.SUBSCRIBE, "")
+    sub_socket.connect(args.sub_addr)
+    poller.register(sub_socket, zmq.POLLIN)
+    sub_sockets.append(sub_socket)
+
+# Let the subscriptions reach the publisher before anything is published.
+time.sleep(0.5)
+
+started_at = time.time()
+threads = [
+    threading.Thread(target=run_detector, args=(i, started_at), daemon=True)
+    for i in range(args.detectors)
+]
+for thread in threads:
+    thread.start()
+
+print(
+    f"Simulating {args.detectors} detectors for {args.duration} s "
+    f"({'binary' if args.binary else 'json'} messages)."
+)
+
+# Latencies in seconds of each playback event received by each detector.
+latencies: List[float] = []
+queued: List[float] = []
+processing: List[float] = []
+# Detections whose playback event was received by at least one detector.
+delivered = set()
+
+deadline = started_at + args.duration + args.grace
+while time.time() < deadline:
+    for sub_socket, _ in poller.poll(100):
+        event = sub_socket.recv_json()
+        received_at = time.time()
+
+        with sent_at_lock:
+            detection_sent_at = sent_at.get(event.get("sound_file_path"))
+        if detection_sent_at is None:
+            continue
+
+        latencies.append(received_at - detection_sent_at)
+        if "distributor_received_at" in event:
+            queued.append(event["distributor_received_at"] - detection_sent_at)
+            processing.append(
+                event["distributor_published_at"] - event["distributor_received_at"]
+            )
+        delivered.add(event["sound_file_path"])
+
+
+def describe(name: str, values: List[float]):
+    if not values:
+        print(f"{name:<24} -")
+        return
+    p50, p95, p99 = np.percentile(values, [50, 95, 99]) * 1000
+    print(
+        f"{name:<24} p50 {p50:8.2f} ms  p95 {p95:8.2f} ms  p99 {p99:8.2f} ms  "
+        f"max {max(values) * 1000:8.2f} ms"
+    )
+
+
+num_sent = len(sent_at)
+print(f"{'sent':<24} {num_sent} ({num_sent / args.duration:.1f}/s)")
+print(f"{'dropped by the senders':<24} {sum(dropped)}")
+print(f"{'never published':<24} {num_sent - len(delivered)}")
+print(
+    f"{'events received':<24} {len(latencies)} (expected {num_sent * args.detectors})"
+)
+describe("end to end", latencies)
+describe("queued", queued)
+describe("distributor", processing)
+
+for sub_socket in sub_sockets:
+    sub_socket.close(linger=0)
+context.term()
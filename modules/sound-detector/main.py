@@ -1,7 +1,15 @@
 import argparse
 
 # Import it before using the `logging` module, so it can be configured.
-from sound_detector import inference, retrain
+from sound_detector import (
+    aggregator,
+    benchmark,
+    inference,
+    inference_server,
+    recordings_index,
+    retrain,
+    tune,
+)
 from sound_detector.config import config
 from sound_detector.exceptions import TaconezException
 
@@ -23,6 +31,23 @@ if __name__ == "__main__":
 
     # TODO: Include specific arguments for inference `parser_inference.add_argument('--flag', ...)`
 
+    parser_inference_server = subparsers.add_parser(
+        "inference-server",
+        help=(
+            "Run the models on behalf of the nodes that have `REMOTE_INFERENCE` "
+            "enabled (thin-edge mode). Meant to be run on the master."
+        ),
+    )
+
+    parser_aggregator = subparsers.add_parser(
+        "aggregator",
+        help=(
+            "Group the detections the nodes with `DETECTION_AGGREGATION` make of the "
+            "same event and only save, record and notify the best one. Meant to be "
+            "run on the master."
+        ),
+    )
+
     parser_retrain = subparsers.add_parser(
         "retrain",
         help=(
@@ -31,7 +56,110 @@ if __name__ == "__main__":
         )
     )
 
-    # TODO: Include specific arguments for retrain `parser_retrain.add_argument('--flag', ...)`
+    parser_retrain.add_argument(
+        "--sweep",
+        action="store_true",
+        help=(
+            "Cross-validate a grid of head sizes and learning rates in parallel, save "
+            "the best one and recommend a `RETRAINED_MODEL_OUTPUT_THRESHOLD`."
+        ),
+    )
+    parser_retrain.add_argument(
+        "--folds",
+        type=int,
+        default=5,
+        help="Cross-validation folds for `--sweep`, at least 3.",
+    )
+    parser_retrain.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Processes training heads for `--sweep`, by default one per core.",
+    )
+    parser_retrain.add_argument(
+        "--distill",
+        action="store_true",
+        help=(
+            "Train a small log-mel CNN that mimics the retrained model without running "
+            "YAMNet, save it for `RETRAINED_MODEL_VARIANT=distilled` and report how it "
+            "compares."
+        ),
+    )
+
+    parser_tune = subparsers.add_parser(
+        "tune",
+        help=(
+            "Score labelled recordings once (cached by model and file hash) and "
+            "evaluate thousands of detection thresholds and debounces on them."
+        ),
+    )
+    parser_tune.add_argument(
+        "--positive",
+        nargs="+",
+        default=None,
+        help="Directories of recordings with the sound, by default dataset/positive.",
+    )
+    parser_tune.add_argument(
+        "--negative",
+        nargs="+",
+        default=None,
+        help=(
+            "Directories of recordings without it, by default dataset/negative. They "
+            "are also used to estimate the detections per day."
+        ),
+    )
+    parser_tune.add_argument("--cache-dir", default=tune.default_cache_dir)
+    parser_tune.add_argument("--thresholds", type=int, default=2000)
+    parser_tune.add_argument(
+        "--debounce",
+        type=int,
+        nargs="+",
+        default=tune.default_debounces,
+        help="Windows after a detection in which no new one is counted.",
+    )
+    parser_tune.add_argument(
+        "--output", default=None, help="CSV file to write every threshold to."
+    )
+
+    parser_reindex = subparsers.add_parser(
+        "reindex",
+        help=(
+            "Rebuild the per-day index of the recordings folder from the recordings, "
+            "for those saved before `RECORDINGS_INDEX` or after a crash."
+        ),
+    )
+    parser_reindex.add_argument(
+        "--recordings-dir",
+        default=None,
+        help="Recordings folder to index, by default `DETECTED_RECORDINGS_DIR`.",
+    )
+
+    parser_benchmark = subparsers.add_parser(
+        "benchmark",
+        help=(
+            "Time the detector hot path on synthetic audio and compare it against the "
+            "stored baseline. Exits with an error if anything got slower."
+        ),
+    )
+    parser_benchmark.add_argument(
+        "--repeat", type=int, default=50, help="Times each benchmark is run."
+    )
+    parser_benchmark.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Allowed slowdown over the baseline median (0.25 is 25%%).",
+    )
+    parser_benchmark.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Store the results as the new baseline.",
+    )
+    parser_benchmark.add_argument(
+        "--fake-only",
+        action="store_true",
+        help="Skip the benchmarks that load the real TFLite models.",
+    )
 
     args = parser.parse_args()
 
@@ -41,6 +169,35 @@ if __name__ == "__main__":
     if args.command == "inference":
         inference.run_loop()
 
+    elif args.command == "inference-server":
+        inference_server.run_server()
+
+    elif args.command == "aggregator":
+        aggregator.run_aggregator()
+
+    elif args.command == "tune":
+        tune.run(
+            positive_dirs=args.positive,
+            negative_dirs=args.negative,
+            cache_dir=args.cache_dir,
+            num_thresholds=args.thresholds,
+            debounces=args.debounce,
+            output_path=args.output,
+        )
+
+    elif args.command == "reindex":
+        recordings_index.rebuild_index(args.recordings_dir)
+
+    elif args.command == "benchmark":
+        passed = benchmark.run(
+            repeat=args.repeat,
+            tolerance=args.tolerance,
+            save=args.save_baseline,
+            real_tflite=not args.fake_only,
+        )
+        if not passed:
+            exit(1)
+
     elif args.command == "retrain":
         if config.use_tflite:
             raise TaconezException(
@@ -48,7 +205,12 @@ if __name__ == "__main__":
                 "would imply not installing the TensorFlow libraries and only the TFLite "
                 "runtime instead."
             )
-        retrain.run()
+        retrain.run(
+            sweep_heads=args.sweep,
+            folds=args.folds,
+            workers=args.workers,
+            distill_student=args.distill,
+        )
 
     else:
         parser.print_help()
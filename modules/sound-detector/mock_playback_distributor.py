@@ -0,0 +1,92 @@
+"""
+Stand-in for the playback distributor, for load testing against localhost.
+
+Pulls detections on :5555 (in the JSON or the binary format, see
+`sound_detector/messages.py`) and publishes a playback event for each on :5556, shaped
+as the one of the C distributor plus the times it received and published it. Unlike
+the real one it does not need the sound files to exist.
+
+    python mock_playback_distributor.py --processing-ms 20
+    python load_test_detections.py --detectors 10 --rate 2
+"""
+
+import argparse
+import json
+import time
+
+import zmq
+
+from sound_detector import messages
+
+parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+parser.add_argument("--pull-addr", default="tcp://*:5555")
+parser.add_argument("--pub-addr", default="tcp://*:5556")
+parser.add_argument(
+    "--processing-ms",
+    type=float,
+    default=0.0,
+    help="Time spent on each detection, as the real one spends reading the files.",
+)
+parser.add_argument(
+    "--sound-duration",
+    type=float,
+    default=4.875,
+    help="Duration reported for JSON detections, which don't carry the audio.",
+)
+parser.add_argument("--preroll-duration", type=float, default=1.0)
+args = parser.parse_args()
+
+context = zmq.Context()
+pull_socket = context.socket(zmq.PULL)
+pull_socket.bind(args.pull_addr)
+pub_socket = context.socket(zmq.PUB)
+pub_socket.bind(args.pub_addr)
+
+print(f"[mock-distributor] Pulling on {args.pull_addr}, publishing on {args.pub_addr}.")
+
+received = 0
+reported_at = time.monotonic()
+
+while True:
+    frames = pull_socket.recv_multipart(copy=False)
+    received_at = time.time()
+
+    if len(frames) == 1 and frames[0].bytes == b"exit":
+        pub_socket.send_string("exit")
+        break
+
+    if len(frames) == 1:
+        message = json.loads(frames[0].bytes)
+        when = message["when"]
+        sound_file_path = message["sound_file_path"]
+        sound_duration = args.sound_duration
+    else:
+        detection = messages.decode_detection(frames)
+        header = detection.header
+        when = header.when
+        sound_file_path = detection.sound_file_path
+        sound_duration = len(detection.audio) / (
+            header.sample_width * header.channels * header.rate
+        )
+
+    if args.processing_ms:
+        time.sleep(args.processing_ms / 1000)
+
+    pub_socket.send_json(
+        {
+            "when": when,
+            "sound_file_path": sound_file_path,
+            "abs_sound_file_path": f"/app/recordings/{sound_file_path}",
+            "preroll_file_path": "mock.wav",
+            "abs_preroll_file_path": "/app/prerolls/mock.wav",
+            "sound_duration": sound_duration,
+            "preroll_duration": args.preroll_duration,
+            "distributor_received_at": received_at,
+            "distributor_published_at": time.time(),
+        }
+    )
+
+    received += 1
+    if time.monotonic() - reported_at >= 5:
+        print(f"[mock-distributor] {received} detections published.")
+        reported_at = time.monotonic()
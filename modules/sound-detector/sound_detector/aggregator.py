@@ -0,0 +1,308 @@
+"""
+Aggregation of the detections of all the nodes into one per event, run on the master.
+
+Several nodes often hear the same footsteps, and each would save its own clip, write
+its own database entry and notify the distributor, playing the sound back several
+times. With `DETECTION_AGGREGATION` the nodes instead send their detections (candidates)
+to the aggregator, clip included, in the binary format of `sound_detector/messages.py`.
+
+Anything on the network can send to the aggregator, so the path of the clip is not taken
+from the message: it's rebuilt like the nodes build it, from the machine id, the sound
+class and the score, which must be plain names and a finite number.
+
+The first candidate to arrive opens an event and every candidate arriving in the next
+`AGGREGATION_WINDOW_SECONDS` joins it. Once the window closes only the best scoring
+clip is saved, a single database entry is written, listing every node that heard it,
+and the distributor is notified once. The `STEALTH_MODE` of the aggregator, not the one
+of the nodes, decides whether it's notified.
+
+The clips are saved in background threads, but ZMQ sockets are not thread safe, so the
+distributor is always notified from the loop: a thread that saved a clip the
+distributor has to read from the share reports it through an inproc socket the loop
+polls, and the loop sends the notification.
+"""
+
+import logging
+import math
+import os
+import re
+import threading
+import time
+
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import zmq
+
+from sound_detector import messages
+from sound_detector.audio import recording_path, write_audio
+from sound_detector.config import config, machine_id_pattern
+from sound_detector.db import write_db_entry
+from sound_detector.sidecars import write_sidecar_in_background
+
+
+# Sound class slugs, which end up in the name of the clip along with the machine id.
+name_pattern = re.compile(r"^[\w.-]+$", re.ASCII)
+
+# Where the save threads report the events whose clip is on the share.
+saved_events_addr = "inproc://aggregator-saved-events"
+
+# The best detection of an event, the path of its clip and its audio.
+UnsavedEvent = Tuple[messages.DetectionMessage, str, bytes]
+
+
+class Candidate(NamedTuple):
+    # Monotonic time it was received at.
+    received_at: float
+    detection: messages.DetectionMessage
+
+
+class EventClusterer:
+    """Groups the candidates arriving within a window of the first one of an event."""
+
+    def __init__(self, window_seconds: float):
+        self.window_seconds = window_seconds
+        self.candidates: List[Candidate] = []
+        self.closes_at = 0.0
+
+    def add(self, candidate: Candidate):
+        if not self.candidates:
+            self.closes_at = candidate.received_at + self.window_seconds
+        self.candidates.append(candidate)
+
+    def seconds_until_due(self, now: float) -> Optional[float]:
+        """Seconds until the open event closes, `None` if there is none."""
+        if not self.candidates:
+            return None
+        return max(0.0, self.closes_at - now)
+
+    def pop_event(self, now: float) -> Optional[List[Candidate]]:
+        """Returns the candidates of the open event once its window has closed."""
+        if not self.candidates or now < self.closes_at:
+            return None
+
+        candidates, self.candidates = self.candidates, []
+        return candidates
+
+
+def best_candidate(candidates: List[Candidate]) -> Candidate:
+    return max(candidates, key=lambda candidate: candidate.detection.header.score)
+
+
+def validate_detection(detection: messages.DetectionMessage):
+    """Checks what the path of the clip is built from.
+
+    Raises:
+        ValueError: If the machine id or the sound class is not a plain name, or the
+            score is not finite.
+    """
+    if not re.match(machine_id_pattern, detection.detected_by):
+        raise ValueError(f"Invalid machine id {detection.detected_by!r}.")
+    if detection.sound and not name_pattern.match(detection.sound):
+        raise ValueError(f"Invalid sound class {detection.sound!r}.")
+    if not math.isfinite(detection.header.score):
+        raise ValueError(f"Invalid score {detection.header.score}.")
+
+
+def event_recording_path(detection: messages.DetectionMessage) -> str:
+    """Builds the path of the clip of an event on the share, as the nodes do."""
+    return recording_path(
+        suffix=f"{detection.detected_by}_{detection.sound or 'unknown'}-"
+        f"{detection.header.score:.3f}"
+    )
+
+
+class DetectionAggregator:
+    def __init__(self, context: zmq.Context):
+        self.context = context
+
+        bind_addr = config.zmq_aggregator_bind_addr
+        self.pull_socket = context.socket(zmq.PULL)
+        self.pull_socket.bind(bind_addr)
+        logging.info(f"[Aggregator] Bound ZMQ PULL socket ({bind_addr}).")
+
+        self.push_socket = None
+        if config.skip_detection_notification:
+            logging.info("[Aggregator] Upon events the distributor won't be notified.")
+        else:
+            push_addr = config.zmq_distributor_push_addr
+            self.push_socket = context.socket(zmq.PUSH)
+            if config.detection_send_hwm:
+                self.push_socket.setsockopt(zmq.SNDHWM, config.detection_send_hwm)
+            self.push_socket.connect(push_addr)
+            logging.info(f"[Aggregator] Connected ZMQ PUSH socket ({push_addr}).")
+
+            if config.detection_message_format == "binary":
+                logging.warning(
+                    "[Aggregator] Notifying events as binary messages, which only a "
+                    f"binary-aware receiver on {push_addr} can read, not the playback "
+                    "distributor."
+                )
+
+        self.saved_events_socket = context.socket(zmq.PULL)
+        self.saved_events_socket.bind(saved_events_addr)
+        # The events waiting for their clip to be saved to be notified, by number.
+        self.unsaved_events: Dict[int, UnsavedEvent] = {}
+
+        self.poller = zmq.Poller()
+        self.poller.register(self.pull_socket, zmq.POLLIN)
+        self.poller.register(self.saved_events_socket, zmq.POLLIN)
+
+        self.clusterer = EventClusterer(config.aggregation_window_seconds)
+        self.num_candidates = 0
+        self.num_events = 0
+
+    def serve_forever(self):
+        while True:
+            timeout = self.clusterer.seconds_until_due(time.monotonic())
+            ready = dict(self.poller.poll(None if timeout is None else timeout * 1000))
+            if self.pull_socket in ready:
+                self.receive_candidate()
+            if self.saved_events_socket in ready:
+                self.notify_saved_event()
+
+            candidates = self.clusterer.pop_event(time.monotonic())
+            if candidates:
+                self.handle_event(candidates)
+
+    def receive_candidate(self):
+        frames = self.pull_socket.recv_multipart(copy=False)
+        received_at = time.monotonic()
+
+        try:
+            detection = messages.decode_detection(frames)
+            validate_detection(detection)
+        except ValueError as e:
+            logging.warning(f"[Aggregator] Ignoring an invalid detection message: {e}")
+            return
+
+        logging.debug(
+            "[Aggregator] Candidate from %s (%.3f).",
+            detection.detected_by,
+            detection.header.score,
+        )
+        self.num_candidates += 1
+        self.clusterer.add(Candidate(received_at, detection))
+
+    def handle_event(self, candidates: List[Candidate]):
+        """Saves, writes and notifies the best detection of the event."""
+        best = best_candidate(candidates).detection
+        heard_by = sorted({candidate.detection.detected_by for candidate in candidates})
+
+        self.num_events += 1
+        logging.info(
+            f"[Aggregator] Event heard by {', '.join(heard_by)}, keeping the clip of "
+            f"{best.detected_by} ({best.header.score:.3f}). {self.num_events} events "
+            f"out of {self.num_candidates} detections so far."
+        )
+
+        audio = bytes(best.audio)
+        file_path = event_recording_path(best)
+        sound_file_path = os.path.relpath(file_path, config.detected_recordings_dir)
+
+        if config.waveform_sidecars:
+            write_sidecar_in_background(file_path, audio)
+
+        def save():
+            write_audio(audio, file_path=file_path)
+
+            if config.influx_db_token:
+                write_db_entry(
+                    best.sound or "unknown",
+                    best.header.score,
+                    sound_file_path,
+                    detected_by=best.detected_by,
+                    heard_by=heard_by,
+                )
+
+        notify = not config.stealth_mode and self.push_socket
+
+        # As in `save_and_notify_detection`, the binary format carries the clip so the
+        # distributor can be notified before it's saved, off the loop either way.
+        if notify and config.detection_message_format == "binary":
+            self.notify(best, sound_file_path, audio)
+            threading.Thread(target=save, daemon=True).start()
+            return
+
+        if not notify:
+            threading.Thread(target=save, daemon=True).start()
+            return
+
+        event_number = self.num_events
+        self.unsaved_events[event_number] = (best, sound_file_path, audio)
+
+        def save_and_report():
+            saved = False
+            try:
+                save()
+                saved = True
+            except Exception:
+                logging.exception("[Aggregator] Failed to save the clip of an event.")
+            finally:
+                # A socket of its own, since the loop's can't be used from this thread.
+                saved_events_socket = self.context.socket(zmq.PUSH)
+                saved_events_socket.connect(saved_events_addr)
+                saved_events_socket.send_json({"event": event_number, "saved": saved})
+                saved_events_socket.close()
+
+        threading.Thread(target=save_and_report, daemon=True).start()
+
+    def notify_saved_event(self):
+        """Notifies the distributor of an event whose clip was just saved."""
+        report = self.saved_events_socket.recv_json()
+        event = self.unsaved_events.pop(report["event"])
+        if report["saved"]:
+            self.notify(*event)
+
+    def notify(
+        self, detection: messages.DetectionMessage, sound_file_path: str, audio: bytes
+    ):
+        """Sends the event to the distributor.
+
+        With `DETECTION_SEND_HWM` it's dropped if the queue is full, instead of waiting.
+        """
+        header = detection.header
+        flags = zmq.NOBLOCK if config.detection_send_hwm else 0
+        try:
+            if config.detection_message_format == "binary":
+                frames = messages.encode_detection(
+                    sound_file_path,
+                    detection.detected_by,
+                    audio,
+                    when=header.when,
+                    score=header.score,
+                    rate=header.rate,
+                    channels=header.channels,
+                    sample_width=header.sample_width,
+                    sound=detection.sound,
+                )
+                self.push_socket.send_multipart(frames, flags=flags, copy=False)
+            else:
+                self.push_socket.send_json(
+                    {
+                        "sound_file_path": sound_file_path,
+                        "when": header.when,
+                        "detected_by": detection.detected_by,
+                    },
+                    flags=flags,
+                )
+        except zmq.Again:
+            logging.warning(
+                "[Aggregator] Dropped event notification, the distributor is not "
+                "keeping up."
+            )
+
+
+def run_aggregator():
+    """Aggregates the detections of the nodes until stopped."""
+    if config.machine_role != "master":
+        logging.warning(
+            f"Running the aggregator on a '{config.machine_role}' node, it's meant to "
+            "run on the master."
+        )
+
+    logging.info(
+        f"[Aggregator] Grouping detections within "
+        f"{config.aggregation_window_seconds:.2f} seconds."
+    )
+    aggregator = DetectionAggregator(zmq.Context())
+    aggregator.serve_forever()
@@ -6,21 +6,21 @@ import os
 import wave
 
 from datetime import datetime
-from typing import List, Optional, Tuple
-
-import pyaudio
+from typing import Iterator, List, Optional, Tuple
 
 import numpy as np
 
 from numpy.typing import NDArray
 
 from sound_detector.config import config
+from sound_detector.recordings_index import append_recording
+from sound_detector.sources import AudioSource
 
 import logging
 
 
-def record_audio(pyaudio_instance: pyaudio.PyAudio) -> Tuple[List[NDArray], bytes]:
-    """Records audio from microphone returning an array of frames.
+def record_audio(audio_source: AudioSource) -> Tuple[List[NDArray], bytes]:
+    """Records audio from the audio source returning an array of frames.
 
     The underlying neural network model is YAMNet and it has the following input
     requirements:
@@ -33,57 +33,53 @@ def record_audio(pyaudio_instance: pyaudio.PyAudio) -> Tuple[List[NDArray], byte
         values of which ranging [-1.0, 1.0] and the whole stripe binary audio as
         bytes.
     """
-    stream = pyaudio_instance.open(
-        format=config.audio_format,
-        channels=config.audio_channels,
-        rate=config.audio_rate,
-        input=True,
-        frames_per_buffer=config.audio_chunk,
+    pcm = np.empty(
+        config.audio_inference_batch_size * config.audio_inference_samples,
+        dtype=np.int16,
     )
 
-    waveforms: List[NDArray] = []
-    waveform_binary = b""
+    audio_source.start()
+    try:
+        audio_source.readinto(pcm)
+    finally:
+        audio_source.stop()
 
-    for _ in range(config.audio_inference_batch_size):
-        binary_frames = []
-        samples_processed = 0
-        while samples_processed < config.audio_inference_samples:
-            samples_to_read = max(
-                config.audio_chunk, config.audio_inference_samples - samples_processed
-            )
-            data = stream.read(samples_to_read)
-            binary_frames.append(data)
-            samples_processed += samples_to_read
+    waveform = (pcm / 32768).astype(np.float32)
+    waveforms = np.split(waveform, config.audio_inference_batch_size)
 
-        partial_waveform_binary = b"".join(binary_frames)
-        waveform = np.frombuffer(partial_waveform_binary, dtype=np.int16)
-        waveform = waveform / 32768
-        waveform = waveform.astype(np.float32)
+    return waveforms, pcm.tobytes()
 
-        waveforms.append(waveform)
-        waveform_binary += partial_waveform_binary
 
-    stream.stop_stream()
-    stream.close()
+def stream_audio(audio_source: AudioSource) -> Iterator[Tuple[NDArray, bytes]]:
+    """Records audio from the audio source continuously, one window at a time.
 
-    return waveforms, waveform_binary
+    Unlike `record_audio` the source is kept started, so no audio is lost between
+    windows as long as each one is processed in less than its duration.
 
+    Yields:
+        An array of shape (15600,) with values ranging [-1.0, 1.0] and the same window
+        as bytes.
+    """
+    audio_source.start()
+
+    try:
+        while True:
+            pcm = np.empty(config.audio_inference_samples, dtype=np.int16)
+            audio_source.readinto(pcm)
+            waveform = (pcm / 32768).astype(np.float32)
+            yield waveform, pcm.tobytes()
+    finally:
+        audio_source.stop()
 
-def write_audio(
-    pyaudio_instance: pyaudio.PyAudio, frames: bytes, suffix: Optional[str] = ""
-) -> str:
-    """Writes audio frames as bytes to a file.
+
+def recording_path(suffix: Optional[str] = "") -> str:
+    """Builds the path of a new recording on the detected recordings share.
 
     Args:
-        p: The PyAudio instance to use.
-        frames: The audio binary content to write.
         suffix: To suffix the resulting file with.
 
     Returns:
-        The filename where the .wav file is saved.
-
-    https://gist.github.com/kepler62f/9d5836a1eff8b372ddf6de43b5b74d95
-
+        E.g. '/recordings/2023/12/22/2023-12-22T17-05-52_knock.wav'.
     """
     if suffix:
         suffix = f"_{suffix}"
@@ -100,19 +96,49 @@ def write_audio(
     relative_file_path = os.path.join(year_month_day_folder, file_name)
 
     # E.g. '/recordings/2023/12/22/2023-12-10T17:05:52.578411_knock.wav'
-    absolute_file_path = os.path.join(
-        config.detected_recordings_dir, relative_file_path
-    )
+    return os.path.join(config.detected_recordings_dir, relative_file_path)
+
+
+def write_audio(
+    frames: bytes,
+    suffix: Optional[str] = "",
+    file_path: Optional[str] = None,
+) -> str:
+    """Writes audio frames as bytes to a file.
+
+    Args:
+        frames: The audio binary content to write.
+        suffix: To suffix the resulting file with.
+        file_path: Where to write it, by default a new path from `recording_path`.
+
+    Returns:
+        The filename where the .wav file is saved.
+
+    https://gist.github.com/kepler62f/9d5836a1eff8b372ddf6de43b5b74d95
+
+    """
+    absolute_file_path = file_path or recording_path(suffix)
 
     os.makedirs(os.path.dirname(absolute_file_path), exist_ok=True)
 
     wave_file = wave.open(absolute_file_path, "wb")
     wave_file.setnchannels(config.audio_channels)
-    wave_file.setsampwidth(pyaudio_instance.get_sample_size(pyaudio.paInt16))
+    wave_file.setsampwidth(config.audio_sample_width)
     wave_file.setframerate(config.audio_rate)
     wave_file.writeframes(frames)
     wave_file.close()
 
     logging.info(f"Saved sound to {absolute_file_path}.")
 
-    return absolute_file_path
\ No newline at end of file
+    if config.recordings_index:
+        duration = len(frames) / (
+            config.audio_rate * config.audio_channels * config.audio_sample_width
+        )
+        # The recording is saved either way, so the database entry and the
+        # notification that follow must not depend on the index.
+        try:
+            append_recording(absolute_file_path, duration)
+        except Exception:
+            logging.exception(f"Failed to index {absolute_file_path}.")
+
+    return absolute_file_path
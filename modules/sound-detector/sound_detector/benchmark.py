@@ -0,0 +1,283 @@
+"""
+Micro-benchmarks of the detector hot path with regression baselines.
+
+Every benchmark runs on synthetic audio. The `fake` variants replace the interpreters
+with fakes that return canned outputs, so they measure only our own code around the
+models (conversions, decision logic, bookkeeping). The `tflite` variants load the real
+TFLite models and are skipped when the model files are not there.
+
+Run them with `python main.py benchmark`, and store the results as the baseline to
+compare against with `python main.py benchmark --save-baseline` on the target board.
+"""
+
+import functools
+import json
+import logging
+import os
+import statistics
+import tempfile
+import time
+
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from sound_detector.audio import record_audio, write_audio
+from sound_detector.config import config
+from sound_detector.events import PlayEventsManager
+from sound_detector.inference import (
+    run_cascade_inference,
+    run_retrained_inference,
+    run_yamnet_inference,
+)
+from sound_detector.models.cascade import CascadeModel
+from sound_detector.models.retrained import RetrainedModel
+from sound_detector.models.yamnet import YAMNetModel
+from sound_detector.sources import AudioSource
+
+# Next to the tests so it's shipped with them in the Docker image.
+baseline_path = os.path.join(
+    os.path.dirname(__file__), "..", "tests", "benchmark-baseline.json"
+)
+
+# Benchmark name to the function to time (called without arguments).
+Benchmarks = Dict[str, Callable[[], object]]
+
+
+def synthetic_waveform(seed: int = 0) -> np.ndarray:
+    """A 0.975 s window of a 440 Hz tone with noise, as the microphone would give."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(config.audio_inference_samples) / config.audio_rate
+    waveform = 0.3 * np.sin(2 * np.pi * 440 * t) + 0.05 * rng.standard_normal(t.size)
+    return waveform.astype(np.float32)
+
+
+class FakeAudioSource(AudioSource):
+    """Stands in for the microphone, handing out canned audio."""
+
+    def __init__(self):
+        self.pcm = (synthetic_waveform() * 32767).astype(np.int16)
+
+    def readinto(self, buffer: np.ndarray) -> None:
+        buffer[:] = np.resize(self.pcm, len(buffer))
+
+
+class FakeYAMNetInterpreter:
+    """Mimics the parts of `tflite.Interpreter` that `YAMNetModel.predict` uses."""
+
+    def __init__(self, num_classes: int):
+        rng = np.random.default_rng(0)
+        self.scores = rng.random((1, num_classes), dtype=np.float32)
+
+    def get_input_details(self):
+        return [{"index": 0}]
+
+    def get_output_details(self):
+        return [{"index": 1}]
+
+    def set_tensor(self, index: int, value: np.ndarray):
+        pass
+
+    def invoke(self):
+        pass
+
+    def get_tensor(self, index: int) -> np.ndarray:
+        return self.scores
+
+
+class FakeRetrainedInterpreter:
+    """Mimics the signature runner of the retrained TFLite model."""
+
+    def get_signature_runner(self):
+        def run(audio):
+            return {"classifier": np.array([0.5], dtype=np.float32)}
+
+        return run
+
+
+def fake_yamnet_model() -> YAMNetModel:
+    class_names = [f"Class {i}" for i in range(521)]
+    class_names[:3] = ["Clip-clop", "Speech", "Silence"]
+
+    model = YAMNetModel()
+    model.model = FakeYAMNetInterpreter(len(class_names))
+    model.class_names = class_names
+    model.rebuild_label_masks()
+    model.initialized = True
+    return model
+
+
+def fake_retrained_model() -> RetrainedModel:
+    model = RetrainedModel()
+    model.model = FakeRetrainedInterpreter()
+    model.initialized = True
+    return model
+
+
+def fake_cascade_model() -> CascadeModel:
+    model = CascadeModel()
+    model.retrained_model = fake_retrained_model()
+    model.yamnet_model = fake_yamnet_model()
+    model.initialized = True
+    return model
+
+
+def fake_play_events_manager() -> PlayEventsManager:
+    # Skips `__init__`, which would connect to the distributor.
+    manager = object.__new__(PlayEventsManager)
+    manager.last_play_at = round(time.time())
+    manager.last_play_sound_duration = 5.0
+    manager.last_play_preroll_duration = 1.0
+    return manager
+
+
+def build_benchmarks(recordings_dir: str, real_tflite: bool = True) -> Benchmarks:
+    waveform = synthetic_waveform()
+    waveforms = [
+        synthetic_waveform(i) for i in range(config.audio_inference_batch_size)
+    ]
+    audio_source = FakeAudioSource()
+    _, waveform_binary = record_audio(audio_source)
+
+    yamnet_model = fake_yamnet_model()
+    retrained_model = fake_retrained_model()
+    cascade_model = fake_cascade_model()
+    play_events_manager = fake_play_events_manager()
+
+    def write_to_recordings_dir():
+        previous_dir = config.detected_recordings_dir
+        config.detected_recordings_dir = recordings_dir
+        try:
+            os.remove(write_audio(waveform_binary, suffix="bench"))
+        finally:
+            config.detected_recordings_dir = previous_dir
+
+    benchmarks: Benchmarks = {
+        "record_audio/fake": lambda: record_audio(audio_source),
+        "yamnet_predict/fake": lambda: yamnet_model.predict(waveform),
+        "retrained_predict/fake": lambda: retrained_model.predict(waveform),
+        "run_yamnet_inference/fake": lambda: run_yamnet_inference(
+            yamnet_model, waveforms
+        ),
+        "run_retrained_inference/fake": lambda: run_retrained_inference(
+            retrained_model, waveforms
+        ),
+        "run_cascade_inference/fake": lambda: run_cascade_inference(
+            cascade_model, waveforms
+        ),
+        "write_audio": write_to_recordings_dir,
+        "play_events_check": (
+            lambda: play_events_manager.has_been_recording_while_sound_was_playing()
+        ),
+    }
+
+    if real_tflite and config.use_tflite:
+        if os.path.exists(YAMNetModel.tflite_model_path):
+            real_yamnet_model = YAMNetModel()
+            real_yamnet_model.initialize()
+            benchmarks["yamnet_predict/tflite"] = lambda: real_yamnet_model.predict(
+                waveform
+            )
+        if os.path.exists(RetrainedModel.tflite_model_path):
+            real_retrained_model = RetrainedModel(variant="retrained")
+            real_retrained_model.initialize()
+            benchmarks["retrained_predict/tflite"] = functools.partial(
+                real_retrained_model.predict, waveform
+            )
+        if os.path.exists(RetrainedModel.distilled_tflite_model_path):
+            real_distilled_model = RetrainedModel(variant="distilled")
+            real_distilled_model.initialize()
+            benchmarks["distilled_predict/tflite"] = functools.partial(
+                real_distilled_model.predict, waveform
+            )
+
+    return benchmarks
+
+
+def time_benchmark(function: Callable[[], object], repeat: int) -> Dict[str, float]:
+    """Times the function and returns the median and the best time in microseconds."""
+    function()  # Warm up.
+
+    timings: List[float] = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started_at) * 1e6)
+
+    return {"median_us": statistics.median(timings), "min_us": min(timings)}
+
+
+def run_benchmarks(
+    repeat: int = 50, real_tflite: bool = True, names: Optional[List[str]] = None
+) -> Dict[str, Dict[str, float]]:
+    # The whole module logs at debug level from the hot path.
+    logging_level = logging.getLogger().level
+    logging.getLogger().setLevel(logging.WARNING)
+
+    try:
+        with tempfile.TemporaryDirectory() as recordings_dir:
+            benchmarks = build_benchmarks(recordings_dir, real_tflite=real_tflite)
+            return {
+                name: time_benchmark(function, repeat)
+                for name, function in benchmarks.items()
+                if not names or name in names
+            }
+    finally:
+        logging.getLogger().setLevel(logging_level)
+
+
+def load_baseline(path: str = baseline_path) -> Optional[Dict[str, Dict[str, float]]]:
+    if not os.path.exists(path):
+        return None
+
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_baseline(results: Dict[str, Dict[str, float]], path: str = baseline_path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def find_regressions(
+    results: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    tolerance: float,
+) -> List[str]:
+    """Names of the benchmarks whose median got slower than the baseline allows."""
+    return [
+        name
+        for name, result in results.items()
+        if name in baseline
+        and result["median_us"] > baseline[name]["median_us"] * (1 + tolerance)
+    ]
+
+
+def run(repeat: int, tolerance: float, save: bool, real_tflite: bool) -> bool:
+    """Runs the benchmarks, prints them against the baseline and optionally saves them.
+
+    Returns:
+        Whether there were no regressions.
+    """
+    results = run_benchmarks(repeat=repeat, real_tflite=real_tflite)
+    baseline = load_baseline() or {}
+
+    print(f"{'benchmark':<32} {'median (us)':>12} {'min (us)':>10} {'baseline':>10}")
+    for name, result in results.items():
+        baseline_median = baseline.get(name, {}).get("median_us")
+        baseline_str = f"{baseline_median:>10.1f}" if baseline_median else f"{'-':>10}"
+        print(
+            f"{name:<32} {result['median_us']:>12.1f} {result['min_us']:>10.1f} "
+            f"{baseline_str}"
+        )
+
+    regressions = find_regressions(results, baseline, tolerance)
+    for name in regressions:
+        logging.error(f"Regression in '{name}' over {tolerance:.0%} of the baseline.")
+
+    if save:
+        save_baseline(results)
+        logging.info(f"Saved baseline to {os.path.abspath(baseline_path)}.")
+
+    return not regressions
@@ -4,12 +4,24 @@ Configuration management from environment variables.
 
 import os
 import logging
+import tempfile
 
-import pyaudio
+from typing import Any, Callable, Dict, List, Optional
+
+from dotenv import dotenv_values
 from environs import Env
+from marshmallow.validate import OneOf, Regexp
+
+# Machine ids end up in the names of the recordings, `<timestamp>_<machine>_<class>`, so
+# they can't have underscores (see `sound_detector/recordings_index.py`).
+machine_id_pattern = r"^[A-Za-z0-9.-]+$"
+
+# The environment the process was started with, before any env file was read into it.
+_process_environ = dict(os.environ)
 
 env = Env()
-env.read_env()
+# The env file goes over the process environment, as it does on a reload.
+env.read_env(override=True)
 
 
 class _Config:
@@ -46,7 +58,14 @@ class _Config:
         )
 
         # Identifies the particular host that is running the inference.
-        self.machine_id = env.str("MACHINE_ID", "rpi")
+        self.machine_id = env.str(
+            "MACHINE_ID",
+            "rpi",
+            validate=Regexp(
+                machine_id_pattern,
+                error="MACHINE_ID can only have letters, digits, dots and dashes.",
+            ),
+        )
 
         # Whether it is a `master` or a `slave`.
         self.machine_role = env.str("MACHINE_ROLE", "slave")
@@ -71,6 +90,20 @@ class _Config:
                 "over NFS when running the inference mode!"
             )
 
+        # Sidecars. A few KB summary of each saved recording (waveform peaks, a log-mel
+        # thumbnail and the scores of its windows) is written next to it, so the
+        # journal can draw it without decoding the whole clip.
+        self.waveform_sidecars = env.bool("WAVEFORM_SIDECARS", True)
+        self.sidecar_peaks = env.int("SIDECAR_PEAKS", 400)
+        self.sidecar_mel_bands = env.int("SIDECAR_MEL_BANDS", 32)
+        self.sidecar_mel_frames = env.int("SIDECAR_MEL_FRAMES", 64)
+
+        # Recordings index. Each saved recording is also appended to a per-day binary
+        # index next to it, to find recordings by time, class or score without walking
+        # the share (see `sound_detector/recordings_index.py`). Appends are locked with
+        # `flock`, which needs the NFS lock service on the share.
+        self.recordings_index = env.bool("RECORDINGS_INDEX", False)
+
         # Influx DB settings.
         self.influx_db_host = env.str(
             "INFLUX_DB_HOST", required=(not self.skip_recording)
@@ -94,11 +127,38 @@ class _Config:
         self.zmq_distributor_push_addr = f"tcp://{self.playback_distributor_host}:5555"
         self.zmq_distributor_sub_addr = f"tcp://{self.playback_distributor_host}:5556"
 
-        # The "monitor" mode is useful for gathering sound data and see what
-        # categories are detected (unless it is in the `IGNORE_SOUNDS`). The
-        # "detection" mode is useful when you want to react against a specific
-        # category of sound.
-        self.stealth_mode = env.bool("STEALTH_MODE", False)
+        # How detections are sent to the distributor: `json` with only the path of the
+        # clip on the NFS share, or `binary` carrying the clip itself so it can be
+        # played before the share has it (see `sound_detector/messages.py`). The C
+        # playback distributor only understands `json`: `binary` needs a binary-aware
+        # receiver on port 5555.
+        self.detection_message_format = env.str(
+            "DETECTION_MESSAGE_FORMAT", "json", validate=OneOf(["json", "binary"])
+        )
+
+        # Detections queued for a slow or unreachable receiver before new ones are
+        # dropped, so the detector never blocks on sending. Set by default for the
+        # binary messages only: unless it's set, the JSON ones wait for the distributor
+        # to take them, as they always did.
+        self.detection_send_hwm: Optional[int] = env.int(
+            "DETECTION_SEND_HWM",
+            10 if self.detection_message_format == "binary" else None,
+        )
+
+        # Thin-edge mode. Weak nodes (e.g. Pi Zero slaves) can stream the recorded
+        # windows to an inference server running on a stronger node (usually the
+        # master) instead of running the models locally. The server gathers the
+        # requests from all the nodes and answers back with the scores.
+        self.remote_inference = env.bool("REMOTE_INFERENCE", False)
+        self.inference_server_host = env.str(
+            "INFERENCE_SERVER_HOST", self.playback_distributor_host
+        )
+        self.zmq_inference_server_addr = f"tcp://{self.inference_server_host}:5557"
+        self.zmq_inference_server_bind_addr = "tcp://*:5557"
+
+        # Seconds a node waits for the inference server to answer before treating the
+        # window as a miss.
+        self.remote_inference_timeout = env.float("REMOTE_INFERENCE_TIMEOUT", 2.0)
 
         # Use the retrained model (we used transference learning to binary classify high
         # heel sounds) or use YAMNet as is to identify certain sound occurrences.
@@ -107,20 +167,58 @@ class _Config:
         if self.use_retrained_model:
             self.retrained_model_path = env.str("RETRAINED_MODEL_PATH", required=True)
 
-        if self.use_retrained_model:
-            self.retrained_model_output_threshold = env.float(
-                "RETRAINED_MODEL_OUTPUT_THRESHOLD", required=True
-            )
-        else:
-            self.multiclass_detection_threshold = env.float(
-                "MULTICLASS_DETECTION_THRESHOLD", 0.3
-            )
-            self.multiclass_detect_sounds = env.list("MULTICLASS_DETECT_SOUNDS", [])
-            self.multiclass_ignore_sounds = []
-            with open("./.multiclass-ignore-sounds", "r") as f:
-                self.multiclass_ignore_sounds = f.read().splitlines()
+        # The model file run as the retrained model: "retrained" (YAMNet with the
+        # trained head) or "distilled" (the small student trained from it with
+        # `python main.py retrain --distill`, which doesn't run YAMNet).
+        self.retrained_model_variant = env.str(
+            "RETRAINED_MODEL_VARIANT",
+            "retrained",
+            validate=OneOf(["retrained", "distilled"]),
+        )
+
+        # Cascade the retrained model with YAMNet multiclass: the high-heel score is
+        # computed first and only windows whose score is uncertain (between
+        # `CASCADE_UNCERTAINTY_LOW` and `CASCADE_UNCERTAINTY_HIGH`) are ranked and
+        # labelled by YAMNet. Requires `USE_RETRAINED_MODEL`.
+        self.cascade_inference = self.use_retrained_model and env.bool(
+            "CASCADE_INFERENCE", False
+        )
+
+        # Live reload. The settings read in `_read_tunable_settings` can be changed
+        # while running, without reloading the models, by editing the env file or the
+        # ignore sounds file (they are watched every `CONFIG_RELOAD_POLL_SECONDS`) or by
+        # sending a SIGHUP to the process.
+        self.config_reload_env_file = env.str("CONFIG_RELOAD_ENV_FILE", "./.env")
+        self.config_reload_poll_seconds = env.float("CONFIG_RELOAD_POLL_SECONDS", 5.0)
+        self.multiclass_ignore_sounds_path = os.path.join(
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            ".multiclass-ignore-sounds",
+        )
+
+        # Model hot swap. The TFLite model files are watched every
+        # `MODEL_HOT_SWAP_POLL_SECONDS` and, when one changes (e.g. after a retrain),
+        # the new model is loaded and validated in the background and swapped in
+        # between recordings, without restarting the detector.
+        self.model_hot_swap = env.bool("MODEL_HOT_SWAP", True)
+        self.model_hot_swap_poll_seconds = env.float(
+            "MODEL_HOT_SWAP_POLL_SECONDS", 10.0
+        )
 
-        self.audio_format = pyaudio.paInt16
+        # Incremented on every reload that changes a setting.
+        self.version = 0
+        # Variables the env files set, to unset those removed from it on a reload.
+        self._env_file_keys = {
+            k for k, v in os.environ.items() if _process_environ.get(k) != v
+        }
+        self._reload_listeners: List[Callable[[], None]] = []
+
+        self.__dict__.update(self._read_tunable_settings())
+
+        # Where to record audio from, see `sound_detector/sources.py`.
+        self.audio_source = env.str("AUDIO_SOURCE", "pyaudio")
+
+        # 16-bit samples.
+        self.audio_sample_width = 2
         self.audio_channels = 1
         self.audio_rate = 16000
         self.audio_chunk = 1024
@@ -140,10 +238,222 @@ class _Config:
 
         self.audio_inference_batch_size = 5
 
+        # Decide on every window as soon as it's recorded instead of waiting for the
+        # whole batch, which shortens the detection latency to about one window. The
+        # batch size is then only used for the length of the saved clips.
+        self.streaming_decisions = env.bool("STREAMING_DECISIONS", False)
+
+        # Detection aggregation. Several nodes often hear the same event. With
+        # `DETECTION_AGGREGATION` the nodes send their detections, clip included, to
+        # the aggregator on the master (`python main.py aggregator`) instead of saving
+        # and notifying them. It groups the detections arriving within
+        # `AGGREGATION_WINDOW_SECONDS` of the first one of an event and only saves,
+        # writes to the database and notifies the best scoring one. By default the
+        # window spans the delay a node can add by deciding at the end of a batch.
+        self.detection_aggregation = env.bool("DETECTION_AGGREGATION", False)
+        self.aggregator_host = env.str(
+            "AGGREGATOR_HOST", self.playback_distributor_host
+        )
+        self.zmq_aggregator_addr = f"tcp://{self.aggregator_host}:5559"
+        self.zmq_aggregator_bind_addr = "tcp://*:5559"
+        self.aggregation_window_seconds = env.float(
+            "AGGREGATION_WINDOW_SECONDS",
+            self.audio_inference_seconds
+            * (1 if self.streaming_decisions else self.audio_inference_batch_size)
+            + 0.5,
+        )
+
+        # Model weights sharing. TFLite memory-maps the model files read-only, so every
+        # process loading the same file shares its pages. When several containers run
+        # on the same board, `MODEL_SHARED_MEMORY_DIR` (e.g. `/dev/shm/taconez-models`
+        # with `--ipc=host`) makes the first process publish the model files there so
+        # all containers map the very same pages. XNNPACK repacks the weights into
+        # private memory, so disable it with `TFLITE_XNNPACK=0` to share them at the
+        # cost of slower inference.
+        self.model_shared_memory_dir = env.str("MODEL_SHARED_MEMORY_DIR", "")
+        # Otherwise the copies every model is mapped from, rather than the model file
+        # itself (see `sound_detector/models/shared.py`), go here.
+        self.model_copy_dir = env.str(
+            "MODEL_COPY_DIR", os.path.join(tempfile.gettempdir(), "taconez-models")
+        )
+        # Copies of each model kept when a new one is published, the rest are deleted
+        # (processes still mapping them keep their pages until they swap).
+        self.model_copies_to_keep = env.int("MODEL_COPIES_TO_KEEP", 3)
+        self.tflite_xnnpack = env.bool("TFLITE_XNNPACK", True)
+
+        # Load shedding. When inference can't keep up with real time (the real-time
+        # factor, processing time divided by audio time, goes over the high mark) or
+        # the board is too hot, fewer windows of each batch are analyzed. The level
+        # recovers once the real-time factor goes under the low mark again.
+        self.load_shedding = env.bool("LOAD_SHEDDING", True)
+        self.load_shedding_high_rtf = env.float("LOAD_SHEDDING_HIGH_RTF", 0.8)
+        self.load_shedding_low_rtf = env.float("LOAD_SHEDDING_LOW_RTF", 0.4)
+        self.load_shedding_max_temperature = env.float(
+            "LOAD_SHEDDING_MAX_TEMPERATURE", 75.0
+        )
+        self.load_shedding_silence_rms = env.float("LOAD_SHEDDING_SILENCE_RMS", 0.01)
+        self.thermal_zone_path = "/sys/class/thermal/thermal_zone0/temp"
+
+        # Profiling hooks for diagnosing memory creep and latency spikes in the field.
+        # Every `PROFILING_SAMPLE_EVERY` cycles one is run under the profiler, every
+        # `PROFILING_SNAPSHOT_SECONDS` the allocations are compared against the previous
+        # snapshot, and the number of allocated blocks is tracked per cycle. Only the
+        # latest `PROFILING_MAX_FILES` files of each kind are kept in `PROFILING_DIR`.
+        self.profiling = env.bool("PROFILING", False)
+        self.profiling_dir = env.str("PROFILING_DIR", "/tmp/sound-detector-profiles")
+        self.profiling_sample_every = env.int("PROFILING_SAMPLE_EVERY", 100)
+        self.profiling_snapshot_seconds = env.float("PROFILING_SNAPSHOT_SECONDS", 600.0)
+        self.profiling_traceback_frames = env.int("PROFILING_TRACEBACK_FRAMES", 1)
+        self.profiling_max_files = env.int("PROFILING_MAX_FILES", 20)
+
+        # Control server. A local HTTP endpoint of the running detector returning its
+        # live stats and taking commands, e.g. pausing the recording (see
+        # `sound_detector/control.py`).
+        self.control_server = env.bool("CONTROL_SERVER", False)
+        self.control_server_host = env.str("CONTROL_SERVER_HOST", "127.0.0.1")
+        self.control_server_port = env.int("CONTROL_SERVER_PORT", 5560)
+
+        # Window log. Records the scores and top YAMNet classes of every analyzed
+        # window in compact binary files, e.g. to monitor or gather data in stealth
+        # mode (see `sound_detector/window_log.py`).
+        self.window_log = env.bool("WINDOW_LOG", False)
+        self.window_log_dir = env.str(
+            "WINDOW_LOG_DIR", os.path.join(self.detected_recordings_dir, "window-log")
+        )
+        self.window_log_top_k = env.int("WINDOW_LOG_TOP_K", 5)
+        self.window_log_batch_size = env.int("WINDOW_LOG_BATCH_SIZE", 256)
+        self.window_log_flush_seconds = env.float("WINDOW_LOG_FLUSH_SECONDS", 30.0)
+        self.window_log_max_bytes = env.int("WINDOW_LOG_MAX_BYTES", 64 * 1024 * 1024)
+
+        # Score rollups. Instead of writing a point per analyzed window, the scores
+        # are aggregated in memory (count, max, mean and histogram) and written to
+        # Influx DB as a single point every `SCORE_ROLLUP_INTERVAL` seconds. Useful for
+        # tuning the detection thresholds by seeing the near misses.
+        self.score_rollups = env.bool("SCORE_ROLLUPS", True)
+        self.score_rollup_interval = env.float("SCORE_ROLLUP_INTERVAL", 60.0)
+
+        # Upper edges of the histogram buckets. The retrained model outputs
+        # unnormalized scores (logits) while YAMNet outputs scores in [0, 1].
+        self.score_rollup_buckets = [
+            float(edge)
+            for edge in env.list(
+                "SCORE_ROLLUP_BUCKETS",
+                [-5.0, 0.0, 2.5, 5.0, 7.5, 10.0]
+                if self.use_retrained_model
+                else [0.1, 0.2, 0.3, 0.5, 0.7, 0.9],
+            )
+        ]
+
+        # How many of the most frequent top YAMNet classes get their own fields.
+        self.score_rollup_top_classes = env.int("SCORE_ROLLUP_TOP_CLASSES", 10)
+
+    def _read_tunable_settings(self) -> Dict[str, Any]:
+        """Reads the settings that can be changed while running."""
+        settings: Dict[str, Any] = {}
+
+        # The "monitor" mode is useful for gathering sound data and see what
+        # categories are detected (unless it is in the `IGNORE_SOUNDS`). The
+        # "detection" mode is useful when you want to react against a specific
+        # category of sound.
+        settings["stealth_mode"] = env.bool("STEALTH_MODE", False)
+
+        if self.use_retrained_model:
+            settings["retrained_model_output_threshold"] = env.float(
+                "RETRAINED_MODEL_OUTPUT_THRESHOLD", required=True
+            )
+
+            # Cascade mode. Windows scored by the retrained model between these bounds
+            # are considered uncertain and also analyzed by YAMNet multiclass.
+            settings["cascade_uncertainty_low"] = env.float(
+                "CASCADE_UNCERTAINTY_LOW",
+                settings["retrained_model_output_threshold"] - 2.0,
+            )
+            settings["cascade_uncertainty_high"] = env.float(
+                "CASCADE_UNCERTAINTY_HIGH",
+                settings["retrained_model_output_threshold"] + 2.0,
+            )
+
+        # The multiclass settings are read with the retrained model too, since they
+        # all have defaults.
+        settings["multiclass_detection_threshold"] = env.float(
+            "MULTICLASS_DETECTION_THRESHOLD", 0.3
+        )
+        settings["multiclass_detect_sounds"] = env.list("MULTICLASS_DETECT_SOUNDS", [])
+        settings["multiclass_ignore_sounds"] = []
+        if os.path.exists(self.multiclass_ignore_sounds_path):
+            with open(self.multiclass_ignore_sounds_path, "r") as f:
+                settings["multiclass_ignore_sounds"] = f.read().splitlines()
+
+        return settings
+
+    def reload(self) -> bool:
+        """Re-reads the runtime-tunable settings and swaps them in all at once.
+
+        The env file at `CONFIG_RELOAD_ENV_FILE` (if any) overrides the environment
+        variables the process was started with, since the environment of a running
+        process can't be changed from the outside. If the new settings are invalid the
+        current ones are kept.
+
+        Returns:
+            Whether the settings were reloaded, i.e. valid and changed.
+        """
+        self._apply_env_file()
+
+        try:
+            settings = self._read_tunable_settings()
+        except Exception:
+            logging.exception("Invalid settings, keeping the current ones.")
+            return False
+
+        changes = {k: v for k, v in settings.items() if getattr(self, k, None) != v}
+        if not changes:
+            logging.debug("Settings unchanged, nothing to reload.")
+            return False
+
+        # A single `dict.update` so readers never see half of the new settings.
+        self.__dict__.update(settings)
+        self.version += 1
+
+        logging.info(f"Reloaded settings (version {self.version}): {changes}")
+
+        for listener in self._reload_listeners:
+            listener()
+
+        return True
+
+    def _apply_env_file(self):
+        """Sets the environment to the process one with the env file over it.
+
+        The file is parsed afresh, so a variable removed from it goes back to the value
+        the process was started with, or is unset, instead of keeping the old one.
+        """
+        file_values = {}
+        if os.path.exists(self.config_reload_env_file):
+            file_values = {
+                k: v
+                for k, v in dotenv_values(self.config_reload_env_file).items()
+                if v is not None
+            }
+
+        for key in self._env_file_keys - file_values.keys():
+            if key in _process_environ:
+                os.environ[key] = _process_environ[key]
+            else:
+                os.environ.pop(key, None)
+
+        os.environ.update(file_values)
+        self._env_file_keys = set(file_values)
+
+    def add_reload_listener(self, listener: Callable[[], None]):
+        """Registers a function to call after the settings are reloaded."""
+        self._reload_listeners.append(listener)
+
     def print_config(self):
         # Print the value of each class attribute to see the configuration values:
         print("Configuration:")
         for k, v in self.__dict__.items():
+            if k.startswith("_"):
+                continue
             print(f"\t{k}: {v}")
 
 
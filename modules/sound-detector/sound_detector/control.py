@@ -0,0 +1,289 @@
+"""
+Local control and stats endpoint of a running detector.
+
+With `CONTROL_SERVER` an HTTP server listens on `CONTROL_SERVER_HOST` (localhost by
+default) at `CONTROL_SERVER_PORT`:
+
+- `GET /stats`: Live stats as JSON: windows recorded and analyzed, inference latency
+  percentiles, detections, the last play event, queue depths and model versions.
+- `POST /stealth`: Toggles stealth mode, or sets it with a `{"enabled": true}` body.
+  Until the next settings reload, which reads `STEALTH_MODE` again.
+- `POST /pause` and `POST /resume`: Stops and restarts recording.
+- `POST /profile`: Runs the next cycle under the profiler (requires `PROFILING`).
+
+    curl localhost:5560/stats
+    curl -X POST localhost:5560/pause
+
+The server runs in its own threads. The loop only updates a few counters per cycle and
+the commands are queued and carried out by the loop between cycles, like the settings
+reloads, so nothing changes while a batch is being analyzed.
+"""
+
+import json
+import logging
+import queue
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from sound_detector.config import config
+from sound_detector.events import PlayEventsManager
+from sound_detector.load import LoadShedder
+from sound_detector.memory import process_memory
+from sound_detector.models.hotswap import ModelWatcher
+from sound_detector.profiling import Profiler
+from sound_detector.sources import AudioSource
+from sound_detector.window_log import WindowLog
+
+
+class DetectorStats:
+    """Counters the loop updates, cheap enough to do on every cycle.
+
+    They are read from the server threads without locking: a reading might be a cycle
+    behind, which is fine for monitoring.
+    """
+
+    # Cycles whose latency is kept for the percentiles.
+    latency_samples = 1024
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.windows_recorded = 0
+        self.windows_analyzed = 0
+        self.windows_skipped = 0
+        self.detections = 0
+        self.last_detection: Optional[Dict[str, Any]] = None
+
+        # Seconds per analyzed window of the last cycles, as a ring buffer.
+        self.window_latencies = np.zeros(self.latency_samples)
+        self.num_cycles = 0
+
+    def add_recorded(self, num_windows: int):
+        self.windows_recorded += num_windows
+
+    def add_skipped(self, num_windows: int):
+        self.windows_skipped += num_windows
+
+    def add_analyzed(self, num_windows: int, seconds: float):
+        self.windows_analyzed += num_windows
+        if num_windows:
+            self.window_latencies[self.num_cycles % self.latency_samples] = (
+                seconds / num_windows
+            )
+            self.num_cycles += 1
+
+    def add_detection(self, score: float, class_slug: str):
+        self.detections += 1
+        self.last_detection = {
+            "at": time.time(),
+            "score": float(score),
+            "class": class_slug,
+        }
+
+    def latency_percentiles(self) -> Dict[str, float]:
+        """Percentiles in milliseconds of the latency per window of the last cycles."""
+        latencies = self.window_latencies[: min(self.num_cycles, self.latency_samples)]
+        if not len(latencies):
+            return {}
+
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+        return {
+            "p50": round(float(p50), 3),
+            "p95": round(float(p95), 3),
+            "p99": round(float(p99), 3),
+            "max": round(float(latencies.max()) * 1000, 3),
+        }
+
+
+class ControlServer:
+    """Serves the stats and queues the commands for the loop to carry out.
+
+    The loop calls `run_pending_commands` between cycles, which blocks while paused.
+    """
+
+    def __init__(
+        self,
+        detector_stats: DetectorStats,
+        model: Any,
+        audio_source: AudioSource,
+        play_events_manager: Optional[PlayEventsManager] = None,
+        model_watcher: Optional[ModelWatcher] = None,
+        load_shedder: Optional[LoadShedder] = None,
+        profiler: Optional[Profiler] = None,
+        window_log: Optional[WindowLog] = None,
+    ):
+        self.detector_stats = detector_stats
+        self.model = model
+        self.audio_source = audio_source
+        self.play_events_manager = play_events_manager
+        self.model_watcher = model_watcher
+        self.load_shedder = load_shedder
+        self.profiler = profiler
+        self.window_log = window_log
+
+        self.paused = False
+        self.commands: queue.Queue = queue.Queue()
+
+        address = (config.control_server_host, config.control_server_port)
+        self.http_server = ThreadingHTTPServer(address, self._make_handler())
+        self.http_server.daemon_threads = True
+        self.thread = threading.Thread(
+            target=self.http_server.serve_forever, daemon=True
+        )
+
+    def start(self):
+        self.thread.start()
+        host, port = self.http_server.server_address[:2]
+        logging.info(f"[ControlServer] Listening on http://{host}:{port}.")
+
+    def stop(self):
+        self.http_server.shutdown()
+        self.http_server.server_close()
+
+    def run_pending_commands(self, keep_started: bool = False):
+        """Carries out the commands received since the last call, waiting while paused.
+
+        Args:
+            keep_started: Whether the loop keeps the audio source started between
+                cycles (when streaming), so it has to be stopped while paused.
+        """
+        while self.paused or not self.commands.empty():
+            command, argument = self.commands.get()
+
+            if command == "pause" and not self.paused:
+                self.paused = True
+                if keep_started:
+                    self.audio_source.stop()
+                logging.info("[ControlServer] Recording paused.")
+            elif command == "resume" and self.paused:
+                self.paused = False
+                if keep_started:
+                    self.audio_source.start()
+                logging.info("[ControlServer] Recording resumed.")
+            elif command == "stealth":
+                config.stealth_mode = argument
+                logging.info(f"[ControlServer] Stealth mode set to {argument}.")
+            elif command == "profile":
+                self.profiler.profile_next_cycle()
+                logging.info("[ControlServer] Profiling the next cycle.")
+
+    def stats(self) -> Dict[str, Any]:
+        detector_stats = self.detector_stats
+        stats: Dict[str, Any] = {
+            "machine_id": config.machine_id,
+            "uptime_seconds": round(time.time() - detector_stats.started_at, 1),
+            "paused": self.paused,
+            "stealth_mode": config.stealth_mode,
+            "windows": {
+                "recorded": detector_stats.windows_recorded,
+                "analyzed": detector_stats.windows_analyzed,
+                "skipped": detector_stats.windows_skipped,
+            },
+            "window_latency_ms": detector_stats.latency_percentiles(),
+            "detections": detector_stats.detections,
+            "last_detection": detector_stats.last_detection,
+            "last_play_event": (
+                self.play_events_manager.last_play_event
+                if self.play_events_manager
+                else None
+            ),
+            "queues": {
+                "pending_commands": self.commands.qsize(),
+                "window_log_batches": (
+                    self.window_log.batches.qsize() if self.window_log else None
+                ),
+                "background_threads": threading.active_count(),
+            },
+            "model": {
+                "class": type(self.model).__name__,
+                "variant": (
+                    config.retrained_model_variant
+                    if config.use_retrained_model
+                    else None
+                ),
+                "hot_swap_version": (
+                    self.model_watcher.version if self.model_watcher else 0
+                ),
+                "config_version": config.version,
+            },
+            "memory": process_memory(),
+        }
+
+        capture_stats = self.audio_source.capture_stats
+        if capture_stats:
+            stats["capture"] = {
+                "overruns": capture_stats.total_overruns,
+                "dropped_samples": capture_stats.total_dropped_samples,
+            }
+
+        if self.load_shedder:
+            stats["load"] = {
+                "level": self.load_shedder.level,
+                "rtf": self.load_shedder.rtf,
+                "temperature": self.load_shedder.temperature,
+            }
+
+        return stats
+
+    def handle_command(self, command: str, body: Dict[str, Any]) -> Tuple[int, Dict]:
+        """Queues a command, returning the HTTP status and the response."""
+        if command in ("pause", "resume"):
+            self.commands.put((command, None))
+            return 202, {"requested": command}
+
+        if command == "stealth":
+            enabled = body.get("enabled", not config.stealth_mode)
+            if not isinstance(enabled, bool):
+                return 400, {"error": "`enabled` must be a boolean."}
+            self.commands.put((command, enabled))
+            return 202, {"requested": command, "stealth_mode": enabled}
+
+        if command == "profile":
+            if not self.profiler:
+                return 409, {"error": "Profiling is off, enable it with `PROFILING`."}
+            self.commands.put((command, None))
+            return 202, {"requested": command, "profiling_dir": config.profiling_dir}
+
+        return 404, {"error": f"Unknown command '{command}'."}
+
+    def _make_handler(self):
+        control_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") == "/stats":
+                    self._respond(200, control_server.stats())
+                else:
+                    self._respond(404, {"error": f"Unknown path '{self.path}'."})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    self._respond(400, {"error": "The body is not valid JSON."})
+                    return
+                if not isinstance(body, dict):
+                    body = {}
+
+                status, response = control_server.handle_command(
+                    self.path.strip("/"), body
+                )
+                self._respond(status, response)
+
+            def _respond(self, status: int, response: Dict[str, Any]):
+                content = json.dumps(response).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                logging.debug("[ControlServer] " + format, *args)
+
+        return Handler
@@ -2,6 +2,8 @@
 Database operations.
 """
 
+from typing import Dict, List, Optional
+
 import influxdb_client
 
 from influxdb_client.client.write_api import SYNCHRONOUS
@@ -9,13 +11,21 @@ from influxdb_client.client.write_api import SYNCHRONOUS
 from sound_detector.config import config
 
 
-def write_db_entry(detected_class_slug: str, score: float, relative_sound_path: str):
+def write_db_entry(
+    detected_class_slug: str,
+    score: float,
+    relative_sound_path: str,
+    detected_by: Optional[str] = None,
+    heard_by: Optional[List[str]] = None,
+):
     """Writes the sound occurrence to the Influx DB store.
 
     Args:
         detected_class_slug (str): The slug of the detected sound class.
         score (float): The prediction for that class, the higher the more confident.
         relative_sound_path (str): The relative path to the sound file.
+        detected_by (str): The machine whose clip was kept, by default this one.
+        heard_by (list): For aggregated detections, every machine that detected it.
     """
     client = influxdb_client.InfluxDBClient(
         url=config.influx_db_addr, org="taconez", token=config.influx_db_token
@@ -25,8 +35,57 @@ def write_db_entry(detected_class_slug: str, score: float, relative_sound_path:
     p = (
         influxdb_client.Point("detections")
         .tag("sound", detected_class_slug)
-        .tag("detected_by", config.machine_id)
+        .tag("detected_by", detected_by or config.machine_id)
         .field("score", score)
         .field("audio_file_path", relative_sound_path)
     )
-    write_api.write(bucket="taconez", org="taconez", record=p)
\ No newline at end of file
+    if heard_by is not None:
+        p = p.field("heard_by", ",".join(heard_by)).field("num_nodes", len(heard_by))
+    write_api.write(bucket="taconez", org="taconez", record=p)
+
+
+def write_load_entry(level: int, rtf: float, temperature: Optional[float]):
+    """Writes the load shedding degradation level to the Influx DB store.
+
+    Only written when the level changes, so it's cheap to keep it enabled.
+
+    Args:
+        level (int): The degradation level (see `sound_detector.load.LoadShedder`).
+        rtf (float): The smoothed real-time factor of the inference.
+        temperature (float): The SoC temperature in Celsius, if available.
+    """
+    client = influxdb_client.InfluxDBClient(
+        url=config.influx_db_addr, org="taconez", token=config.influx_db_token
+    )
+
+    write_api = client.write_api(write_options=SYNCHRONOUS)
+    p = (
+        influxdb_client.Point("load")
+        .tag("detected_by", config.machine_id)
+        .field("level", level)
+        .field("rtf", rtf)
+    )
+    if temperature is not None:
+        p = p.field("temperature", temperature)
+    write_api.write(bucket="taconez", org="taconez", record=p)
+
+
+def write_rollup_entry(fields: Dict[str, float]):
+    """Writes a score rollup to the Influx DB store.
+
+    Args:
+        fields (dict): The aggregated fields (see `sound_detector.rollups.ScoreRollup`).
+    """
+    client = influxdb_client.InfluxDBClient(
+        url=config.influx_db_addr, org="taconez", token=config.influx_db_token
+    )
+
+    write_api = client.write_api(write_options=SYNCHRONOUS)
+    p = (
+        influxdb_client.Point("score_rollups")
+        .tag("detected_by", config.machine_id)
+        .tag("model", "retrained" if config.use_retrained_model else "yamnet")
+    )
+    for name, value in fields.items():
+        p = p.field(name, value)
+    write_api.write(bucket="taconez", org="taconez", record=p)
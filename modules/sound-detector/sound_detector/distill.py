@@ -0,0 +1,286 @@
+"""
+Distillation of the retrained model into a small log-mel CNN that skips YAMNet.
+
+The retrained model runs the whole of YAMNet on every window only to feed its embeddings
+to a small head. The student (`sound_detector/models/distilled.py`) computes its own
+log-mel spectrogram and runs three small convolutions on it instead, around a tenth of
+the multiply-adds, and is trained to reproduce the retrained model (the teacher):
+
+- Both see the windows the detector would see, cut from the recordings of `dataset/`
+  every half window.
+- The student learns from a blend of the label of the recording and the probability
+  the teacher gives the window, softened by `temperature`, which tells it which windows
+  of a recording actually sound like heels.
+- The recordings are split in folds like in the sweep. One fold (validation) decides
+  when to stop training and the student's threshold, and another (test) is left
+  untouched to compare both models on it. The teacher was trained on every recording,
+  so its numbers there are optimistic.
+
+The student is saved next to the retrained model as `custom/distilled.tflite`, with a
+report of its latency, size, memory and accuracy against the teacher in
+`custom/distilled-report.json`. It runs in the detector with
+`RETRAINED_MODEL_VARIANT=distilled` and the threshold the report recommends.
+"""
+
+import json
+import logging
+import os
+import shutil
+import time
+
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from numpy.typing import NDArray
+
+from sound_detector.config import config
+from sound_detector.memory import process_memory
+from sound_detector.models.distilled import build_student
+from sound_detector.models.retrained import (
+    RetrainedModel,
+    dataset_dirs,
+    load_wav_16k_mono,
+)
+from sound_detector.sweep import assign_folds, best_threshold
+
+report_path = os.path.join(
+    os.path.dirname(RetrainedModel.saved_model_path), "distilled-report.json"
+)
+
+temperature = 2.0
+# Weight of the label of the recording in the targets, the rest is the teacher's.
+label_weight = 0.5
+
+num_folds = 5
+test_fold = 0
+validation_fold = 1
+max_epochs = 50
+
+# Invocations timed per model for the report.
+latency_runs = 200
+
+
+def cut_windows(waveform: NDArray, window_size: int) -> NDArray:
+    """Windows of `window_size` samples every half window, zero padding the last one."""
+    hop = window_size // 2
+    num_windows = 1 + max(0, len(waveform) - window_size + hop - 1) // hop
+    padded = np.pad(
+        waveform, (0, (num_windows - 1) * hop + window_size - len(waveform))
+    )
+    return np.lib.stride_tricks.sliding_window_view(padded, window_size)[::hop]
+
+
+def soft_targets(teacher_scores: NDArray, labels: NDArray) -> NDArray:
+    """Blends the labels with the teacher's probabilities softened by `temperature`."""
+    teacher_probabilities = 1 / (1 + np.exp(-teacher_scores / temperature))
+    return (label_weight * labels + (1 - label_weight) * teacher_probabilities).astype(
+        np.float32
+    )
+
+
+def load_windows() -> Tuple[NDArray, NDArray, NDArray]:
+    """Cuts every file of the dataset in windows.
+
+    Returns:
+        The windows of shape (N, samples), their labels (1 for high heels) and the index
+        of the file each one comes from.
+    """
+    import tensorflow as tf
+
+    windows: List[NDArray] = []
+    labels: List[NDArray] = []
+    file_indices: List[NDArray] = []
+
+    file_index = 0
+    for label, dataset_dir in dataset_dirs.items():
+        for file_path in sorted(tf.io.gfile.glob(f"{dataset_dir}/*.wav")):
+            file_windows = cut_windows(
+                load_wav_16k_mono(file_path).numpy(), config.audio_inference_samples
+            )
+            windows.append(file_windows)
+            labels.append(np.full(len(file_windows), label, dtype=np.float32))
+            file_indices.append(np.full(len(file_windows), file_index))
+            file_index += 1
+
+    logging.info(f"Cut {file_index} files in {sum(map(len, windows))} windows.")
+
+    return (
+        np.concatenate(windows).astype(np.float32),
+        np.concatenate(labels),
+        np.concatenate(file_indices),
+    )
+
+
+def split_folds(
+    labels: NDArray, file_indices: NDArray
+) -> Tuple[NDArray, NDArray, NDArray]:
+    """Splits the windows, keeping the ones of each recording together.
+
+    Returns:
+        The masks of the training, validation and test windows.
+    """
+    folds = assign_folds(labels, file_indices, num_folds)
+    test = folds == test_fold
+    validation = folds == validation_fold
+    return ~(test | validation), validation, test
+
+
+def teacher_scores(windows: NDArray) -> NDArray:
+    teacher = RetrainedModel(variant="retrained")
+    teacher.initialize()
+    return np.array(
+        [float(teacher.predict(window)) for window in windows], dtype=np.float32
+    )
+
+
+def save_student(serving_model):
+    """Saves a 'saved_model' and a 'tflite' model for the distilled model."""
+    import tensorflow as tf
+
+    saved_model_path = RetrainedModel.distilled_saved_model_path
+    tflite_model_path = RetrainedModel.distilled_tflite_model_path
+
+    if os.path.exists(saved_model_path):
+        shutil.rmtree(saved_model_path)
+
+    serving_model.save(saved_model_path, include_optimizer=False)
+
+    converter = tf.lite.TFLiteConverter.from_saved_model(saved_model_path)
+    tflite_model = converter.convert()
+
+    # Written aside and renamed so a detector hot swapping it never reads half a file.
+    with open(f"{tflite_model_path}.tmp", "wb") as f:
+        f.write(tflite_model)
+    os.replace(f"{tflite_model_path}.tmp", tflite_model_path)
+
+
+def measure_tflite(model_path: str, windows: NDArray) -> Tuple[Dict[str, Any], NDArray]:
+    """Scores the windows with a TFLite model, timing it and measuring its memory.
+
+    Returns:
+        The measurements and the score of every window.
+    """
+    import tensorflow as tf
+
+    rss_before = process_memory().get("rss", 0)
+
+    interpreter = tf.lite.Interpreter(model_path=model_path)
+    runner = interpreter.get_signature_runner()
+    scores = np.array(
+        [runner(audio=window)["classifier"][0] for window in windows], dtype=np.float32
+    )
+
+    latencies = []
+    for window in windows[:latency_runs]:
+        started_at = time.perf_counter()
+        runner(audio=window)
+        latencies.append(time.perf_counter() - started_at)
+
+    p50, p95 = np.percentile(latencies, [50, 95]) * 1000
+    measurements = {
+        "file_bytes": os.path.getsize(model_path),
+        # Approximate: what the process grew loading and running the model.
+        "rss_growth_bytes": process_memory().get("rss", 0) - rss_before,
+        "latency_ms_p50": round(float(p50), 3),
+        "latency_ms_p95": round(float(p95), 3),
+    }
+    return measurements, scores
+
+
+def classification_metrics(
+    scores: NDArray, labels: NDArray, threshold: float
+) -> Dict[str, float]:
+    predicted = scores > threshold
+    true_positives = float(np.sum(predicted & (labels == 1)))
+    precision = true_positives / max(float(predicted.sum()), 1)
+    recall = true_positives / max(float(labels.sum()), 1)
+    f1 = 2 * precision * recall / (precision + recall) if true_positives else 0.0
+
+    return {
+        "threshold": round(threshold, 3),
+        "accuracy": round(float(np.mean(predicted == (labels == 1))), 4),
+        "precision": round(precision, 4),
+        "recall": round(recall, 4),
+        "f1": round(f1, 4),
+    }
+
+
+def run():
+    """Distills the retrained model, saves the student and reports how it compares."""
+    import tensorflow as tf
+
+    windows, labels, file_indices = load_windows()
+    scores = teacher_scores(windows)
+    targets = soft_targets(scores, labels)
+
+    training, validation, test = split_folds(labels, file_indices)
+    logging.info(
+        f"Training the student on {np.sum(training)} windows, validating on "
+        f"{np.sum(validation)} and testing on {np.sum(test)}."
+    )
+
+    training_model, serving_model = build_student()
+    training_model.fit(
+        windows[training],
+        targets[training],
+        batch_size=32,
+        epochs=max_epochs,
+        validation_data=(windows[validation], targets[validation]),
+        callbacks=tf.keras.callbacks.EarlyStopping(
+            monitor="val_loss", patience=5, restore_best_weights=True
+        ),
+    )
+    save_student(serving_model)
+
+    # The threshold of the exported model, since the conversion can shift the scores.
+    _, validation_scores = measure_tflite(
+        RetrainedModel.distilled_tflite_model_path, windows[validation]
+    )
+    _, _, _, student_threshold = best_threshold(validation_scores, labels[validation])
+
+    # The student first, so it doesn't reuse memory the teacher freed.
+    student, student_scores = measure_tflite(
+        RetrainedModel.distilled_tflite_model_path, windows[test]
+    )
+    teacher, teacher_test_scores = measure_tflite(
+        RetrainedModel.tflite_model_path, windows[test]
+    )
+
+    test_labels = labels[test]
+    teacher.update(
+        classification_metrics(
+            teacher_test_scores, test_labels, config.retrained_model_output_threshold
+        )
+    )
+    student.update(
+        classification_metrics(student_scores, test_labels, student_threshold)
+    )
+    student["agreement_with_teacher"] = round(
+        float(
+            np.mean(
+                (student_scores > student_threshold)
+                == (teacher_test_scores > config.retrained_model_output_threshold)
+            )
+        ),
+        4,
+    )
+
+    report = {
+        "validation_windows": int(np.sum(validation)),
+        "test_windows": int(np.sum(test)),
+        "teacher": teacher,
+        "student": student,
+    }
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{'':<24} {'teacher':>12} {'student':>12}")
+    for key in student:
+        print(f"{key:<24} {teacher.get(key, '-'):>12} {student[key]:>12}")
+
+    logging.info(
+        f"Saved the distilled model and its report to {report_path}. To use it: "
+        f"RETRAINED_MODEL_VARIANT=distilled "
+        f"RETRAINED_MODEL_OUTPUT_THRESHOLD={student_threshold:.3f}"
+    )
@@ -1,7 +1,7 @@
 import time
 import threading
 
-from typing import Dict
+from typing import Any, Dict
 
 import zmq
 
@@ -40,6 +40,10 @@ class PlayEventsManager:
         self.last_play_sound_duration: float | None = None
         self.last_play_preroll_duration: float | None = None
 
+        # The last play event received, kept after the sound stops playing (unlike
+        # the values above) for reporting, see `sound_detector/control.py`.
+        self.last_play_event: Dict[str, Any] | None = None
+
         # Duration in seconds of the last preroll that was selected.
         self.preroll_durations: Dict[str, float] = {}
 
@@ -58,19 +62,21 @@ class PlayEventsManager:
         was recorded while a speaker was playing a recorded sound and hence avoid
         feedback speaker-microphone.
         """
-        logging.debug(f"[last_play_*] last_play_at: {self.last_play_at}")
+        logging.debug("[last_play_*] last_play_at: %s", self.last_play_at)
         if self.last_play_at:
             seconds_since_last_play = round(time.time()) - self.last_play_at
             logging.debug(
-                f"[last_play_*] seconds_since_last_play: {seconds_since_last_play}"
-            )
-            logging.debug(
-                f"[last_play_*] last sound duration + last preroll duration: {self.last_play_sound_duration + self.last_play_preroll_duration}"
+                "[last_play_*] seconds_since_last_play: %s", seconds_since_last_play
             )
-            is_sound_playing = seconds_since_last_play < (
+            play_duration = (
                 self.last_play_sound_duration + self.last_play_preroll_duration
             )
-            logging.debug(f"[last_play_*] is_sound_playing: {is_sound_playing}")
+            logging.debug(
+                "[last_play_*] last sound duration + last preroll duration: %s",
+                play_duration,
+            )
+            is_sound_playing = seconds_since_last_play < play_duration
+            logging.debug("[last_play_*] is_sound_playing: %s", is_sound_playing)
             if not is_sound_playing:
                 logging.info("[last_play_*] Resetting values.")
                 self.last_play_at = None
@@ -84,9 +90,10 @@ class PlayEventsManager:
                 "[periodically_pull_sound_play_events] Waiting for sound play event."
             )
             msg = self.sub_socket.recv_json()
-            logging.debug(f"[periodically_pull_sound_play_events] {msg}")
+            logging.debug("[periodically_pull_sound_play_events] %s", msg)
 
             if isinstance(msg, dict) and msg.get("when"):
+                self.last_play_event = msg
                 self.last_play_at = msg["when"]
                 self.last_play_sound_duration = msg["sound_duration"]
                 self.last_play_preroll_duration = msg["preroll_duration"]
@@ -4,13 +4,14 @@ Runs inference continuously on the sound detector model to get scores (predictio
 
 import logging
 import os
+import threading
 import time
 
+from collections import deque
 from datetime import datetime
 
-from typing import Any, List, Optional, Tuple
+from typing import Any, Deque, List, Optional, Tuple
 
-import pyaudio
 import zmq
 
 import numpy as np
@@ -19,25 +20,52 @@ import tflite_runtime.interpreter as tflite
 from numpy.typing import NDArray
 from slugify import slugify
 
-from sound_detector.audio import record_audio, write_audio
+from sound_detector import messages
+from sound_detector.audio import record_audio, recording_path, stream_audio, write_audio
 from sound_detector.config import config
-from sound_detector.db import write_db_entry
+from sound_detector.control import ControlServer, DetectorStats
+from sound_detector.db import write_db_entry, write_load_entry, write_rollup_entry
 from sound_detector.events import PlayEventsManager
+from sound_detector.exceptions import TaconezException
+from sound_detector.load import LoadShedder
+from sound_detector.memory import log_process_memory, process_memory
+from sound_detector.models.cascade import CascadeModel
+from sound_detector.models.hotswap import ModelWatcher
+from sound_detector.models.remote import RemoteModel
 from sound_detector.models.retrained import RetrainedModel
-from sound_detector.models.yamnet import YAMNetModel
+from sound_detector.models.yamnet import LabelMasks, YAMNetModel
+from sound_detector.profiling import Profiler
+from sound_detector.reload import ConfigWatcher
+from sound_detector.rollups import ScoreRollup
+from sound_detector.sidecars import write_sidecar_in_background
+from sound_detector.sources import AudioSource, CaptureStats, open_audio_source
+from sound_detector.window_log import WindowLog
 
 
 def run_loop():
     """Runs the main recording-inference-notification loop."""
-    pyaudio_instance = pyaudio.PyAudio()
+    audio_source = open_audio_source()
 
     play_events_manager = None
     push_socket = None
 
-    if config.stealth_mode or config.skip_detection_notification:
+    # The sockets are set up even in stealth mode since it can be turned off while
+    # running (see `sound_detector/reload.py`).
+    if config.skip_detection_notification:
+        if config.detection_aggregation:
+            raise TaconezException(
+                "`DETECTION_AGGREGATION` needs the detections to be sent, unset "
+                "`SKIP_DETECTION_NOTIFICATION` (the aggregator decides whether to "
+                "notify the distributor)."
+            )
         logging.info("Upon detections the distributor won't be notified.")
     else:
-        logging.info("Upon detections the distributor will be notified.")
+        if config.detection_aggregation:
+            logging.info("Upon detections the aggregator will be notified.")
+        elif config.stealth_mode:
+            logging.info("Upon detections the distributor won't be notified (stealth).")
+        else:
+            logging.info("Upon detections the distributor will be notified.")
 
         context = zmq.Context()
 
@@ -47,38 +75,143 @@ def run_loop():
         play_events_manager.start()
         logging.info("Play events manager thread started.")
 
-        # Connect to the distributor that will be notified upon detection:
+        # Connect to the distributor that will be notified upon detection, or to the
+        # aggregator that will notify it (see `sound_detector/aggregator.py`):
         push_addr = config.zmq_distributor_push_addr
+        if config.detection_aggregation:
+            push_addr = config.zmq_aggregator_addr
         push_socket = context.socket(zmq.PUSH)
+        if config.detection_send_hwm:
+            push_socket.setsockopt(zmq.SNDHWM, config.detection_send_hwm)
 
         logging.info(f"Connecting to sound distribution broker at {push_addr}.")
         push_socket.connect(push_addr)
         logging.info(f"Connected ZMQ PUSH socket ({push_addr}).")
 
-    if config.use_retrained_model:
+        if (
+            config.detection_message_format == "binary"
+            and not config.detection_aggregation
+        ):
+            logging.warning(
+                "Sending binary detection messages, the playback distributor can't "
+                f"read them: make sure a binary-aware receiver listens on {push_addr}."
+            )
+
+    if config.remote_inference:
+        if config.cascade_inference:
+            raise TaconezException(
+                "Cascade inference is not supported with `REMOTE_INFERENCE`."
+            )
+        model = RemoteModel()
+    elif config.cascade_inference:
+        model = CascadeModel()
+    elif config.use_retrained_model:
         model = RetrainedModel()
     else:
         model = YAMNetModel()
 
     model.initialize()
+    log_process_memory("after loading the model")
+
+    if config.cascade_inference or not config.use_retrained_model:
+        config.add_reload_listener(model.rebuild_label_masks)
+
+    config_watcher = ConfigWatcher()
+    config_watcher.start()
+
+    model_watcher = None
+    if config.model_hot_swap and config.use_tflite:
+        model_watcher = ModelWatcher(model)
+        model_watcher.start()
+
+    load_shedder = LoadShedder() if config.load_shedding else None
 
-    while True:
-        run(
+    score_rollup = None
+    if config.score_rollups:
+        if config.use_retrained_model:
+            score_rollup = ScoreRollup()
+        else:
+            score_rollup = ScoreRollup(len(model.class_names), model.class_names)
+
+    profiler = Profiler() if config.profiling else None
+
+    window_log = WindowLog() if config.window_log else None
+
+    detector_stats = None
+    control_server = None
+    if config.control_server:
+        detector_stats = DetectorStats()
+        control_server = ControlServer(
+            detector_stats,
             model,
-            pyaudio_instance,
+            audio_source,
             play_events_manager=play_events_manager,
-            zmq_push_socket=push_socket,
+            model_watcher=model_watcher,
+            load_shedder=load_shedder,
+            profiler=profiler,
+            window_log=window_log,
         )
+        control_server.start()
+
+    try:
+        if config.streaming_decisions:
+            run_streaming(
+                model,
+                audio_source,
+                play_events_manager=play_events_manager,
+                zmq_push_socket=push_socket,
+                load_shedder=load_shedder,
+                score_rollup=score_rollup,
+                window_log=window_log,
+                detector_stats=detector_stats,
+                config_watcher=config_watcher,
+                model_watcher=model_watcher,
+                profiler=profiler,
+                control_server=control_server,
+            )
+
+        while True:
+            config_watcher.reload_if_requested()
+            if model_watcher:
+                model_watcher.swap_if_ready()
+            if control_server:
+                control_server.run_pending_commands()
+
+            run(
+                model,
+                audio_source,
+                play_events_manager=play_events_manager,
+                zmq_push_socket=push_socket,
+                load_shedder=load_shedder,
+                score_rollup=score_rollup,
+                window_log=window_log,
+                detector_stats=detector_stats,
+                profiler=profiler,
+            )
+    except EOFError as e:
+        # Only files, pipes and sockets end.
+        logging.info(f"The audio source ended: {e}")
+    finally:
+        if control_server:
+            control_server.stop()
+        audio_source.close()
+        if window_log:
+            window_log.close()
 
 
 def run(
     model: Any,
-    pyaudio_instance: pyaudio.PyAudio,
+    audio_source: AudioSource,
     play_events_manager: Optional[PlayEventsManager] = None,
     zmq_push_socket: Optional[zmq.Socket] = None,
+    load_shedder: Optional[LoadShedder] = None,
+    score_rollup: Optional[ScoreRollup] = None,
+    window_log: Optional[WindowLog] = None,
+    detector_stats: Optional[DetectorStats] = None,
+    profiler: Optional[Profiler] = None,
 ):
-    """Records audio segments form the microphone and passes it to the model to see if
-    the prediction catches the specific sound.
+    """Records audio segments form the audio source and passes it to the model to see
+    if the prediction catches the specific sound.
 
     If a detection happens the analyzed audio file is written down to an NFS-shared
     folder and the subsequent parts of the pipeline are notified.
@@ -87,12 +220,25 @@ def run(
         model: Model to use for detection. It can be either an instance of our wrapper
             `YAMNetModel`, a `tflite.Interpreter` object or a trackable object (the
             returned value of `tf.saved_model.load`).
+        audio_source: Where to record the audio from.
         labels: Class names of the categories the model can recognize.
         zmq_socket: Used to notify the distributor a sound has been detected.
+        load_shedder: Decides which windows to analyze when the detector can't keep
+            up with real time.
+        score_rollup: Aggregates the scores of all the windows to periodically write
+            them to the database.
+        window_log: Records the scores of every analyzed window.
+        detector_stats: Counts the windows and detections for the control server.
+        profiler: Profiles and tracks the memory of the processing of each batch, but
+            not of its recording, which only waits for the audio.
     """
     logging.debug("Running inference...")
 
-    waveforms, waveform_binary = record_audio(pyaudio_instance)
+    flush_score_rollup_if_due(score_rollup, audio_source.capture_stats)
+
+    waveforms, waveform_binary = record_audio(audio_source)
+    if detector_stats:
+        detector_stats.add_recorded(len(waveforms))
 
     if (
         play_events_manager
@@ -102,49 +248,375 @@ def run(
             "[last_play_*] Skipping sound processing because sound was being played "
             "during recording and might cause feedback."
         )
+        if score_rollup:
+            score_rollup.add_skipped(len(waveforms))
+        if detector_stats:
+            detector_stats.add_skipped(len(waveforms))
         return
 
-    if config.use_retrained_model:
-        positive_detection, top_score = run_retrained_inference(model, waveforms)
-        top_class_slug = "high_heel"
-    else:
-        positive_detection, top_score, top_class_slug = run_yamnet_inference(
-            model, waveforms
+    if profiler:
+        profiler.start_cycle()
+
+    positive_detection, top_score, top_class_slug, window_scores = analyze_waveforms(
+        model,
+        waveforms,
+        load_shedder=load_shedder,
+        score_rollup=score_rollup,
+        window_log=window_log,
+        detector_stats=detector_stats,
+    )
+
+    if positive_detection:
+        if detector_stats:
+            detector_stats.add_detection(top_score, top_class_slug)
+        save_and_notify_detection(
+            waveform_binary,
+            top_class_slug,
+            top_score,
+            zmq_push_socket=zmq_push_socket,
+            window_scores=window_scores,
         )
 
-    if positive_detection and not config.skip_recording:
-        # Save the file to the NFS share.
-        file_path = write_audio(
-            pyaudio_instance,
+    if profiler:
+        profiler.end_cycle()
+
+
+def run_streaming(
+    model: Any,
+    audio_source: AudioSource,
+    play_events_manager: Optional[PlayEventsManager] = None,
+    zmq_push_socket: Optional[zmq.Socket] = None,
+    load_shedder: Optional[LoadShedder] = None,
+    score_rollup: Optional[ScoreRollup] = None,
+    window_log: Optional[WindowLog] = None,
+    detector_stats: Optional[DetectorStats] = None,
+    config_watcher: Optional[ConfigWatcher] = None,
+    model_watcher: Optional[ModelWatcher] = None,
+    profiler: Optional[Profiler] = None,
+    control_server: Optional[ControlServer] = None,
+):
+    """Decides on every window as soon as it's recorded instead of on whole batches.
+
+    The last `audio_inference_batch_size` windows are kept in memory, so when a window
+    is positive the clip to save is assembled right away from the buffered audio (the
+    detected window and the ones before it) and the distributor is notified without
+    waiting for the rest of the batch to be recorded. The detection latency is then
+    about one window instead of a whole batch.
+
+    After a detection the next `audio_inference_batch_size` windows are not analyzed,
+    so a single event does not produce overlapping clips.
+
+    Args:
+        Same as `run`, plus:
+        config_watcher: Applies any requested settings reload between windows.
+        model_watcher: Swaps in any changed model file between windows.
+        profiler: Profiles and tracks the memory of the processing of each window.
+        control_server: Carries out the commands received between windows.
+    """
+    recent_window_binaries: Deque[bytes] = deque(
+        maxlen=config.audio_inference_batch_size
+    )
+    # NaN until the window is analyzed, as it might not be.
+    recent_window_scores: Deque[float] = deque(maxlen=config.audio_inference_batch_size)
+    windows_to_cool_down = 0
+
+    for waveform, window_binary in stream_audio(audio_source):
+        recent_window_binaries.append(window_binary)
+        recent_window_scores.append(np.nan)
+        if detector_stats:
+            detector_stats.add_recorded(1)
+
+        if config_watcher:
+            config_watcher.reload_if_requested()
+
+        if model_watcher:
+            model_watcher.swap_if_ready()
+
+        if control_server:
+            control_server.run_pending_commands(keep_started=True)
+
+        flush_score_rollup_if_due(score_rollup, audio_source.capture_stats)
+
+        if windows_to_cool_down:
+            windows_to_cool_down -= 1
+            continue
+
+        if (
+            play_events_manager
+            and play_events_manager.has_been_recording_while_sound_was_playing()
+        ):
+            if score_rollup:
+                score_rollup.add_skipped(1)
+            if detector_stats:
+                detector_stats.add_skipped(1)
+            continue
+
+        if profiler:
+            profiler.start_cycle()
+
+        analysis = analyze_waveforms(
+            model,
+            [waveform],
+            load_shedder=load_shedder,
+            score_rollup=score_rollup,
+            window_log=window_log,
+            detector_stats=detector_stats,
+        )
+        positive_detection, top_score, top_class_slug, window_scores = analysis
+        recent_window_scores[-1] = window_scores[0]
+
+        if positive_detection:
+            if detector_stats:
+                detector_stats.add_detection(top_score, top_class_slug)
+            save_and_notify_detection(
+                b"".join(recent_window_binaries),
+                top_class_slug,
+                top_score,
+                zmq_push_socket=zmq_push_socket,
+                window_scores=np.array(recent_window_scores, dtype=np.float32),
+            )
+            windows_to_cool_down = config.audio_inference_batch_size
+
+        if profiler:
+            profiler.end_cycle()
+
+
+def analyze_waveforms(
+    model: Any,
+    waveforms: List[NDArray],
+    load_shedder: Optional[LoadShedder] = None,
+    score_rollup: Optional[ScoreRollup] = None,
+    window_log: Optional[WindowLog] = None,
+    detector_stats: Optional[DetectorStats] = None,
+) -> Tuple[bool, Optional[float], Optional[str], NDArray]:
+    """Runs the configured kind of inference on the windows the load shedder allows.
+
+    Returns:
+        Whether the sound was detected, its score, the slug of its class and the score
+        of each window (NaN for the ones not analyzed).
+    """
+    analyzed_waveforms = waveforms
+    if load_shedder:
+        analyzed_waveforms = load_shedder.select_waveforms(waveforms)
+        if len(analyzed_waveforms) < len(waveforms):
+            logging.debug(
+                "[LoadShedder] Analyzing %d/%d windows (level %d).",
+                len(analyzed_waveforms),
+                len(waveforms),
+                load_shedder.level,
+            )
+        if score_rollup:
+            score_rollup.add_skipped(len(waveforms) - len(analyzed_waveforms))
+        if detector_stats:
+            detector_stats.add_skipped(len(waveforms) - len(analyzed_waveforms))
+
+    started_at = time.perf_counter()
+
+    analyzed_scores: List[float] = []
+    positive_detection, top_score, top_class_slug = False, None, None
+    # The load shedder skips every window of a quiet batch, which leaves nothing to run
+    # the models on.
+    if analyzed_waveforms:
+        if config.cascade_inference:
+            positive_detection, top_score, top_class_slug = run_cascade_inference(
+                model,
+                analyzed_waveforms,
+                score_rollup=score_rollup,
+                window_scores=analyzed_scores,
+                window_log=window_log,
+            )
+        elif config.use_retrained_model:
+            positive_detection, top_score = run_retrained_inference(
+                model,
+                analyzed_waveforms,
+                score_rollup=score_rollup,
+                window_scores=analyzed_scores,
+                window_log=window_log,
+            )
+            top_class_slug = "high_heel"
+        else:
+            positive_detection, top_score, top_class_slug = run_yamnet_inference(
+                model,
+                analyzed_waveforms,
+                score_rollup=score_rollup,
+                window_scores=analyzed_scores,
+                window_log=window_log,
+            )
+
+    duration = time.perf_counter() - started_at
+    if detector_stats:
+        detector_stats.add_analyzed(len(analyzed_scores), duration)
+
+    if load_shedder:
+        level_changed = load_shedder.record_cycle(
+            duration, len(analyzed_waveforms), len(waveforms)
+        )
+        if level_changed and config.influx_db_token and not config.skip_recording:
+            write_load_entry(
+                load_shedder.level, load_shedder.rtf or 0.0, load_shedder.temperature
+            )
+
+    # The inference stops at the first positive window, so the ones after it have no
+    # score either.
+    analyzed_ids = set(map(id, analyzed_waveforms))
+    analyzed_indices = [i for i, w in enumerate(waveforms) if id(w) in analyzed_ids]
+    window_scores = np.full(len(waveforms), np.nan, dtype=np.float32)
+    window_scores[analyzed_indices[: len(analyzed_scores)]] = analyzed_scores
+
+    return positive_detection, top_score, top_class_slug, window_scores
+
+
+def save_and_notify_detection(
+    waveform_binary: bytes,
+    top_class_slug: str,
+    top_score: float,
+    zmq_push_socket: Optional[zmq.Socket] = None,
+    window_scores: Optional[NDArray] = None,
+):
+    """Saves the detected sound, writes its database entry and notifies the distributor.
+
+    With the binary message format the distributor gets the clip itself, so it's
+    notified first and the clip is saved to the NFS share in the background. With the
+    JSON one the clip is played from the share, so it's notified as soon as the clip is
+    saved, and the database entry is written in the background.
+
+    With `WAVEFORM_SIDECARS` a summary of the clip for the journal is also saved next
+    to it, in the background (see `sound_detector/sidecars.py`).
+
+    With `DETECTION_AGGREGATION` the clip is only sent to the aggregator, which does
+    all that for the best detection of each event (see `sound_detector/aggregator.py`).
+    """
+    if config.skip_recording:
+        return
+
+    file_path = recording_path(
+        suffix=f"{config.machine_id}_{top_class_slug}-{top_score:.3f}"
+    )
+    relative_sound_path = os.path.relpath(file_path, config.detected_recordings_dir)
+
+    if config.detection_aggregation:
+        notify_detection(
+            zmq_push_socket,
             waveform_binary,
-            suffix=f"{config.machine_id}_{top_class_slug}-{top_score:.3f}",
+            relative_sound_path,
+            top_score,
+            top_class_slug=top_class_slug,
         )
-        relative_sound_path = os.path.relpath(file_path, config.detected_recordings_dir)
+        return
+
+    if config.waveform_sidecars:
+        write_sidecar_in_background(file_path, waveform_binary, window_scores)
 
+    def save_db_entry():
         if config.influx_db_token:
             # Write the detection to the database.
             write_db_entry(top_class_slug, top_score, relative_sound_path)
         else:
             logging.info("Not writing database entry.")
 
-        if (
-            not config.stealth_mode
-            and not config.skip_detection_notification
-            and zmq_push_socket
-        ):
-            logging.info("Notifying distributor about detected sound")
-            # Playback the sound to all slaves.
+    def save():
+        # Save the file to the NFS share.
+        write_audio(waveform_binary, file_path=file_path)
+        save_db_entry()
+
+    notify = (
+        not config.stealth_mode
+        and not config.skip_detection_notification
+        and zmq_push_socket
+    )
+
+    if notify and config.detection_message_format == "binary":
+        notify_detection(
+            zmq_push_socket,
+            waveform_binary,
+            relative_sound_path,
+            top_score,
+            top_class_slug=top_class_slug,
+        )
+        threading.Thread(target=save, daemon=True).start()
+        return
+
+    # The sends stay on this thread, since ZMQ sockets are not thread safe.
+    write_audio(waveform_binary, file_path=file_path)
+    if notify:
+        notify_detection(
+            zmq_push_socket,
+            waveform_binary,
+            relative_sound_path,
+            top_score,
+            top_class_slug=top_class_slug,
+        )
+    threading.Thread(target=save_db_entry, daemon=True).start()
+
+
+def notify_detection(
+    zmq_push_socket: zmq.Socket,
+    waveform_binary: bytes,
+    relative_sound_path: str,
+    top_score: float,
+    top_class_slug: str = "",
+):
+    """Sends the detection to the distributor.
+
+    With `DETECTION_SEND_HWM` it's dropped if the queue is full, instead of waiting.
+
+    With `DETECTION_AGGREGATION` it's sent to the aggregator instead, always in the
+    binary format since it needs the clip and its class.
+    """
+    logging.info("Notifying distributor about detected sound")
+    when = round(time.time())
+    flags = zmq.NOBLOCK if config.detection_send_hwm else 0
+
+    # Playback the sound to all slaves.
+    try:
+        if config.detection_message_format == "binary" or config.detection_aggregation:
+            frames = messages.encode_detection(
+                relative_sound_path,
+                config.machine_id,
+                waveform_binary,
+                when=when,
+                score=top_score,
+                rate=config.audio_rate,
+                channels=config.audio_channels,
+                sound=top_class_slug,
+            )
+            zmq_push_socket.send_multipart(frames, flags=flags, copy=False)
+        else:
             zmq_push_socket.send_json(
                 {
                     "sound_file_path": relative_sound_path,
-                    "when": round(time.time()),
+                    "when": when,
                     "detected_by": config.machine_id,
-                }
+                },
+                flags=flags,
             )
+    except zmq.Again:
+        logging.warning(
+            "Dropped detection notification, the distributor is not keeping up."
+        )
+
+
+def flush_score_rollup_if_due(
+    score_rollup: Optional[ScoreRollup], capture_stats: Optional[CaptureStats] = None
+):
+    if not score_rollup or not score_rollup.is_due():
+        return
+
+    fields = score_rollup.flush()
+    fields.update({f"memory_{k}": v for k, v in process_memory().items()})
+    if capture_stats:
+        fields.update(capture_stats.flush())
+    if config.influx_db_token and not config.skip_recording:
+        # Off the loop, so a slow database does not delay the next recording.
+        threading.Thread(target=write_rollup_entry, args=(fields,), daemon=True).start()
 
 
 def run_retrained_inference(
-    retrained_model, waveforms: List[NDArray]
+    retrained_model,
+    waveforms: List[NDArray],
+    score_rollup: Optional[ScoreRollup] = None,
+    window_scores: Optional[List[float]] = None,
+    window_log: Optional[WindowLog] = None,
 ) -> Tuple[bool, float]:
     """Runs inference on the network that was retrained into a binary classifier to
     discriminate high-heel sounds.
@@ -161,6 +633,9 @@ def run_retrained_inference(
             object (the returned value of `tf.saved_model.load`).
         waveforms: The audio waveforms to run inference on. We usually record in 10
             stripes that we will iteratively run inference on and reduce the results.
+        score_rollup: If given, the score of every analyzed window is added to it.
+        window_scores: If given, the score of every analyzed window is appended to it.
+        window_log: If given, every analyzed window is recorded to it.
 
     Returns:
         Whether the sound was detected or not and the highest score or the first score
@@ -168,26 +643,171 @@ def run_retrained_inference(
     """
     predictions = []
     for waveform in waveforms:
-        prediction_tensor = retrained_model.predict(waveform)
-        if config.use_tflite:
-            prediction = prediction_tensor.item()
-        else:
-            prediction = prediction_tensor.numpy().item()
+        prediction = retrained_model.predict(waveform).item()
         predictions.append(prediction)
 
+        if window_log:
+            window_log.add(retrained_score=prediction)
+
         is_high_heel = prediction > config.retrained_model_output_threshold
         if is_high_heel:
             logging.info(
                 "High-heel sound detected: "
                 f"{prediction} > {config.retrained_model_output_threshold}"
             )
-            return True, prediction
+            break
+
+    if score_rollup:
+        score_rollup.add_scores(predictions)
+
+    if window_scores is not None:
+        window_scores.extend(predictions)
+
+    if is_high_heel:
+        return True, prediction
 
     return False, max(predictions)
 
 
+def run_cascade_inference(
+    cascade_model: CascadeModel,
+    waveforms: List[NDArray],
+    score_rollup: Optional[ScoreRollup] = None,
+    window_scores: Optional[List[float]] = None,
+    window_log: Optional[WindowLog] = None,
+) -> Tuple[bool, float, Optional[str]]:
+    """Runs the retrained model on every window and YAMNet only on the uncertain ones.
+
+    Windows scoring under `CASCADE_UNCERTAINTY_LOW` are clear negatives and those over
+    `CASCADE_UNCERTAINTY_HIGH` clear positives, none of them pays for the multiclass
+    ranking. The uncertain ones in between are ranked by YAMNet (see
+    `rank_yamnet_window`, which unlike `run_yamnet_inference` neither logs detections
+    nor follows `STEALTH_MODE`) and are positive when:
+
+    - Their high-heel score is over `RETRAINED_MODEL_OUTPUT_THRESHOLD` and YAMNet's
+      top class is not in the ignore list (so e.g. speech vetoes a high-heel guess).
+    - Otherwise, when YAMNet alone would consider the window positive, in which case
+      the detection is labelled with the YAMNet class.
+
+    Args:
+        cascade_model: Holds both the retrained and the YAMNet models.
+        waveforms: The audio waveforms to run inference on.
+        score_rollup: If given, the high-heel score of every analyzed window is added
+            to it.
+        window_scores: If given, the high-heel score of every analyzed window is
+            appended to it.
+        window_log: If given, every analyzed window is recorded to it, with the YAMNet
+            scores for the uncertain ones.
+
+    Returns:
+        Whether a sound was detected, its score and the slug of its class. The score is
+        the high-heel score unless the detection was labelled by YAMNet.
+    """
+    # Take the masks once, so a settings reload in the middle of the batch is only
+    # seen on the next one.
+    label_masks = cascade_model.yamnet_model.label_masks
+
+    predictions = []
+    detection = (False, None, None)
+    num_uncertain = 0
+
+    for waveform in waveforms:
+        prediction = cascade_model.retrained_model.predict(waveform).item()
+        predictions.append(prediction)
+
+        is_uncertain = (
+            config.cascade_uncertainty_low
+            <= prediction
+            <= config.cascade_uncertainty_high
+        )
+        if window_log and not is_uncertain:
+            window_log.add(retrained_score=prediction)
+
+        if prediction > config.cascade_uncertainty_high:
+            logging.info("High-heel sound detected (certain): %s", prediction)
+            detection = (True, prediction, "high_heel")
+            break
+
+        if prediction < config.cascade_uncertainty_low:
+            continue
+
+        num_uncertain += 1
+        multiclass_positive, multiclass_score, multiclass_slug = rank_yamnet_window(
+            cascade_model.yamnet_model, waveform, label_masks, window_log=window_log
+        )
+        if window_log:
+            window_log.set_last_retrained_score(prediction)
+        is_ignored = multiclass_slug is None
+
+        if prediction > config.retrained_model_output_threshold and not is_ignored:
+            logging.info(
+                f"High-heel sound detected (uncertain, heard as {multiclass_slug}): "
+                f"{prediction}"
+            )
+            detection = (True, prediction, "high_heel")
+            break
+
+        if multiclass_positive:
+            detection = (True, multiclass_score, multiclass_slug)
+            break
+
+    logging.debug(
+        "Cascade ran multiclass on %s/%s windows.", num_uncertain, len(predictions)
+    )
+
+    if score_rollup:
+        score_rollup.add_scores(predictions)
+
+    if window_scores is not None:
+        window_scores.extend(predictions)
+
+    if detection[0]:
+        return detection
+
+    return False, max(predictions), "high_heel"
+
+
+def rank_yamnet_window(
+    yamnet_model: YAMNetModel,
+    waveform: NDArray,
+    label_masks: LabelMasks,
+    window_log: Optional[WindowLog] = None,
+) -> Tuple[bool, float, Optional[str]]:
+    """Ranks a single window with YAMNet for the cascade.
+
+    The window is positive as `run_yamnet_inference` would consider it outside of
+    `STEALTH_MODE`: its top class is one of `MULTICLASS_DETECT_SOUNDS` and scores over
+    `MULTICLASS_DETECTION_THRESHOLD`. Nothing is logged, the cascade logs the detection
+    it makes of it.
+
+    Returns:
+        Whether the window is positive, its top score and the slug of its top class,
+        `None` if that class is ignored.
+    """
+    class_scores = np.mean(yamnet_model.predict(waveform), axis=0)
+    top_class_index = np.argmax(class_scores)
+    top_score = class_scores[top_class_index]
+    top_class_name = yamnet_model.class_names[top_class_index]
+
+    if window_log:
+        window_log.add(class_scores=class_scores)
+
+    if label_masks.ignore_mask[top_class_index]:
+        return False, top_score, None
+
+    is_positive = (
+        top_class_name in label_masks.detect_sounds
+        and top_score > config.multiclass_detection_threshold
+    )
+    return is_positive, top_score, slugify(top_class_name, separator="-")
+
+
 def run_yamnet_inference(
-    yamnet_model: YAMNetModel, waveforms: List[NDArray]
+    yamnet_model: YAMNetModel,
+    waveforms: List[NDArray],
+    score_rollup: Optional[ScoreRollup] = None,
+    window_scores: Optional[List[float]] = None,
+    window_log: Optional[WindowLog] = None,
 ) -> Tuple[bool, float, str]:
     """Runs inference on the YAMNet model to see if any of the sounds we are interested
     in are detected and if so the average score of the detection is returned.
@@ -196,6 +816,12 @@ def run_yamnet_inference(
         yamnet_model: The YAMNet model to use for inference.
         waveforms: The audio waveforms to run inference on. We usually record in 10
             stripes that we will iteratively run inference on and reduce the results.
+        score_rollup: If given, the top class and score of every analyzed window is
+            added to it.
+        window_scores: If given, the top score of every analyzed window is appended
+            to it.
+        window_log: If given, the top classes of every analyzed window are recorded to
+            it.
 
     However if the `STEALTH_MODE` is set, then it only logs the detected sounds that are
     not in the `IGNORE_SOUNDS` list.
@@ -203,34 +829,46 @@ def run_yamnet_inference(
     Returns:
         A tuple containing the highest scoring class name and value.
     """
+    # Take the masks once, so a settings reload in the middle of the batch is only
+    # seen on the next one.
+    label_masks = yamnet_model.label_masks
+
     # Run inference on the model to see what sound hsa been detected.
     predictions: List[Tuple[str, float]] = []
-    specific_sound_highest_scores = dict(
-        (n, 0.0) for n in config.multiclass_detect_sounds
-    )
+    specific_sound_highest_scores = dict((n, 0.0) for n in label_masks.detect_sounds)
 
     top_class_name = None
+    window_top_scores: List[float] = []
+    window_top_class_indices: List[int] = []
     for i, waveform in enumerate(waveforms):
-        log_prefix = f"[{i + 1}/{len(waveforms)}]"
-
         scores = yamnet_model.predict(waveform)
         class_scores = np.mean(scores, axis=0)
         top_class_index = np.argmax(class_scores)
         top_score = class_scores[top_class_index]
         top_class_name = yamnet_model.class_names[top_class_index]
 
-        if top_class_name not in config.multiclass_ignore_sounds:
+        window_top_scores.append(top_score)
+        window_top_class_indices.append(top_class_index)
+
+        if window_log:
+            window_log.add(class_scores=class_scores)
+
+        if not label_masks.ignore_mask[top_class_index]:
             predictions.append((top_class_name, top_score))
 
             if config.stealth_mode:
                 logging.debug(
-                    f"{log_prefix} Main sound: {top_class_name} (score {top_score})"
+                    "[%s/%s] Main sound: %s (score %s)",
+                    i + 1,
+                    len(waveforms),
+                    top_class_name,
+                    top_score,
                 )
 
-        for sound_to_detect in config.multiclass_detect_sounds:
-            sound_index = yamnet_model.class_names.index(sound_to_detect)
-            sound_score = class_scores[sound_index]
-
+        detect_scores = class_scores[label_masks.detect_indices]
+        for sound_to_detect, sound_score in zip(
+            label_masks.detect_sounds, detect_scores
+        ):
             specific_sound_highest_scores[sound_to_detect] = max(
                 specific_sound_highest_scores[sound_to_detect], sound_score
             )
@@ -238,14 +876,24 @@ def run_yamnet_inference(
             if sound_score > 0:
                 if config.stealth_mode:
                     logging.debug(
-                        f"{log_prefix} Specific sound ({sound_to_detect}) score: {sound_score}"
+                        "[%s/%s] Specific sound (%s) score: %s",
+                        i + 1,
+                        len(waveforms),
+                        sound_to_detect,
+                        sound_score,
                     )
 
+    if score_rollup:
+        score_rollup.add_scores(window_top_scores, window_top_class_indices)
+
+    if window_scores is not None:
+        window_scores.extend(window_top_scores)
+
     if len(predictions):
         if config.stealth_mode:
-            logging.debug(f"Batch predictions: {predictions}")
+            logging.debug("Batch predictions: %s", predictions)
             logging.debug(
-                f"Specific sound highest scores: {specific_sound_highest_scores}"
+                "Specific sound highest scores: %s", specific_sound_highest_scores
             )
 
     # TODO: Right now we will consider detection whenever we detect sounds that are not
@@ -263,7 +911,7 @@ def run_yamnet_inference(
     else:
         positive_detection = any(
             [
-                category in config.multiclass_detect_sounds
+                category in label_masks.detect_sounds
                 and score > config.multiclass_detection_threshold
                 for category, score in predictions
             ]
@@ -271,7 +919,7 @@ def run_yamnet_inference(
 
     resolved_class_name = None
     resolved_score = None
-    if top_class_name not in config.multiclass_ignore_sounds:
+    if not label_masks.ignore_mask[top_class_index]:
         resolved_class_name = top_class_name
         resolved_score = top_score
     else:
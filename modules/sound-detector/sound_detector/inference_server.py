@@ -0,0 +1,129 @@
+"""
+Inference server that runs the models on behalf of the weaker nodes (thin-edge mode).
+
+The nodes running with `REMOTE_INFERENCE=1` send their recorded windows through a ZMQ
+DEALER socket (see `sound_detector/models/remote.py`). The server answers them one after
+the other as they arrive, so one strong node does the work of all the others. The models
+take a single window per invocation, so holding requests back to batch them would only
+add latency.
+"""
+
+import json
+import logging
+
+from typing import Any, Optional, Tuple
+
+import numpy as np
+import zmq
+
+from sound_detector.config import config
+from sound_detector.memory import log_process_memory
+from sound_detector.models.hotswap import ModelWatcher
+from sound_detector.models.retrained import RetrainedModel
+from sound_detector.models.yamnet import YAMNetModel
+
+# A request as received by the ROUTER socket: identity of the node, header, payload.
+Request = Tuple[bytes, dict, Any]
+
+
+class InferenceServer:
+    def __init__(
+        self,
+        model: Any,
+        context: zmq.Context,
+        model_watcher: Optional[ModelWatcher] = None,
+    ):
+        self.model = model
+        self.model_watcher = model_watcher
+        self.model_kind = "retrained" if config.use_retrained_model else "yamnet"
+
+        bind_addr = config.zmq_inference_server_bind_addr
+        self.socket = context.socket(zmq.ROUTER)
+        self.socket.bind(bind_addr)
+        logging.info(f"[InferenceServer] Bound ZMQ ROUTER socket ({bind_addr}).")
+
+    def serve_forever(self):
+        while True:
+            if self.model_watcher:
+                self.model_watcher.swap_if_ready()
+            self.serve_request()
+
+    def serve_request(self):
+        """Waits for the next request and replies to it."""
+        request = self._recv_request()
+        if request is None:
+            return
+
+        identity, header, payload = request
+        try:
+            reply_header, reply_payload = self.handle_request(header, payload)
+        except Exception as e:
+            logging.exception("[InferenceServer] Failed to handle request.")
+            reply_header, reply_payload = {"error": str(e)}, b""
+
+        reply_header["id"] = header.get("id")
+        self.socket.send_multipart(
+            [identity, json.dumps(reply_header).encode("utf-8"), reply_payload],
+            copy=False,
+        )
+
+    def handle_request(self, header: dict, payload: Any) -> Tuple[dict, bytes]:
+        if header["op"] == "describe":
+            reply_header = {"model": self.model_kind}
+            if self.model_kind == "yamnet":
+                reply_header["class_names"] = self.model.class_names
+            return reply_header, b""
+
+        if header["op"] == "predict":
+            pcm = np.frombuffer(payload, dtype=np.int16)
+            waveform = (pcm / 32768).astype(np.float32)
+
+            # YAMNet's scores are a tensor with `USE_TFLITE=0`.
+            scores = np.asarray(self.model.predict(waveform), dtype=np.float32)
+            return {"shape": list(scores.shape)}, scores.tobytes()
+
+        raise ValueError(f"Unknown operation '{header['op']}'.")
+
+    def _recv_request(self) -> Optional[Request]:
+        """Receives the next request, `None` if it's malformed.
+
+        Anything can connect to the socket, so a malformed message is dropped (the node
+        waiting for it times out) instead of taking the server down for every node.
+        """
+        frames = self.socket.recv_multipart(copy=False)
+        try:
+            identity, header_bytes, payload = frames
+            header = json.loads(header_bytes.bytes)
+            if not isinstance(header, dict):
+                raise ValueError("The header is not a JSON object.")
+        except ValueError as e:
+            # `json.JSONDecodeError` and `UnicodeDecodeError` are `ValueError`s too.
+            logging.warning(f"[InferenceServer] Ignoring a malformed request: {e}")
+            return None
+
+        return identity.bytes, header, payload.buffer
+
+
+def run_server():
+    """Loads the configured model and serves inference requests for the other nodes."""
+    if config.machine_role != "master":
+        logging.warning(
+            f"Running the inference server on a '{config.machine_role}' node, it's "
+            "meant to run on the master."
+        )
+
+    if config.use_retrained_model:
+        model = RetrainedModel()
+    else:
+        model = YAMNetModel()
+
+    model.initialize()
+    log_process_memory("after loading the model")
+
+    model_watcher = None
+    if config.model_hot_swap and config.use_tflite:
+        model_watcher = ModelWatcher(model)
+        model_watcher.start()
+
+    server = InferenceServer(model, zmq.Context(), model_watcher=model_watcher)
+    server.serve_forever()
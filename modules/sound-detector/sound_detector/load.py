@@ -0,0 +1,129 @@
+"""
+Load shedding under CPU and thermal pressure.
+"""
+
+import logging
+import os
+
+from typing import List, Optional
+
+import numpy as np
+
+from numpy.typing import NDArray
+
+from sound_detector.config import config
+
+
+class LoadShedder:
+    """Keeps track of the real-time factor of the inference and degrades gracefully.
+
+    The real-time factor (RTF) is the time spent processing a batch divided by the
+    duration of the audio in it. A RTF close to 1 means the detector is falling behind
+    and not listening for most of the time.
+
+    Degradation levels:
+
+    - 0: All the windows of the batch are analyzed.
+    - 1: Quiet windows (under `LOAD_SHEDDING_SILENCE_RMS`) are skipped.
+    - 2: Only the loudest half of the remaining windows is analyzed.
+    - 3: Only the loudest window is analyzed.
+
+    The level goes up one step per batch while under pressure and down one step per
+    batch once the RTF is back under `LOAD_SHEDDING_LOW_RTF` and the board has cooled.
+    """
+
+    max_level = 3
+
+    # Weight of the latest batch in the moving average of the RTF.
+    smoothing = 0.3
+
+    def __init__(self):
+        self.level = 0
+        self.rtf: Optional[float] = None
+        self.temperature: Optional[float] = None
+
+    def select_waveforms(self, waveforms: List[NDArray]) -> List[NDArray]:
+        """Returns the windows that should be analyzed at the current level."""
+        if self.level == 0:
+            return waveforms
+
+        rms = np.array([np.sqrt(np.mean(np.square(w))) for w in waveforms])
+        loudest_first = np.argsort(rms)[::-1]
+        loudest_first = loudest_first[
+            rms[loudest_first] >= config.load_shedding_silence_rms
+        ]
+
+        if self.level == 2:
+            loudest_first = loudest_first[: max(1, len(loudest_first) // 2)]
+        elif self.level == 3:
+            loudest_first = loudest_first[:1]
+
+        # Keep the chronological order.
+        return [waveforms[i] for i in sorted(loudest_first)]
+
+    def record_cycle(
+        self, processing_seconds: float, analyzed_windows: int, total_windows: int
+    ) -> bool:
+        """Updates the RTF with a processed batch and adjusts the degradation level.
+
+        The RTF is projected to what it would have been analyzing the whole batch,
+        otherwise shedding load would make it look like the pressure is gone and the
+        level would bounce up and down.
+
+        Returns:
+            Whether the degradation level changed.
+        """
+        self.temperature = read_temperature()
+
+        # A batch of quiet windows says nothing about the pressure, and judging it by
+        # the RTF of the last loud one would keep raising the level in a quiet room.
+        if not analyzed_windows:
+            return False
+
+        rtf = (processing_seconds * total_windows / analyzed_windows) / (
+            total_windows * config.audio_inference_seconds
+        )
+        if self.rtf is None:
+            self.rtf = rtf
+        else:
+            self.rtf = self.smoothing * rtf + (1 - self.smoothing) * self.rtf
+
+        is_hot = (
+            self.temperature is not None
+            and self.temperature > config.load_shedding_max_temperature
+        )
+
+        rtf = self.rtf
+        if rtf > config.load_shedding_high_rtf or is_hot:
+            new_level = min(self.level + 1, self.max_level)
+        elif rtf < config.load_shedding_low_rtf:
+            new_level = max(self.level - 1, 0)
+        else:
+            new_level = self.level
+
+        if new_level != self.level:
+            logging.warning(
+                f"[LoadShedder] Degradation level {self.level} -> {new_level} "
+                f"(rtf {rtf:.2f}, temperature {self.temperature})."
+            )
+            self.level = new_level
+            return True
+
+        return False
+
+
+def read_temperature() -> Optional[float]:
+    """Reads the SoC temperature in Celsius, if the board exposes it.
+
+    It's read on every cycle, so a failed read is taken as unknown rather than stopping
+    the loop.
+    """
+    if not os.path.exists(config.thermal_zone_path):
+        return None
+
+    try:
+        with open(config.thermal_zone_path, "r") as f:
+            return int(f.read().strip()) / 1000
+    except (OSError, ValueError) as e:
+        logging.debug("[LoadShedder] Could not read the temperature: %s", e)
+        return None
@@ -0,0 +1,40 @@
+"""
+Memory usage reporting of the running process.
+"""
+
+import logging
+import os
+
+from typing import Dict
+
+smaps_rollup_path = "/proc/self/smaps_rollup"
+
+# Fields of `smaps_rollup` to report. The PSS (proportional set size) splits the shared
+# pages among the processes mapping them, so comparing it with the RSS shows how much
+# is actually being shared (e.g. memory-mapped model weights).
+reported_fields = ["Rss", "Pss", "Shared_Clean", "Private_Clean", "Private_Dirty"]
+
+
+def process_memory() -> Dict[str, int]:
+    """Returns the memory usage of this process in bytes, keyed in snake case.
+
+    Returns an empty dictionary where `/proc` is not available (e.g. macOS).
+    """
+    if not os.path.exists(smaps_rollup_path):
+        return {}
+
+    memory = {}
+    with open(smaps_rollup_path, "r") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[0].rstrip(":") in reported_fields:
+                memory[parts[0].rstrip(":").lower()] = int(parts[1]) * 1024
+
+    return memory
+
+
+def log_process_memory(when: str):
+    memory = process_memory()
+    if memory:
+        summary = ", ".join(f"{k} {v / 1e6:.1f} MB" for k, v in memory.items())
+        logging.info(f"Process memory {when}: {summary}.")
@@ -0,0 +1,116 @@
+"""
+Binary detection messages sent to the playback distributor.
+
+With `DETECTION_MESSAGE_FORMAT=binary` a detection is sent as a ZMQ multipart message
+carrying the audio itself, so receivers can play it right away instead of reading the
+clip back from the NFS share (which is then written in the background):
+
+    frame 0: header, packed as `HEADER_FORMAT` (see `DetectionHeader`)
+    frame 1: the relative sound file path (UTF-8), where the clip will be on the share
+    frame 2: the id of the machine that detected it (UTF-8)
+    frame 3: the clip as raw little-endian PCM samples
+    frame 4: optionally, the slug of the detected sound class (UTF-8), e.g. for the
+             aggregator (see `sound_detector/aggregator.py`)
+
+The playback distributor (`modules/playback-distributor`) does not understand them yet:
+it reads a single JSON frame per message, so it must only be sent these by a binary-aware
+receiver in between, or once it supports them. The aggregator does.
+
+The module does not read the configuration so receivers can import it standalone.
+"""
+
+import struct
+
+from typing import List, NamedTuple, Union
+
+MAGIC = b"TCZD"
+VERSION = 1
+
+# Magic, version, sample width in bytes, channels, sample rate, unix time of the
+# detection and its score.
+HEADER_FORMAT = "<4sBBHIqf"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+Frame = Union[bytes, memoryview]
+
+
+class DetectionHeader(NamedTuple):
+    version: int
+    sample_width: int
+    channels: int
+    rate: int
+    when: int
+    score: float
+
+
+class DetectionMessage(NamedTuple):
+    header: DetectionHeader
+    sound_file_path: str
+    detected_by: str
+    audio: Frame
+    sound: str = ""
+
+
+def encode_detection(
+    sound_file_path: str,
+    detected_by: str,
+    audio: Frame,
+    when: int,
+    score: float,
+    rate: int,
+    channels: int = 1,
+    sample_width: int = 2,
+    sound: str = "",
+) -> List[Frame]:
+    """Builds the frames of a detection message.
+
+    The audio frame is passed through as is, so sending the frames with `copy=False`
+    hands the recorded buffer to ZMQ without copying it.
+    """
+    header = struct.pack(
+        HEADER_FORMAT, MAGIC, VERSION, sample_width, channels, rate, when, score
+    )
+    frames = [
+        header,
+        sound_file_path.encode("utf-8"),
+        detected_by.encode("utf-8"),
+        audio,
+    ]
+    if sound:
+        frames.append(sound.encode("utf-8"))
+    return frames
+
+
+def decode_detection(frames: List[Frame]) -> DetectionMessage:
+    """Parses the frames of a detection message as received by `recv_multipart`.
+
+    Raises:
+        ValueError: If the frames are not a detection message of a known version.
+    """
+    if len(frames) not in (4, 5):
+        raise ValueError(
+            f"Expected 4 or 5 frames in a detection message, got {len(frames)}."
+        )
+
+    header_frame, path_frame, detected_by_frame, audio, *sound_frame = [
+        getattr(frame, "buffer", frame) for frame in frames
+    ]
+
+    if len(header_frame) != HEADER_SIZE:
+        raise ValueError(f"Invalid detection message header size {len(header_frame)}.")
+
+    magic, *fields = struct.unpack(HEADER_FORMAT, header_frame)
+    if magic != MAGIC:
+        raise ValueError("Not a detection message.")
+
+    header = DetectionHeader(*fields)
+    if header.version != VERSION:
+        raise ValueError(f"Unsupported detection message version {header.version}.")
+
+    return DetectionMessage(
+        header,
+        bytes(path_frame).decode("utf-8"),
+        bytes(detected_by_frame).decode("utf-8"),
+        audio,
+        bytes(sound_frame[0]).decode("utf-8") if sound_frame else "",
+    )
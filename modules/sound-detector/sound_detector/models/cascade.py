@@ -0,0 +1,41 @@
+"""
+The retrained model and YAMNet multiclass together, for cascade inference.
+"""
+
+import logging
+
+from numpy.typing import NDArray
+
+from sound_detector.models.retrained import RetrainedModel
+from sound_detector.models.yamnet import YAMNetModel
+
+
+class CascadeModel:
+    """
+    Holds the cheap binary high-heel model that runs on every window and the YAMNet
+    multiclass model that only runs on the windows the former is uncertain about (see
+    `sound_detector.inference.run_cascade_inference`).
+    """
+
+    def __init__(self):
+        self.initialized = False
+        self.retrained_model = RetrainedModel()
+        self.yamnet_model = YAMNetModel()
+
+    @property
+    def class_names(self):
+        return self.yamnet_model.class_names
+
+    def initialize(self):
+        self.retrained_model.initialize()
+        self.yamnet_model.initialize()
+
+        logging.info("Cascade model initialized successfully and ready to use.")
+        self.initialized = True
+
+    def rebuild_label_masks(self):
+        self.yamnet_model.rebuild_label_masks()
+
+    def predict(self, waveform: NDArray):
+        """The high-heel score, the multiclass scores are requested separately."""
+        return self.retrained_model.predict(waveform)
@@ -0,0 +1,124 @@
+"""
+A small log-mel CNN distilled from the retrained model, see `sound_detector/distill.py`.
+
+It takes the same "audio" input and gives the same "classifier" output as the retrained
+model, so `RetrainedModel` loads it in its place with `RETRAINED_MODEL_VARIANT=distilled`.
+The log-mel spectrogram is computed inside the model with a convolution whose fixed
+kernel is the windowed DFT and a product with the mel filterbank, so the model converts
+to TFLite builtin operations only.
+"""
+
+import numpy as np
+
+from numpy.typing import NDArray
+
+from sound_detector import sidecars
+from sound_detector.config import config
+
+# 16 ms frames every 10 ms. Short frames keep the spectrogram, which dominates the cost
+# of the model, cheap while still resolving the clicks of the heels.
+fft_size = 256
+hop_size = 160
+num_mel_bands = 40
+
+default_learning_rate = 0.001
+
+
+def dft_kernel(num_bins: int) -> NDArray:
+    """Hann windowed DFT as a Conv1D kernel of shape (fft_size, 1, 2 * num_bins).
+
+    The first `num_bins` filters give the real part of the first `num_bins` frequency
+    bins and the rest their imaginary part.
+    """
+    samples = np.arange(fft_size)[:, None]
+    bins = np.arange(num_bins)[None, :]
+    angles = 2 * np.pi * samples * bins / fft_size
+    window = np.hanning(fft_size + 1)[:-1, None]
+
+    kernel = np.concatenate([np.cos(angles), -np.sin(angles)], axis=1) * window
+    return kernel[:, None, :].astype(np.float32)
+
+
+def mel_weights() -> NDArray:
+    """The mel filterbank as a (num_bins, num_mel_bands) matrix.
+
+    Only the bins up to the last one any filter uses are kept, so the DFT doesn't
+    compute the frequencies above `sidecars.mel_max_hz`.
+    """
+    filterbank = sidecars.mel_filterbank(num_mel_bands, config.audio_rate, fft_size)
+    num_bins = int(np.flatnonzero(filterbank.any(axis=0))[-1]) + 1
+    return np.ascontiguousarray(filterbank[:, :num_bins].T)
+
+
+def build_student(learning_rate: float = default_learning_rate):
+    """Builds the student, for training, and the serving model to export from it.
+
+    Returns:
+        The training model, taking a batch of windows of shape (batch, samples) and
+        giving an unnormalized score (logit) per window, and the serving model sharing
+        its layers, taking a single waveform as "audio" and giving its score as
+        "classifier", like the retrained model.
+    """
+    import tensorflow as tf
+
+    weights = mel_weights()
+    num_bins = weights.shape[0]
+
+    class LogMelSpectrogram(tf.keras.layers.Layer):
+        def __init__(self, **kwargs):
+            super(LogMelSpectrogram, self).__init__(**kwargs)
+            self.dft = tf.constant(dft_kernel(num_bins))
+            self.mel = tf.constant(weights)
+
+        def call(self, waveforms):
+            # Either a single waveform (samples,) or a batch (batch, samples).
+            waveforms = tf.reshape(waveforms, [-1, tf.shape(waveforms)[-1], 1])
+            spectrum = tf.nn.conv1d(
+                waveforms, self.dft, stride=hop_size, padding="VALID"
+            )
+            power = tf.square(spectrum[..., :num_bins]) + tf.square(
+                spectrum[..., num_bins:]
+            )
+            mel = tf.matmul(tf.reshape(power, [-1, num_bins]), self.mel)
+            mel = tf.reshape(mel, [tf.shape(power)[0], -1, num_mel_bands, 1])
+            return tf.math.log(mel + 1e-6)
+
+    class FlattenScoresLayer(tf.keras.layers.Layer):
+        def call(self, input):
+            return tf.reshape(input, [-1])
+
+    spectrogram = LogMelSpectrogram(name="log_mel_spectrogram")
+    student = tf.keras.Sequential(
+        [
+            tf.keras.layers.Input(shape=(None, num_mel_bands, 1), dtype=tf.float32),
+            tf.keras.layers.BatchNormalization(),
+            tf.keras.layers.Conv2D(16, 3, strides=2, padding="same", activation="relu"),
+            tf.keras.layers.SeparableConv2D(
+                32, 3, strides=2, padding="same", activation="relu"
+            ),
+            tf.keras.layers.SeparableConv2D(
+                64, 3, strides=2, padding="same", activation="relu"
+            ),
+            tf.keras.layers.GlobalAveragePooling2D(),
+            tf.keras.layers.Dropout(0.2),
+            tf.keras.layers.Dense(1),
+        ],
+        name="student",
+    )
+
+    input_windows = tf.keras.layers.Input(
+        shape=(config.audio_inference_samples,), dtype=tf.float32, name="windows"
+    )
+    training_model = tf.keras.Model(input_windows, student(spectrogram(input_windows)))
+    training_model.compile(
+        loss=tf.keras.losses.BinaryCrossentropy(from_logits=True),
+        optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate),
+    )
+
+    input_segment = tf.keras.layers.Input(shape=(), dtype=tf.float32, name="audio")
+    serving_outputs = FlattenScoresLayer(name="classifier")(
+        student(spectrogram(input_segment))
+    )
+    serving_model = tf.keras.Model(input_segment, serving_outputs)
+
+    return training_model, serving_model
@@ -0,0 +1,165 @@
+"""
+Hot swap of the TFLite model files while the detector runs.
+"""
+
+import logging
+import os
+import threading
+import time
+
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from sound_detector.config import config
+from sound_detector.exceptions import TaconezException
+from sound_detector.models.cascade import CascadeModel
+from sound_detector.models.retrained import RetrainedModel
+from sound_detector.models.yamnet import YAMNetModel
+
+# Modification time and size of a model file.
+FileStamp = Tuple[float, int]
+
+
+class ModelWatcher:
+    """Swaps in the model files that change on disk, keeping the old model on failure.
+
+    A thread polls the model files and, once a changed file has stopped changing (it
+    might still be being written), loads it into a new wrapper, warms it up and
+    validates it on a canary input of silence. The swap itself is done by the loop
+    calling `swap_if_ready` between recordings, by handing the new interpreter to the
+    wrapper already in use, so nothing holding the wrapper needs to know.
+
+    A model that fails to load or to validate is discarded, and the same file is not
+    tried again until it changes once more. Models are mapped from a copy of their file
+    (see `sound_detector/models/shared.py`), so writing the new model over the old one
+    in place leaves the running model untouched.
+    """
+
+    def __init__(self, model: Any):
+        self.model = model
+
+        # The wrappers that can be swapped, with the path of their model file.
+        self.targets: List[Any] = []
+        if isinstance(model, CascadeModel):
+            self.targets = [model.retrained_model, model.yamnet_model]
+        elif isinstance(model, (RetrainedModel, YAMNetModel)):
+            self.targets = [model]
+
+        self.loaded_stamps = {
+            target.tflite_model_path: self._read_stamp(target.tflite_model_path)
+            for target in self.targets
+        }
+        self.seen_stamps = dict(self.loaded_stamps)
+
+        # Validated wrappers waiting to be swapped in, by the target they replace.
+        self.ready: Dict[int, Any] = {}
+        self.ready_lock = threading.Lock()
+
+        # Incremented on every swap.
+        self.version = 0
+
+        self.thread = threading.Thread(
+            target=self.periodically_watch_files, daemon=True
+        )
+
+    def start(self):
+        if not self.targets:
+            logging.info("[ModelWatcher] This model can't be hot swapped.")
+            return
+        self.thread.start()
+
+    def swap_if_ready(self) -> bool:
+        """Swaps in the new models that are ready, returning whether any was."""
+        if not self.ready:
+            return False
+
+        with self.ready_lock:
+            ready, self.ready = self.ready, {}
+
+        for target in self.targets:
+            candidate = ready.get(id(target))
+            if candidate:
+                target.model = candidate.model
+                if isinstance(target, YAMNetModel):
+                    target.class_names = candidate.class_names
+                    target.label_masks = candidate.label_masks
+                logging.info(f"[ModelWatcher] Swapped in {target.tflite_model_path}.")
+
+        self.version += 1
+        return True
+
+    def periodically_watch_files(self):
+        while True:
+            time.sleep(config.model_hot_swap_poll_seconds)
+
+            for target in self.targets:
+                path = target.tflite_model_path
+                stamp = self._read_stamp(path)
+
+                previous_stamp = self.seen_stamps[path]
+                self.seen_stamps[path] = stamp
+
+                # Wait until it has not changed since the previous poll.
+                if stamp is None or stamp != previous_stamp:
+                    continue
+                if stamp == self.loaded_stamps[path]:
+                    continue
+
+                self.loaded_stamps[path] = stamp
+                logging.info(f"[ModelWatcher] {path} changed, loading it.")
+                candidate = self.load_candidate(target)
+                if candidate:
+                    with self.ready_lock:
+                        self.ready[id(target)] = candidate
+
+    def load_candidate(self, target: Any) -> Optional[Any]:
+        """Loads the model file into a new wrapper, or returns `None` if it's not valid."""
+        try:
+            candidate = type(target)()
+            candidate.initialize()
+            validate_model(candidate, target)
+        except Exception:
+            logging.exception(
+                f"[ModelWatcher] The new {target.tflite_model_path} is not valid, "
+                "keeping the current model."
+            )
+            return None
+
+        logging.info(f"[ModelWatcher] {target.tflite_model_path} is ready to swap in.")
+        return candidate
+
+    def _read_stamp(self, path: str) -> Optional[FileStamp]:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime, stat.st_size
+
+
+def validate_model(candidate: Any, current: Any):
+    """Runs the candidate on silence, which also warms it up, and checks its output.
+
+    Raises:
+        TaconezException: If the output is not finite or does not look like the one of
+            the current model.
+    """
+    waveform = np.zeros(config.audio_inference_samples, dtype=np.float32)
+    output = np.asarray(candidate.predict(waveform))
+
+    if not np.all(np.isfinite(output)):
+        raise TaconezException("The model outputs non-finite scores on the canary.")
+
+    if isinstance(candidate, YAMNetModel):
+        if len(candidate.class_names) != len(current.class_names):
+            raise TaconezException(
+                f"The model has {len(candidate.class_names)} classes instead of "
+                f"{len(current.class_names)}."
+            )
+        if output.shape[-1] != len(candidate.class_names):
+            raise TaconezException(
+                f"The model outputs {output.shape[-1]} scores for "
+                f"{len(candidate.class_names)} classes."
+            )
+    elif output.size != 1:
+        raise TaconezException(f"The model outputs {output.size} scores instead of 1.")
@@ -0,0 +1,145 @@
+"""
+Model wrapper that delegates the inference to a remote inference server.
+"""
+
+import itertools
+import json
+import logging
+
+from typing import List, Optional
+
+import numpy as np
+import zmq
+
+from numpy.typing import NDArray
+
+from sound_detector.config import config
+from sound_detector.exceptions import TaconezException
+from sound_detector.models.yamnet import build_label_masks
+
+
+class RemoteModel:
+    """
+    Stands in for `RetrainedModel` or `YAMNetModel` on nodes that are too weak to run
+    the models themselves (thin-edge mode).
+
+    Every window is sent to the inference server (see `sound_detector/inference_server.py`)
+    as 16-bit PCM, which halves the payload compared to the float waveform, and the
+    returned scores have the same shape the local model would have produced.
+    """
+
+    def __init__(self):
+        self.initialized = False
+        self.model_kind: Optional[str] = None
+        self.class_names: List[str] = []
+
+        self._request_ids = itertools.count()
+        self._socket: Optional[zmq.Socket] = None
+        self._poller: Optional[zmq.Poller] = None
+
+    def initialize(self):
+        self._connect()
+
+        reply_header, _ = self._request({"op": "describe"})
+        if reply_header is None:
+            raise TaconezException(
+                "The inference server did not answer at "
+                f"{config.zmq_inference_server_addr}. Make sure `python main.py "
+                "inference-server` is running on the master."
+            )
+
+        expected_kind = "retrained" if config.use_retrained_model else "yamnet"
+        if reply_header["model"] != expected_kind:
+            raise TaconezException(
+                f"The inference server runs the '{reply_header['model']}' model but this "
+                f"node expects '{expected_kind}'. Check `USE_RETRAINED_MODEL` on both ends."
+            )
+
+        self.model_kind = reply_header["model"]
+        self.class_names = reply_header.get("class_names", [])
+        if self.model_kind == "yamnet":
+            self.rebuild_label_masks()
+
+        logging.info(
+            f"[RemoteModel] Using the '{self.model_kind}' model served at "
+            f"{config.zmq_inference_server_addr}."
+        )
+        self.initialized = True
+
+    def rebuild_label_masks(self):
+        """Swaps in new label masks, e.g. after the settings are reloaded."""
+        self.label_masks = build_label_masks(self.class_names)
+
+    def predict(self, waveform: NDArray) -> NDArray:
+        """
+        Sends the waveform to the inference server and returns its scores.
+
+        If the server does not answer in `REMOTE_INFERENCE_TIMEOUT` seconds the window
+        is considered a miss: scores of `-inf` for the retrained model and zeros for
+        YAMNet.
+        """
+        if not self.initialized:
+            raise TaconezException(
+                "You must call `.initialize()` first before using the model."
+            )
+
+        pcm = np.clip(waveform * 32768, -32768, 32767).astype(np.int16)
+        reply_header, reply_payload = self._request(
+            {"op": "predict", "machine_id": config.machine_id}, pcm
+        )
+
+        if reply_header is None:
+            logging.warning(
+                "[RemoteModel] Inference server timed out, skipping window."
+            )
+            if self.model_kind == "retrained":
+                return np.array(-np.inf, dtype=np.float32)
+            return np.zeros((1, len(self.class_names)), dtype=np.float32)
+
+        return np.frombuffer(reply_payload, dtype=np.float32).reshape(
+            reply_header["shape"]
+        )
+
+    def _connect(self):
+        if self._socket is not None:
+            self._poller.unregister(self._socket)
+            self._socket.close(linger=0)
+
+        addr = config.zmq_inference_server_addr
+        self._socket = zmq.Context.instance().socket(zmq.DEALER)
+        self._socket.connect(addr)
+        self._poller = zmq.Poller()
+        self._poller.register(self._socket, zmq.POLLIN)
+        logging.info(f"[RemoteModel] Connected ZMQ DEALER socket ({addr}).")
+
+    def _request(self, header: dict, payload: Optional[NDArray] = None):
+        """
+        Sends a request and waits for the reply that matches its id. Replies to earlier
+        requests that timed out are discarded.
+
+        Returns:
+            The reply header and payload, or `(None, None)` on timeout.
+        """
+        request_id = next(self._request_ids)
+        header = dict(header, id=request_id)
+        frames = [json.dumps(header).encode("utf-8")]
+        frames.append(payload.tobytes() if payload is not None else b"")
+        self._socket.send_multipart(frames, copy=False)
+
+        timeout_ms = int(config.remote_inference_timeout * 1000)
+        while self._poller.poll(timeout_ms):
+            reply_header_bytes, reply_payload = self._socket.recv_multipart()
+            reply_header = json.loads(reply_header_bytes)
+            if reply_header.get("id") == request_id:
+                if reply_header.get("error"):
+                    raise TaconezException(
+                        f"Inference server failed: {reply_header['error']}"
+                    )
+                return reply_header, reply_payload
+            logging.debug(
+                f"[RemoteModel] Discarding stale reply {reply_header.get('id')}."
+            )
+
+        # Start afresh so a reply that arrives late is not queued behind the next one.
+        self._connect()
+        return None, None
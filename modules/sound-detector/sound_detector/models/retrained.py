@@ -6,15 +6,75 @@ import logging
 import os
 import shutil
 
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
 from numpy.typing import NDArray
 
 from sound_detector.config import config
 from sound_detector.exceptions import TaconezException
+from sound_detector.models.shared import load_tflite_interpreter
 from sound_detector.models.yamnet import YAMNetModel
 
 if not config.use_tflite:
     import tensorflow as tf
 
+# The head trained by `build_and_retrain`, the sweep (`sound_detector/sweep.py`) tries
+# others around it.
+default_hidden_layers = (512, 200)
+default_learning_rate = 0.001
+
+app_root = os.path.join(os.path.dirname(__file__), "..", "..", "..")
+dataset_dirs = {
+    1: os.path.join(app_root, "dataset", "positive"),
+    0: os.path.join(app_root, "dataset", "negative"),
+}
+
+
+def build_head(
+    hidden_layers: Sequence[int] = default_hidden_layers,
+    learning_rate: float = default_learning_rate,
+):
+    """Builds the binary classifier that runs on top of the YAMNet embeddings.
+
+    Its output is an unnormalized score (logit), compared at inference time against
+    `RETRAINED_MODEL_OUTPUT_THRESHOLD`.
+    """
+    import tensorflow as tf
+
+    head = tf.keras.Sequential(
+        [tf.keras.layers.Input(shape=(1024), dtype=tf.float32, name="input_embedding")]
+        + [tf.keras.layers.Dense(units, activation="relu") for units in hidden_layers]
+        + [tf.keras.layers.Dense(1)],
+        name="retrained_model",
+    )
+    head.compile(
+        loss=tf.keras.losses.BinaryCrossentropy(from_logits=True),
+        optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate),
+        metrics=["accuracy"],
+    )
+    return head
+
+
+def load_wav_16k_mono(filename):
+    """
+    Load a WAV file, convert it to a float tensor, resample to 16 kHz single-channel
+    audio.
+    """
+    # TensorFlow imports will only work if not using USE_TFLITE, that's why we import
+    # these here instead of at the top of the `sound_detector/audio.py` module.
+    import tensorflow as tf
+    import tensorflow_io as tfio
+
+    file_contents = tf.io.read_file(filename)
+    wav, sample_rate = tf.audio.decode_wav(file_contents, desired_channels=1)
+    wav = tf.squeeze(wav, axis=-1)
+    sample_rate = tf.cast(sample_rate, dtype=tf.int64)
+    wav = tfio.audio.resample(wav, rate_in=sample_rate, rate_out=16000)
+    return wav
+
+
 class RetrainedModel:
     """
     Wrapper to train and use the binary classification model specific for high-heels.
@@ -25,27 +85,46 @@ class RetrainedModel:
         os.path.dirname(__file__), "custom", "retrained.tflite"
     )
 
-    def __init__(self):
+    # The student of `sound_detector/distill.py`, with the same inputs and outputs.
+    distilled_saved_model_path = os.path.join(
+        os.path.dirname(__file__), "custom", "distilled_saved_model"
+    )
+    distilled_tflite_model_path = os.path.join(
+        os.path.dirname(__file__), "custom", "distilled.tflite"
+    )
+
+    def __init__(self, variant: Optional[str] = None):
+        """
+        Args:
+            variant: The model files to load, "retrained" or "distilled". Defaults to
+                `RETRAINED_MODEL_VARIANT`.
+        """
         self.initialized = False
 
+        self.variant = variant or config.retrained_model_variant
+        if self.variant == "distilled":
+            self.saved_model_path = self.distilled_saved_model_path
+            self.tflite_model_path = self.distilled_tflite_model_path
+        self.retrain_command = "python main.py retrain" + (
+            " --distill" if self.variant == "distilled" else ""
+        )
+
     def initialize(self):
         if config.use_tflite:
             if not os.path.exists(self.tflite_model_path):
                 raise TaconezException(
                     "The 'TFLite' model file for the retrained model does not exist. "
                     "You might probably need to retrain the model to generate one with "
-                    "`python main.py retrain` or by calling `.build_and_retrain()` "
+                    f"`{self.retrain_command}` or by calling `.build_and_retrain()` "
                     "method on the `RetrainedModel` instance."
                 )
-            import tflite_runtime.interpreter as tflite
-
-            self.model = tflite.Interpreter(self.tflite_model_path)
+            self.model = load_tflite_interpreter(self.tflite_model_path)
         else:
             if not os.path.exists(self.saved_model_path):
                 raise TaconezException(
                     "The 'saved_model' model file for the retrained model does not exist. "
                     "You might probably need to retrain the model to generate one with "
-                    "`python main.py retrain` or by calling `.build_and_retrain()` "
+                    f"`{self.retrain_command}` or by calling `.build_and_retrain()` "
                     "method on the `RetrainedModel` instance."
                 )
             self.model = tf.saved_model.load(self.saved_model_path)
@@ -56,7 +135,7 @@ class RetrainedModel:
     def predict(self, waveform: NDArray) -> float:
         """
         Given a waveform, run inference on the retrained model and return the prediction
-        as an unnormalized score.
+        as an unnormalized score, a NumPy scalar either way (like `RemoteModel`).
         """
         if config.use_tflite:
             interpreter = self.model
@@ -64,12 +143,12 @@ class RetrainedModel:
             output = signature(audio=waveform)
             top_score = output["classifier"][0]
 
-            logging.debug(f"Top score (high-heel) (tflite): {top_score}")
+            logging.debug("Top score (high-heel) (tflite): %s", top_score)
             prediction = top_score
         else:
-            output = self.model(waveform)[0]
+            output = self.model(waveform)[0].numpy()
 
-            logging.debug(f"Output (high-heel) (saved_model): {output}")
+            logging.debug("Output (high-heel) (saved_model): %s", output)
             prediction = output
 
         return prediction
@@ -88,22 +167,7 @@ class RetrainedModel:
         logging.info("Building and retraining model...")
 
         train_ds, val_ds, test_ds = self.prepare_datasets()
-        retrained_model = tf.keras.Sequential(
-            [
-                tf.keras.layers.Input(
-                    shape=(1024), dtype=tf.float32, name="input_embedding"
-                ),
-                tf.keras.layers.Dense(512, activation="relu"),
-                tf.keras.layers.Dense(200, activation="relu"),
-                tf.keras.layers.Dense(1),
-            ],
-            name="retrained_model",
-        )
-        retrained_model.compile(
-            loss=tf.keras.losses.BinaryCrossentropy(from_logits=True),
-            optimizer="adam",
-            metrics=["accuracy"],
-        )
+        retrained_model = build_head()
 
         callback = tf.keras.callbacks.EarlyStopping(
             monitor="loss", patience=3, restore_best_weights=True
@@ -164,30 +228,47 @@ class RetrainedModel:
         with open(self.tflite_model_path, "wb") as f:
             f.write(tflite_model)
 
+    def extract_embeddings(self) -> Tuple[NDArray, NDArray, NDArray]:
+        """Runs YAMNet over every file of the dataset, once, for training heads on it.
+
+        Returns:
+            The embeddings of shape (N, 1024), their labels (1 for high heels) and the
+            index of the file each one comes from, so embeddings of the same recording
+            can be kept in the same fold.
+        """
+        import tensorflow as tf
+
+        yamnet_model = YAMNetModel()
+        yamnet_model.initialize()
+
+        embeddings: List[NDArray] = []
+        labels: List[NDArray] = []
+        file_indices: List[NDArray] = []
+
+        file_index = 0
+        for label, dataset_dir in dataset_dirs.items():
+            for file_path in sorted(tf.io.gfile.glob(f"{dataset_dir}/*.wav")):
+                file_embeddings = yamnet_model.predict(
+                    load_wav_16k_mono(file_path), return_embeddings=True
+                ).numpy()
+                embeddings.append(file_embeddings)
+                labels.append(np.full(len(file_embeddings), label, dtype=np.float32))
+                file_indices.append(np.full(len(file_embeddings), file_index))
+                file_index += 1
+
+        logging.info(f"Extracted embeddings of {file_index} files.")
+
+        return (
+            np.concatenate(embeddings).astype(np.float32),
+            np.concatenate(labels),
+            np.concatenate(file_indices),
+        )
+
     def prepare_datasets(self):
         import tensorflow as tf
-        import tensorflow_io as tfio
-
-        # TensorFlow imports will only work if not using USE_TFLITE, and since this
-        # method `prepare_datasets` will always be run under USE_TFLITE=1 that's why
-        # why we import these here instead of at the top of the `sound_detector/audio.py`
-        # module.
-        @tf.function
-        def load_wav_16k_mono(filename):
-            """
-            Load a WAV file, convert it to a float tensor, resample to 16 kHz
-            single-channel audio.
-            """
-            file_contents = tf.io.read_file(filename)
-            wav, sample_rate = tf.audio.decode_wav(file_contents, desired_channels=1)
-            wav = tf.squeeze(wav, axis=-1)
-            sample_rate = tf.cast(sample_rate, dtype=tf.int64)
-            wav = tfio.audio.resample(wav, rate_in=sample_rate, rate_out=16000)
-            return wav
-
-        app_root = os.path.join(os.path.dirname(__file__), "..", "..", "..")
-        pos_dir = os.path.join(app_root, "dataset", "positive")
-        neg_dir = os.path.join(app_root, "dataset", "negative")
+
+        pos_dir = dataset_dirs[1]
+        neg_dir = dataset_dirs[0]
 
         pos = tf.data.Dataset.list_files(pos_dir + os.path.sep + "*.wav").map(
             load_wav_16k_mono
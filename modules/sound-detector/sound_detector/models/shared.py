@@ -0,0 +1,136 @@
+"""
+Loading of TFLite models so their weights are shared across processes.
+
+A model is never mapped from the file it's loaded from, which a retrain or a deploy may
+replace in place (`cp`, `scp`), changing or truncating the pages the running interpreter
+has mapped (SIGBUS) before the hot swap gets to validate the new model. It's mapped from
+a copy named after the hash of its contents instead, which is never written again.
+
+Every retrain publishes a new copy, so only the latest `MODEL_COPIES_TO_KEEP` of each
+model are kept. Deleting a copy a process still has mapped is safe: its pages stay
+until the process unmaps it (e.g. when it swaps to the new one).
+"""
+
+import hashlib
+import logging
+import os
+import re
+import tempfile
+
+from sound_detector.config import config
+
+
+def load_tflite_interpreter(model_path: str):
+    """Creates a TFLite interpreter that memory-maps the model file.
+
+    Never read the model into a `bytes` object and pass it as `model_content`: that
+    would be a private copy per process, whereas a model loaded from a path is mapped
+    read-only and its pages are shared by every process mapping the same file.
+
+    Args:
+        model_path: The path to the `.tflite` file.
+
+    Returns:
+        A `tflite.Interpreter` (tensors not allocated yet).
+    """
+    import tflite_runtime.interpreter as tflite
+
+    model_path = publish_model_copy(
+        model_path, config.model_shared_memory_dir or config.model_copy_dir
+    )
+
+    op_resolver_type = tflite.OpResolverType.AUTO
+    if not config.tflite_xnnpack:
+        op_resolver_type = tflite.OpResolverType.BUILTIN_WITHOUT_DEFAULT_DELEGATES
+
+    logging.info(f"Memory-mapping TFLite model {model_path}.")
+    return tflite.Interpreter(
+        model_path=model_path, experimental_op_resolver_type=op_resolver_type
+    )
+
+
+def publish_model_copy(model_path: str, copy_dir: str) -> str:
+    """Copies the model to `copy_dir` unless a process already did.
+
+    The copy is named after the hash of its contents, so a retrained model gets a new
+    file instead of changing the one other processes have mapped, and it's renamed in
+    place only once fully written so no process maps a partial file. The hash is of the
+    bytes copied, so a model file being rewritten meanwhile can't be published under
+    the hash of other contents (it fails to validate instead).
+
+    Returns:
+        The path of the copy.
+    """
+    os.makedirs(copy_dir, exist_ok=True)
+
+    sha256 = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(dir=copy_dir, delete=False) as f:
+        try:
+            with open(model_path, "rb") as model_file:
+                for block in iter(lambda: model_file.read(1 << 20), b""):
+                    sha256.update(block)
+                    f.write(block)
+        except OSError:
+            os.remove(f.name)
+            raise
+
+    name, extension = os.path.splitext(os.path.basename(model_path))
+    copy_path = os.path.join(copy_dir, f"{name}-{sha256.hexdigest()[:16]}{extension}")
+
+    if os.path.exists(copy_path):
+        os.remove(f.name)
+        # Marks it as the latest copy, for `prune_model_copies`.
+        os.utime(copy_path)
+    else:
+        # Temporary files are only readable by their owner, and the copy is shared
+        # with processes that may run as other users.
+        os.chmod(f.name, 0o644)
+        os.replace(f.name, copy_path)
+        logging.info(f"Copied {model_path} to {copy_path}.")
+        prune_model_copies(name, extension, copy_dir)
+
+    return copy_path
+
+
+def prune_model_copies(name: str, extension: str, copy_dir: str):
+    """Deletes all but the latest `MODEL_COPIES_TO_KEEP` copies of a model."""
+    copy_name_pattern = re.compile(
+        rf"{re.escape(name)}-[0-9a-f]{{16}}{re.escape(extension)}"
+    )
+    copies = []
+    for file_name in os.listdir(copy_dir):
+        if copy_name_pattern.fullmatch(file_name):
+            copy_path = os.path.join(copy_dir, file_name)
+            try:
+                copies.append((os.path.getmtime(copy_path), copy_path))
+            except FileNotFoundError:
+                # Another process pruned it first.
+                pass
+
+    copies.sort(reverse=True)
+    for _, copy_path in copies[max(config.model_copies_to_keep, 1) :]:
+        try:
+            os.remove(copy_path)
+            logging.info(f"Deleted the old model copy {copy_path}.")
+        except FileNotFoundError:
+            pass
+
+
+def file_sha256(path: str) -> str:
+    """Hashes the contents of a file, or of every file under a directory."""
+    sha256 = hashlib.sha256()
+
+    paths = [path]
+    if os.path.isdir(path):
+        paths = sorted(
+            os.path.join(root, name)
+            for root, _, names in os.walk(path)
+            for name in names
+        )
+
+    for file_path in paths:
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha256.update(block)
+
+    return sha256.hexdigest()
@@ -10,10 +10,44 @@ import tarfile
 import urllib.request
 import zipfile
 
+from typing import List, NamedTuple
+
 from numpy.typing import NDArray
 
 from sound_detector.config import config
 from sound_detector.exceptions import TaconezException
+from sound_detector.models.shared import load_tflite_interpreter
+
+
+class LabelMasks(NamedTuple):
+    """
+    Precomputed lookups of the configured sounds over the class names, so they don't
+    have to be searched by name on every window.
+    """
+
+    # Names and class indices of the `MULTICLASS_DETECT_SOUNDS`.
+    detect_sounds: List[str]
+    detect_indices: NDArray
+
+    # Whether each class is in the `.multiclass-ignore-sounds` list.
+    ignore_mask: NDArray
+
+
+def build_label_masks(class_names: List[str]) -> LabelMasks:
+    detect_sounds = []
+    for name in config.multiclass_detect_sounds:
+        if name in class_names:
+            detect_sounds.append(name)
+        else:
+            logging.warning(f"Ignoring unknown sound to detect '{name}'.")
+
+    return LabelMasks(
+        detect_sounds=detect_sounds,
+        detect_indices=np.array(
+            [class_names.index(name) for name in detect_sounds], dtype=np.int64
+        ),
+        ignore_mask=np.isin(class_names, config.multiclass_ignore_sounds),
+    )
 
 
 class YAMNetModel:
@@ -34,8 +68,13 @@ class YAMNetModel:
         else:
             self._initialize_full_model()
 
+        self.rebuild_label_masks()
         self.initialized = True
 
+    def rebuild_label_masks(self):
+        """Swaps in new label masks, e.g. after the settings are reloaded."""
+        self.label_masks = build_label_masks(self.class_names)
+
     def predict(self, waveform: NDArray, return_embeddings=False) -> NDArray:
         """
         Guesses the sound category given some audio.
@@ -108,9 +147,7 @@ class YAMNetModel:
         )
         class_names = [lab.decode("utf-8").strip() for lab in labels_file.readlines()]
 
-        import tflite_runtime.interpreter as tflite
-
-        interpreter = tflite.Interpreter(self.tflite_model_path)
+        interpreter = load_tflite_interpreter(self.tflite_model_path)
 
         input_details = interpreter.get_input_details()
         waveform_input_index = input_details[0]["index"]
@@ -0,0 +1,134 @@
+"""
+Profiling and memory-tracking hooks for long-running detectors.
+"""
+
+import cProfile
+import glob
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+from datetime import datetime
+from typing import List, Optional
+
+from sound_detector.config import config
+
+
+class Profiler:
+    """Periodically profiles the inference loop and tracks its memory.
+
+    The loop calls `start_cycle` and `end_cycle` around the processing of each cycle (a
+    batch, or a window when streaming), after its audio is recorded, so the time spent
+    waiting for the audio is left out. Three kinds of files are written to
+    `PROFILING_DIR`:
+
+    - `cycle-<timestamp>.prof`: One in every `PROFILING_SAMPLE_EVERY` cycles is run
+      under `cProfile`, which traces every call of that cycle (it's deterministic, not
+      a sampling profiler, so it slows the cycle down, and its timings of tiny hot
+      functions are inflated). Open them with `pstats` or `snakeviz`.
+    - `tracemalloc-<timestamp>.txt`: The allocation sites that grew the most since the
+      previous snapshot, every `PROFILING_SNAPSHOT_SECONDS`.
+    - `cycles-<timestamp>.txt`: Duration and allocated blocks delta of the cycles in
+      that same interval, for spotting latency spikes and leaking cycles.
+
+    When `PROFILING` is off the loop gets no profiler at all, so the only cost is
+    checking it for `None`.
+    """
+
+    # Allocation sites to list in each snapshot diff.
+    top_allocations = 30
+
+    def __init__(self):
+        os.makedirs(config.profiling_dir, exist_ok=True)
+
+        self.cycle_count = 0
+        self.profile_requested = False
+        self.cycle_profile: Optional[cProfile.Profile] = None
+        self.cycle_started_at = 0.0
+        self.cycle_blocks = 0
+
+        # (duration in seconds, allocated blocks delta) of the cycles since the last
+        # snapshot.
+        self.cycle_stats: List[tuple] = []
+
+        tracemalloc.start(config.profiling_traceback_frames)
+        self.snapshot = tracemalloc.take_snapshot()
+        self.snapshot_taken_at = time.monotonic()
+
+        logging.info(f"[Profiler] Writing profiles to {config.profiling_dir}.")
+
+    def profile_next_cycle(self):
+        """Runs the next cycle under the profiler regardless of the sampling."""
+        self.profile_requested = True
+
+    def start_cycle(self):
+        self.cycle_count += 1
+
+        if (
+            self.profile_requested
+            or self.cycle_count % config.profiling_sample_every == 0
+        ):
+            self.profile_requested = False
+            self.cycle_profile = cProfile.Profile()
+            self.cycle_profile.enable()
+
+        self.cycle_blocks = sys.getallocatedblocks()
+        self.cycle_started_at = time.perf_counter()
+
+    def end_cycle(self):
+        duration = time.perf_counter() - self.cycle_started_at
+        self.cycle_stats.append(
+            (duration, sys.getallocatedblocks() - self.cycle_blocks)
+        )
+
+        if self.cycle_profile:
+            self.cycle_profile.disable()
+            self.cycle_profile.dump_stats(self._new_file_path("cycle", "prof"))
+            self.cycle_profile = None
+
+        if (
+            time.monotonic() - self.snapshot_taken_at
+            >= config.profiling_snapshot_seconds
+        ):
+            self.write_snapshot()
+
+    def write_snapshot(self):
+        """Writes the allocations diff against the previous snapshot and cycle stats."""
+        # Leave out the memory used by the snapshots themselves.
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)]
+        )
+        differences = snapshot.compare_to(self.snapshot, "lineno")
+        current, peak = tracemalloc.get_traced_memory()
+
+        with open(self._new_file_path("tracemalloc", "txt"), "w") as f:
+            f.write(f"Traced memory: {current} bytes (peak {peak} bytes)\n")
+            for difference in differences[: self.top_allocations]:
+                f.write(f"{difference}\n")
+
+        with open(self._new_file_path("cycles", "txt"), "w") as f:
+            f.write("duration_seconds allocated_blocks_delta\n")
+            for duration, blocks in self.cycle_stats:
+                f.write(f"{duration:.6f} {blocks}\n")
+
+        logging.info(
+            f"[Profiler] Traced memory {current / 1e6:.1f} MB over "
+            f"{len(self.cycle_stats)} cycles."
+        )
+
+        self.snapshot = snapshot
+        self.snapshot_taken_at = time.monotonic()
+        self.cycle_stats = []
+
+    def _new_file_path(self, kind: str, extension: str) -> str:
+        """Returns the path for a new file, deleting the oldest ones of the same kind."""
+        existing_paths = sorted(
+            glob.glob(os.path.join(config.profiling_dir, f"{kind}-*.{extension}"))
+        )
+        for path in existing_paths[: -(config.profiling_max_files - 1) or None]:
+            os.remove(path)
+
+        timestamp = datetime.now().strftime("%Y-%m-%dT%H-%M-%S.%f")
+        return os.path.join(config.profiling_dir, f"{kind}-{timestamp}.{extension}")
@@ -0,0 +1,294 @@
+"""
+Append-only index of the detected recordings, to find them without walking the share.
+
+With `RECORDINGS_INDEX` every recording saved by `write_audio` is also appended as a
+fixed-width record (see `record_dtype`) to the `index.bin` of its day folder, e.g.
+`recordings/2024/01/27/index.bin`, and its path relative to the recordings folder to
+`index.paths`, which the record points into. Both are only ever appended to (but for a
+record cut by a crash), under an exclusive lock of `index.bin` since several nodes write
+to the same share, so `index.bin` can be memory-mapped as is:
+
+    from sound_detector.recordings_index import query_recordings
+    records, paths = query_recordings(
+        datetime(2024, 1, 20), datetime(2024, 1, 27), sound="high_heel", min_score=0.8
+    )
+
+The records are found by binary search on their time within each day. The machine and
+the class of a record are stored as the CRC-32 of their names, so they are compared as
+integers. The metadata comes from the file names as built by `save_and_notify_detection`,
+`<timestamp>_<machine>_<class>-<score>.wav`, so recordings saved before the index existed
+are indexed by `python main.py reindex`.
+"""
+
+import fcntl
+import logging
+import os
+import re
+import wave
+import zlib
+
+from datetime import datetime, timedelta
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from numpy.typing import NDArray
+
+from sound_detector.config import config
+
+index_file_name = "index.bin"
+paths_file_name = "index.paths"
+
+record_dtype = np.dtype(
+    [
+        # Unix time of the recording, from its file name.
+        ("time", "<f8"),
+        # CRC-32 of the machine id and of the class slug, see `name_id`.
+        ("machine_id", "<u4"),
+        ("class_id", "<u4"),
+        ("score", "<f4"),
+        # Seconds of audio and bytes of the file.
+        ("duration", "<f4"),
+        ("size", "<u8"),
+        # Where the path relative to the recordings folder is in `index.paths`.
+        ("path_offset", "<u8"),
+        ("path_length", "<u2"),
+    ]
+)
+
+# E.g. '2024-01-27T10-19-36_rpi_high_heel-6.100.wav'. Machine ids can't have
+# underscores (see `machine_id_pattern`), unlike the class slugs.
+file_name_pattern = re.compile(
+    r"^(?P<timestamp>\d{4}-\d{2}-\d{2}T\d{2}-\d{2}-\d{2})_(?P<machine>[^_]+)_"
+    r"(?P<sound>.+)-(?P<score>-?\d+(\.\d+)?)\.wav$"
+)
+
+
+class RecordingInfo(NamedTuple):
+    time: float
+    machine: str
+    sound: str
+    score: float
+
+
+def name_id(name: str) -> int:
+    return zlib.crc32(name.encode("utf-8"))
+
+
+def parse_file_name(file_name: str) -> Optional[RecordingInfo]:
+    """Reads the metadata of a recording from its file name, `None` if it has none."""
+    match = file_name_pattern.match(file_name)
+    if not match:
+        return None
+
+    # The timestamps are in the local time of the node that saved them.
+    time = datetime.strptime(match["timestamp"], "%Y-%m-%dT%H-%M-%S").timestamp()
+    return RecordingInfo(time, match["machine"], match["sound"], float(match["score"]))
+
+
+def build_record(
+    info: RecordingInfo, duration: float, size: int, path_offset: int, path_length: int
+) -> NDArray:
+    record = np.zeros(1, dtype=record_dtype)
+    record["time"] = info.time
+    record["machine_id"] = name_id(info.machine)
+    record["class_id"] = name_id(info.sound)
+    record["score"] = info.score
+    record["duration"] = duration
+    record["size"] = size
+    record["path_offset"] = path_offset
+    record["path_length"] = path_length
+    return record
+
+
+def append_recording(file_path: str, duration: float):
+    """Appends a recording saved in the recordings folder to its day's index."""
+    relative_path = os.path.relpath(file_path, config.detected_recordings_dir)
+    info = parse_file_name(os.path.basename(file_path))
+    if info is None or relative_path.startswith(os.pardir):
+        logging.debug("Not indexing %s, it's not a detected recording.", file_path)
+        return
+
+    day_dir = os.path.dirname(file_path)
+    encoded_path = relative_path.encode("utf-8")
+
+    with open(os.path.join(day_dir, index_file_name), "ab") as index_file:
+        fcntl.flock(index_file, fcntl.LOCK_EX)
+        try:
+            # Drops a record cut by a crash, which would shift every one after it.
+            index_size = os.fstat(index_file.fileno()).st_size
+            if index_size % record_dtype.itemsize:
+                os.ftruncate(
+                    index_file.fileno(), index_size - index_size % record_dtype.itemsize
+                )
+
+            with open(os.path.join(day_dir, paths_file_name), "ab") as paths_file:
+                path_offset = os.fstat(paths_file.fileno()).st_size
+                # The path goes first, so a record never points past the end.
+                paths_file.write(encoded_path + b"\n")
+
+            record = build_record(
+                info,
+                duration,
+                os.path.getsize(file_path),
+                path_offset,
+                len(encoded_path),
+            )
+            index_file.write(record.tobytes())
+        finally:
+            fcntl.flock(index_file, fcntl.LOCK_UN)
+
+
+def read_day_index(day_dir: str) -> Tuple[NDArray, Optional[bytes]]:
+    """Maps the records of a day, sorted by time, and reads its paths.
+
+    A record being written (or cut by a crash) at the end is left out, and the next
+    append drops it.
+    """
+    index_path = os.path.join(day_dir, index_file_name)
+    if not os.path.exists(index_path):
+        return np.zeros(0, dtype=record_dtype), None
+
+    num_records = os.path.getsize(index_path) // record_dtype.itemsize
+    if not num_records:
+        return np.zeros(0, dtype=record_dtype), None
+
+    records = np.memmap(index_path, dtype=record_dtype, mode="r", shape=(num_records,))
+
+    # Nodes append as they save, so a record can come slightly after a later one.
+    if np.any(np.diff(records["time"]) < 0):
+        records = records[np.argsort(records["time"], kind="stable")]
+
+    with open(os.path.join(day_dir, paths_file_name), "rb") as f:
+        paths = f.read()
+
+    return records, paths
+
+
+def query_recordings(
+    start: datetime,
+    end: datetime,
+    machine: Optional[str] = None,
+    sound: Optional[str] = None,
+    min_score: Optional[float] = None,
+    max_score: Optional[float] = None,
+    recordings_dir: Optional[str] = None,
+) -> Tuple[NDArray, List[str]]:
+    """Finds the recordings saved between two (local) times.
+
+    Returns:
+        The matching records, by time, and the path of each relative to the recordings
+        folder.
+    """
+    recordings_dir = recordings_dir or config.detected_recordings_dir
+    start_time, end_time = start.timestamp(), end.timestamp()
+
+    matches: List[NDArray] = []
+    paths: List[str] = []
+
+    day = start.date()
+    while day <= end.date():
+        records, day_paths = read_day_index(
+            os.path.join(recordings_dir, day.strftime("%Y/%m/%d"))
+        )
+        day += timedelta(days=1)
+        if not len(records):
+            continue
+
+        first, last = np.searchsorted(records["time"], [start_time, end_time], "left")
+        records = records[first:last]
+
+        mask = np.ones(len(records), dtype=bool)
+        if machine is not None:
+            mask &= records["machine_id"] == name_id(machine)
+        if sound is not None:
+            mask &= records["class_id"] == name_id(sound)
+        if min_score is not None:
+            mask &= records["score"] >= min_score
+        if max_score is not None:
+            mask &= records["score"] <= max_score
+
+        records = np.array(records[mask])
+        matches.append(records)
+        paths.extend(
+            day_paths[offset : offset + length].decode("utf-8")
+            for offset, length in zip(records["path_offset"], records["path_length"])
+        )
+
+    if not matches:
+        return np.zeros(0, dtype=record_dtype), []
+
+    return np.concatenate(matches), paths
+
+
+def rebuild_day_index(day_dir: str, recordings_dir: str) -> int:
+    """Rewrites the index of a day folder from its recordings.
+
+    Returns:
+        The number of recordings indexed.
+    """
+    infos = []
+    for file_name in os.listdir(day_dir):
+        info = parse_file_name(file_name)
+        if info:
+            infos.append((info, file_name))
+    infos.sort(key=lambda item: item[0].time)
+
+    records = np.zeros(len(infos), dtype=record_dtype)
+    paths = bytearray()
+    for i, (info, file_name) in enumerate(infos):
+        file_path = os.path.join(day_dir, file_name)
+        try:
+            with wave.open(file_path, "rb") as wave_file:
+                duration = wave_file.getnframes() / wave_file.getframerate()
+        except (wave.Error, EOFError) as e:
+            logging.warning(f"Indexing {file_path} without its duration: {e}")
+            duration = np.nan
+
+        relative_path = os.path.relpath(file_path, recordings_dir).encode("utf-8")
+        records[i] = build_record(
+            info, duration, os.path.getsize(file_path), len(paths), len(relative_path)
+        )[0]
+        paths += relative_path + b"\n"
+
+    index_path = os.path.join(day_dir, index_file_name)
+    with open(index_path, "ab") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            with open(os.path.join(day_dir, f"{paths_file_name}.tmp"), "wb") as f:
+                f.write(paths)
+            with open(f"{index_path}.tmp", "wb") as f:
+                records.tofile(f)
+            os.replace(
+                os.path.join(day_dir, f"{paths_file_name}.tmp"),
+                os.path.join(day_dir, paths_file_name),
+            )
+            os.replace(f"{index_path}.tmp", index_path)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    return len(records)
+
+
+def rebuild_index(recordings_dir: Optional[str] = None):
+    """Rewrites the index of every day folder of the recordings folder."""
+    recordings_dir = recordings_dir or config.detected_recordings_dir
+
+    num_days, num_recordings = 0, 0
+    for parts in sorted(_day_folders(recordings_dir)):
+        day_dir = os.path.join(recordings_dir, *parts)
+        num_recordings += rebuild_day_index(day_dir, recordings_dir)
+        num_days += 1
+
+    logging.info(f"Indexed {num_recordings} recordings of {num_days} days.")
+
+
+def _day_folders(recordings_dir: str) -> List[Tuple[str, str, str]]:
+    """The (year, month, day) folders of the recordings folder."""
+    day_folders = []
+    for root, dirs, _ in os.walk(recordings_dir):
+        parts = os.path.relpath(root, recordings_dir).split(os.sep)
+        if len(parts) == 3 and all(part.isdigit() for part in parts):
+            day_folders.append(tuple(parts))
+            dirs.clear()
+    return day_folders
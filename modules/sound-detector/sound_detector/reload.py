@@ -0,0 +1,66 @@
+"""
+Live reload of the runtime-tunable settings.
+"""
+
+import logging
+import os
+import signal
+import threading
+import time
+
+from typing import Dict, Optional
+
+from sound_detector.config import config
+
+
+class ConfigWatcher:
+    """Requests a settings reload upon SIGHUP or when the watched files change.
+
+    The reload itself is not done from the signal handler or the watcher thread but by
+    the inference loop calling `reload_if_requested` between batches, so the settings
+    and the label masks never change while a batch is being analyzed. The models stay
+    loaded.
+    """
+
+    def __init__(self):
+        self.reload_requested = threading.Event()
+        self.watched_paths = [
+            config.config_reload_env_file,
+            config.multiclass_ignore_sounds_path,
+        ]
+        self.modified_times = self._read_modified_times()
+
+        self.thread = threading.Thread(
+            target=self.periodically_watch_files, daemon=True
+        )
+
+    def start(self):
+        signal.signal(signal.SIGHUP, self._on_sighup)
+        self.thread.start()
+
+    def reload_if_requested(self) -> bool:
+        if not self.reload_requested.is_set():
+            return False
+
+        self.reload_requested.clear()
+        return config.reload()
+
+    def periodically_watch_files(self):
+        while True:
+            time.sleep(config.config_reload_poll_seconds)
+
+            modified_times = self._read_modified_times()
+            if modified_times != self.modified_times:
+                logging.info("[ConfigWatcher] Settings files changed, reloading.")
+                self.modified_times = modified_times
+                self.reload_requested.set()
+
+    def _on_sighup(self, signum, frame):
+        logging.info("[ConfigWatcher] Received SIGHUP, reloading.")
+        self.reload_requested.set()
+
+    def _read_modified_times(self) -> Dict[str, Optional[float]]:
+        return {
+            path: os.path.getmtime(path) if os.path.exists(path) else None
+            for path in self.watched_paths
+        }
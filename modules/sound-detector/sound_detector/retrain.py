@@ -4,11 +4,28 @@ Creates a new model from an existing one (YAMNet) and retrains it to detect high
 
 import logging
 
+from typing import Optional
+
+from sound_detector import distill, sweep
 from sound_detector.models.retrained import RetrainedModel
 
-def run():
+
+def run(
+    sweep_heads: bool = False,
+    folds: int = 5,
+    workers: Optional[int] = None,
+    distill_student: bool = False,
+):
     logging.info("Running retrain...")
-    
-    retrained_model = RetrainedModel()
+
+    if distill_student:
+        distill.run()
+        return
+
+    if sweep_heads:
+        sweep.run(num_folds=folds, workers=workers)
+        return
+
+    retrained_model = RetrainedModel(variant="retrained")
     retrained_model.build_and_retrain()
-    retrained_model.initialize()
\ No newline at end of file
+    retrained_model.initialize()
@@ -0,0 +1,116 @@
+"""
+In-memory aggregation of the per-window scores into periodic rollups.
+"""
+
+import time
+
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from slugify import slugify
+
+from sound_detector.config import config
+
+
+class ScoreRollup:
+    """Aggregates the scores of every analyzed window over an interval.
+
+    Writing a point per window and node would flood the database, so instead this keeps
+    a few counters that are flushed as a single point per interval:
+
+    - Count, max and mean of the score of every window (retrained score or the YAMNet
+      top class score).
+    - A histogram of those scores with the `SCORE_ROLLUP_BUCKETS` upper edges. The last
+      bucket counts the scores above the last edge.
+    - For YAMNet, how many times each class was the top class and its max score.
+
+    Example:
+
+    ```python
+    rollup = ScoreRollup()
+    rollup.add_scores([0.3, 5.5])
+    if rollup.is_due():
+        fields = rollup.flush()
+    ```
+    """
+
+    def __init__(self, num_classes: int = 0, class_names: Optional[List[str]] = None):
+        self.bucket_edges = np.array(config.score_rollup_buckets, dtype=np.float32)
+        self.class_names = class_names or []
+        self.num_classes = num_classes
+        self.reset()
+
+    def reset(self):
+        self.started_at = time.time()
+        self.count = 0
+        self.skipped = 0
+        self.total = 0.0
+        self.max = -np.inf
+        self.histogram = np.zeros(len(self.bucket_edges) + 1, dtype=np.int64)
+        self.class_counts = np.zeros(self.num_classes, dtype=np.int64)
+        self.class_max = np.zeros(self.num_classes, dtype=np.float32)
+
+    def add_scores(
+        self, scores: List[float], top_class_indices: Optional[List[int]] = None
+    ):
+        """Adds the scores of a batch of windows.
+
+        Args:
+            scores: The score of each window.
+            top_class_indices: For YAMNet, the index of the top class of each window,
+                to which the score corresponds.
+        """
+        if not len(scores):
+            return
+
+        scores = np.asarray(scores, dtype=np.float32)
+        self.count += scores.size
+        self.total += float(scores.sum())
+        self.max = max(self.max, float(scores.max()))
+        self.histogram += np.bincount(
+            np.searchsorted(self.bucket_edges, scores), minlength=self.histogram.size
+        )
+
+        if top_class_indices is not None and self.num_classes:
+            indices = np.asarray(top_class_indices, dtype=np.int64)
+            self.class_counts += np.bincount(indices, minlength=self.num_classes)
+            np.maximum.at(self.class_max, indices, scores)
+
+    def add_skipped(self, num_windows: int):
+        """Counts windows that were not analyzed (e.g. load shedding or feedback)."""
+        self.skipped += num_windows
+
+    def is_due(self) -> bool:
+        return time.time() - self.started_at >= config.score_rollup_interval
+
+    def flush(self) -> Dict[str, float]:
+        """Returns the fields of the rollup point and starts a new interval."""
+        fields = {
+            "interval": time.time() - self.started_at,
+            "count": self.count,
+            "skipped": self.skipped,
+        }
+
+        if self.count:
+            fields["max"] = self.max
+            fields["mean"] = self.total / self.count
+
+        edges = [f"{edge:g}" for edge in self.bucket_edges]
+        for i, bucket_count in enumerate(self.histogram):
+            name = f"le_{edges[i]}" if i < len(edges) else f"gt_{edges[-1]}"
+            fields[f"bucket_{name}"] = int(bucket_count)
+
+        top_indices = np.argsort(self.class_counts)[::-1][
+            : config.score_rollup_top_classes
+        ]
+        for i in top_indices:
+            if not self.class_counts[i]:
+                break
+            slug = slugify(self.class_names[i], separator="_")
+            fields[f"class_{slug}_count"] = int(self.class_counts[i])
+            fields[f"class_{slug}_max"] = float(self.class_max[i])
+
+        self.reset()
+
+        return fields
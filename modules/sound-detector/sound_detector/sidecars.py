@@ -0,0 +1,161 @@
+"""
+Compact summaries of the detected recordings for the journal to draw from.
+
+Next to every saved recording `<name>.wav` a `<name>.json` sidecar is written with:
+
+- `peaks`: The minimum and maximum sample of `SIDECAR_PEAKS` equal slices of the clip,
+  scaled to [-127, 127], enough to draw its waveform.
+- `mel`: A log-mel spectrogram thumbnail of `SIDECAR_MEL_BANDS` bands (lowest
+  frequency first) by `SIDECAR_MEL_FRAMES` frames. Its `values` are base64 encoded
+  bytes, row by row (one row per band), mapping `db_min` dB below the loudest bin to 0
+  and the loudest bin to 255.
+- `window_scores`: The score of each inference window of the clip, `null` for the
+  windows that were not analyzed (e.g. shed or after the detection).
+"""
+
+import base64
+import functools
+import json
+import logging
+import os
+import threading
+
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from numpy.typing import NDArray
+
+from sound_detector.config import config
+
+fft_size = 512
+mel_min_hz = 125.0
+mel_max_hz = 7500.0
+mel_db_range = 80.0
+
+
+def sidecar_path(recording_path: str) -> str:
+    return os.path.splitext(recording_path)[0] + ".json"
+
+
+def compute_peaks(pcm: NDArray, num_peaks: int) -> Dict[str, list]:
+    """Minimum and maximum of each of `num_peaks` equal slices, scaled to int8."""
+    slice_size = max(1, len(pcm) // num_peaks)
+    num_slices = len(pcm) // slice_size
+    slices = pcm[: num_slices * slice_size].reshape(num_slices, slice_size)
+
+    return {"min": to_int8(slices.min(axis=1)), "max": to_int8(slices.max(axis=1))}
+
+
+def to_int8(samples: NDArray) -> list:
+    # Flooring keeps -32768 at -128, so clip it to be symmetric.
+    return np.clip(samples.astype(np.int32) >> 8, -127, 127).tolist()
+
+
+def hz_to_mel(hz):
+    return 1127.0 * np.log1p(hz / 700.0)
+
+
+def mel_to_hz(mel):
+    return 700.0 * np.expm1(mel / 1127.0)
+
+
+@functools.lru_cache(maxsize=4)
+def mel_filterbank(num_bands: int, rate: int, fft_size: int = fft_size) -> NDArray:
+    """Triangular filters of shape (num_bands, fft_size // 2 + 1) on the HTK mel scale."""
+    edges_hz = mel_to_hz(
+        np.linspace(hz_to_mel(mel_min_hz), hz_to_mel(mel_max_hz), num_bands + 2)
+    )
+    bins_hz = np.fft.rfftfreq(fft_size, d=1 / rate)
+
+    lower, center, upper = edges_hz[:-2, None], edges_hz[1:-1, None], edges_hz[2:, None]
+    rising = (bins_hz - lower) / (center - lower)
+    falling = (upper - bins_hz) / (upper - center)
+    return np.maximum(0.0, np.minimum(rising, falling)).astype(np.float32)
+
+
+def compute_mel_thumbnail(
+    waveform: NDArray, num_bands: int, num_frames: int, rate: int
+) -> NDArray:
+    """Log-mel spectrogram of `num_frames` frames spread over the waveform, as uint8."""
+    if len(waveform) < fft_size:
+        waveform = np.pad(waveform, (0, fft_size - len(waveform)))
+
+    hop = max(1, (len(waveform) - fft_size) // max(1, num_frames - 1))
+    frames = np.lib.stride_tricks.sliding_window_view(waveform, fft_size)[::hop]
+    frames = frames[:num_frames] * np.hanning(fft_size).astype(np.float32)
+
+    power = np.abs(np.fft.rfft(frames, axis=1)) ** 2
+    mel_power = mel_filterbank(num_bands, rate) @ power.T
+
+    mel_db = 10 * np.log10(np.maximum(mel_power, 1e-10))
+    mel_db -= mel_db.max()
+    normalized = np.clip(mel_db + mel_db_range, 0, mel_db_range) / mel_db_range
+    return np.round(normalized * 255).astype(np.uint8)
+
+
+def compute_sidecar(
+    waveform_binary: bytes, window_scores: Optional[NDArray] = None
+) -> Dict[str, Any]:
+    pcm = np.frombuffer(waveform_binary, dtype=np.int16)
+    waveform = pcm.astype(np.float32) / 32768
+
+    mel = compute_mel_thumbnail(
+        waveform, config.sidecar_mel_bands, config.sidecar_mel_frames, config.audio_rate
+    )
+
+    sidecar = {
+        "version": 1,
+        "rate": config.audio_rate,
+        "duration": len(pcm) / config.audio_rate,
+        "peaks": compute_peaks(pcm, config.sidecar_peaks),
+        "mel": {
+            "bands": mel.shape[0],
+            "frames": mel.shape[1],
+            "db_min": -mel_db_range,
+            "values": base64.b64encode(mel.tobytes()).decode("ascii"),
+        },
+        "window_seconds": config.audio_inference_seconds,
+        "window_scores": None,
+    }
+
+    if window_scores is not None:
+        sidecar["window_scores"] = [
+            None if np.isnan(score) else round(float(score), 4)
+            for score in window_scores
+        ]
+
+    return sidecar
+
+
+def write_sidecar(
+    recording_path: str,
+    waveform_binary: bytes,
+    window_scores: Optional[NDArray] = None,
+):
+    """Writes the sidecar of a recording, replacing it in place once complete."""
+    path = sidecar_path(recording_path)
+    try:
+        sidecar = compute_sidecar(waveform_binary, window_scores)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(sidecar, f, separators=(",", ":"))
+        os.replace(f"{path}.tmp", path)
+    except Exception:
+        logging.exception(f"Could not write the sidecar {path}.")
+        return
+
+    logging.debug(f"Saved sidecar to {path}.")
+
+
+def write_sidecar_in_background(
+    recording_path: str,
+    waveform_binary: bytes,
+    window_scores: Optional[NDArray] = None,
+):
+    threading.Thread(
+        target=write_sidecar,
+        args=(recording_path, waveform_binary, window_scores),
+        daemon=True,
+    ).start()
@@ -0,0 +1,400 @@
+"""
+Sources the detector can record audio from, chosen with `AUDIO_SOURCE`:
+
+- `pyaudio`: The microphone, through PortAudio (the default).
+- `file:<path>`: A WAV file, read as fast as the detector consumes it. Useful for
+  replaying recordings faster than real time.
+- `pipe:<path>`: Raw PCM from a named pipe, or from stdin with `pipe:-`, e.g.
+  `arecord -f S16_LE -r 16000 -c 1 -t raw | python main.py inference`.
+- `unix:<path>`: Raw PCM from a UNIX stream socket.
+- `zmq:<endpoint>`: Raw PCM from the messages of a ZMQ PULL socket. It binds when the
+  endpoint has a wildcard (e.g. `zmq:tcp://*:5558`) and connects otherwise.
+
+Raw PCM must already be in the format the models expect: 16 kHz, mono, 16-bit signed
+little-endian samples.
+
+All of them fill int16 buffers handed by the caller (`AudioSource.readinto`), so no
+bytes are concatenated chunk after chunk while recording.
+"""
+
+import logging
+import socket
+import sys
+import threading
+import time
+import wave
+
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Deque, Dict, NamedTuple, Optional
+
+import numpy as np
+import zmq
+
+from numpy.typing import NDArray
+
+from sound_detector.config import config
+from sound_detector.exceptions import TaconezException
+
+
+class CaptureStats:
+    """Accounts for the audio lost to input overruns.
+
+    When the detector stalls (slow inference, NFS, the database) for longer than the
+    input buffer holds, the audio recorded meanwhile is lost. The samples that could
+    not be read are counted as dropped and the time of each overrun is kept, so missed
+    detections can be matched against pipeline stalls.
+    """
+
+    # Times of the last overruns to keep.
+    max_overrun_times = 100
+
+    def __init__(self):
+        self.total_overruns = 0
+        self.total_dropped_samples = 0
+        self.overrun_times: Deque[float] = deque(maxlen=self.max_overrun_times)
+        self.reset()
+
+    def reset(self):
+        """Starts a new interval for `flush`."""
+        self.overruns = 0
+        self.captured_samples = 0
+        self.dropped_samples = 0
+
+    def add_captured(self, num_samples: int):
+        self.captured_samples += num_samples
+
+    def add_overrun(self, num_samples: int, at: Optional[float] = None):
+        self.overruns += 1
+        self.dropped_samples += num_samples
+        self.total_overruns += 1
+        self.total_dropped_samples += num_samples
+        self.overrun_times.append(at or time.time())
+
+    @property
+    def overrun_rate(self) -> float:
+        """The fraction of the samples of the interval that were dropped."""
+        total_samples = self.captured_samples + self.dropped_samples
+        return self.dropped_samples / total_samples if total_samples else 0.0
+
+    def flush(self) -> Dict[str, float]:
+        """Returns the stats of the interval as fields for the database and resets it."""
+        fields = {
+            "capture_overruns": self.overruns,
+            "capture_dropped_samples": self.dropped_samples,
+            "capture_overrun_rate": self.overrun_rate,
+        }
+        if self.overrun_times:
+            fields["capture_last_overrun_at"] = self.overrun_times[-1]
+
+        self.reset()
+        return fields
+
+
+class AudioSource(ABC):
+    """Base class of the audio sources.
+
+    `start` and `stop` are called around each recording, since the batch loop does not
+    record while it runs inference. Sources that can't pause (all but the microphone)
+    keep flowing meanwhile and do nothing on them.
+
+    Sources that can tell when audio was lost account for it in `capture_stats`.
+    """
+
+    capture_stats: Optional[CaptureStats] = None
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def close(self):
+        pass
+
+    @abstractmethod
+    def readinto(self, buffer: NDArray) -> None:
+        """Fills the whole int16 buffer with the next samples.
+
+        Raises:
+            EOFError: If the source ended before the buffer was filled.
+        """
+
+
+class Gap(NamedTuple):
+    """Audio lost between two chunks of the microphone."""
+
+    num_samples: int
+    # Unix time it was lost at.
+    at: float
+
+
+class PyAudioSource(AudioSource):
+    """Records from the microphone, marking where audio was lost with silence.
+
+    The stream runs in callback mode: PortAudio hands every chunk to `_on_input` as soon
+    as it's captured, which buffers it for `readinto`. Audio is lost in two places:
+
+    - PortAudio overflows its own buffer (`paInputOverflow`) when the callback thread
+      doesn't run in time. The chunk it then hands over is still valid: the samples
+      were lost before it, so a gap is buffered ahead of the chunk, as long as the time
+      between the capture of both chunks (their ADC times) tells how many.
+    - The detector stalls (slow inference, NFS, the database) for longer than
+      `max_buffered_seconds`. The oldest chunks are then dropped for the new ones, so
+      once it catches up it reads the latest audio instead of a stale backlog.
+
+    Consecutive gaps are folded into one, so the buffer never holds more than
+    `max_buffered_seconds` of audio and a gap between each two chunks. A gap is
+    zero-filled where it happened, up to a window long (enough to keep the windows
+    around it apart), and accounted for in `capture_stats`.
+    """
+
+    max_buffered_seconds = 5.0
+
+    def __init__(self):
+        # Imported here so the other sources work without PortAudio installed.
+        import pyaudio
+
+        self.pyaudio_instance = pyaudio.PyAudio()
+        self.audio_format = pyaudio.get_format_from_width(config.audio_sample_width)
+        self.input_overflow = pyaudio.paInputOverflow
+        self.callback_continue = pyaudio.paContinue
+        self.stream = None
+        self.capture_stats = CaptureStats()
+        self.reset_buffer()
+
+    def reset_buffer(self):
+        # The chunks (as bytes) and gaps captured and not read yet, guarded by the
+        # condition `readinto` waits on for new ones.
+        self.chunks: Deque = deque()
+        self.chunks_added = threading.Condition()
+        self.num_chunks = 0
+        self.max_chunks = max(
+            1, int(self.max_buffered_seconds * config.audio_rate / config.audio_chunk)
+        )
+        # Samples of the last chunk that did not fit in the previous buffer.
+        self.pending = np.empty(0, dtype=np.int16)
+        # ADC time the next chunk should start at, if the host API reports them.
+        self.next_adc_time: Optional[float] = None
+
+    def start(self):
+        self.reset_buffer()
+        self.stream = self.pyaudio_instance.open(
+            format=self.audio_format,
+            channels=config.audio_channels,
+            rate=config.audio_rate,
+            input=True,
+            frames_per_buffer=config.audio_chunk,
+            stream_callback=self._on_input,
+        )
+
+    def stop(self):
+        self.stream.stop_stream()
+        self.stream.close()
+        self.stream = None
+
+    def close(self):
+        self.pyaudio_instance.terminate()
+
+    def _on_input(
+        self, in_data: bytes, frame_count: int, time_info: dict, status_flags: int
+    ):
+        """Buffers a chunk, with the gap before it if PortAudio lost audio."""
+        now = time.time()
+        adc_time = time_info.get("input_buffer_adc_time") or None
+
+        with self.chunks_added:
+            if status_flags & self.input_overflow:
+                lost_samples = 0
+                if adc_time and self.next_adc_time:
+                    lost_samples = int(
+                        round((adc_time - self.next_adc_time) * config.audio_rate)
+                    )
+                    lost_samples = max(lost_samples, 0)
+                # Added even when it's not known how much was lost, to count the
+                # overrun.
+                self._add_gap(Gap(lost_samples, now))
+
+            if self.num_chunks >= self.max_chunks:
+                self._drop_oldest_chunk(now)
+
+            self.chunks.append(in_data)
+            self.num_chunks += 1
+            self.chunks_added.notify()
+
+        self.next_adc_time = adc_time and adc_time + frame_count / config.audio_rate
+        return None, self.callback_continue
+
+    def _add_gap(self, gap: Gap):
+        """Buffers a gap, folding it into the last one if nothing came in between."""
+        if self.chunks and isinstance(self.chunks[-1], Gap):
+            last_gap = self.chunks.pop()
+            gap = Gap(last_gap.num_samples + gap.num_samples, last_gap.at)
+        self.chunks.append(gap)
+
+    def _drop_oldest_chunk(self, now: float):
+        """Turns the oldest chunk into a gap, folded with the gaps around it."""
+        gap = Gap(0, now)
+        if isinstance(self.chunks[0], Gap):
+            gap = self.chunks.popleft()
+
+        chunk = self.chunks.popleft()
+        self.num_chunks -= 1
+        gap = Gap(gap.num_samples + len(chunk) // config.audio_sample_width, gap.at)
+
+        if self.chunks and isinstance(self.chunks[0], Gap):
+            gap = Gap(gap.num_samples + self.chunks.popleft().num_samples, gap.at)
+        self.chunks.appendleft(gap)
+
+    def readinto(self, buffer: NDArray) -> None:
+        position = 0
+        while position < len(buffer):
+            if not len(self.pending):
+                with self.chunks_added:
+                    while not self.chunks:
+                        self.chunks_added.wait()
+                    chunk = self.chunks.popleft()
+                    if not isinstance(chunk, Gap):
+                        self.num_chunks -= 1
+
+                if isinstance(chunk, Gap):
+                    self.capture_stats.add_overrun(chunk.num_samples, chunk.at)
+                    logging.warning(
+                        f"Input overrun, lost {chunk.num_samples} samples "
+                        f"({self.capture_stats.total_overruns} overruns so far)."
+                    )
+                    self.pending = np.zeros(
+                        min(chunk.num_samples, config.audio_inference_samples),
+                        dtype=np.int16,
+                    )
+                else:
+                    self.pending = np.frombuffer(chunk, dtype=np.int16)
+                    self.capture_stats.add_captured(len(self.pending))
+
+            num_samples = min(len(self.pending), len(buffer) - position)
+            buffer[position : position + num_samples] = self.pending[:num_samples]
+            self.pending = self.pending[num_samples:]
+            position += num_samples
+
+
+class WavFileSource(AudioSource):
+    def __init__(self, path: str):
+        self.wave_file = wave.open(path, "rb")
+
+        params = (
+            self.wave_file.getframerate(),
+            self.wave_file.getnchannels(),
+            self.wave_file.getsampwidth(),
+        )
+        expected_params = (
+            config.audio_rate,
+            config.audio_channels,
+            config.audio_sample_width,
+        )
+        if params != expected_params:
+            raise TaconezException(
+                f"The WAV file {path} has (rate, channels, sample width) {params} but "
+                f"{expected_params} is needed."
+            )
+
+    def close(self):
+        self.wave_file.close()
+
+    def readinto(self, buffer: NDArray) -> None:
+        data = self.wave_file.readframes(len(buffer))
+        if len(data) < buffer.nbytes:
+            raise EOFError("Reached the end of the WAV file.")
+        buffer[:] = np.frombuffer(data, dtype=np.int16)
+
+
+class PipeSource(AudioSource):
+    def __init__(self, path: str):
+        if path == "-":
+            self.file = sys.stdin.buffer.raw
+        else:
+            self.file = open(path, "rb", buffering=0)
+
+    def close(self):
+        self.file.close()
+
+    def readinto(self, buffer: NDArray) -> None:
+        view = memoryview(buffer).cast("B")
+        position = 0
+        while position < len(view):
+            num_bytes = self.file.readinto(view[position:])
+            if not num_bytes:
+                raise EOFError("The pipe was closed.")
+            position += num_bytes
+
+
+class UnixSocketSource(AudioSource):
+    def __init__(self, path: str):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(path)
+
+    def close(self):
+        self.socket.close()
+
+    def readinto(self, buffer: NDArray) -> None:
+        view = memoryview(buffer).cast("B")
+        position = 0
+        while position < len(view):
+            num_bytes = self.socket.recv_into(view[position:])
+            if not num_bytes:
+                raise EOFError("The socket was closed.")
+            position += num_bytes
+
+
+class ZMQSource(AudioSource):
+    def __init__(self, endpoint: str, context: Optional[zmq.Context] = None):
+        self.socket = (context or zmq.Context.instance()).socket(zmq.PULL)
+        if "*" in endpoint:
+            self.socket.bind(endpoint)
+        else:
+            self.socket.connect(endpoint)
+
+        # Samples of the last message that did not fit in the previous buffer.
+        self.pending = np.empty(0, dtype=np.int16)
+
+    def close(self):
+        self.socket.close()
+
+    def readinto(self, buffer: NDArray) -> None:
+        position = 0
+        while position < len(buffer):
+            if not len(self.pending):
+                frame = self.socket.recv(copy=False)
+                if len(frame.buffer) % 2:
+                    # Not whole 16-bit samples, so it can't be told where they start.
+                    logging.warning(
+                        f"Dropped a ZMQ audio message of {len(frame.buffer)} bytes, "
+                        "an odd length."
+                    )
+                    continue
+                self.pending = np.frombuffer(frame.buffer, dtype=np.int16)
+
+            num_samples = min(len(self.pending), len(buffer) - position)
+            buffer[position : position + num_samples] = self.pending[:num_samples]
+            self.pending = self.pending[num_samples:]
+            position += num_samples
+
+
+def open_audio_source(spec: Optional[str] = None) -> AudioSource:
+    """Creates the audio source described by `spec`, `AUDIO_SOURCE` by default."""
+    spec = spec or config.audio_source
+    kind, _, location = spec.partition(":")
+
+    logging.info(f"Recording audio from '{spec}'.")
+
+    if kind == "pyaudio":
+        return PyAudioSource()
+    if kind == "file":
+        return WavFileSource(location)
+    if kind == "pipe":
+        return PipeSource(location)
+    if kind == "unix":
+        return UnixSocketSource(location)
+    if kind == "zmq":
+        return ZMQSource(location)
+
+    raise TaconezException(f"Unknown audio source '{spec}'.")
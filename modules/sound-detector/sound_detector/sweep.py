@@ -0,0 +1,251 @@
+"""
+Cross-validated hyperparameter sweep for the head of the retrained model.
+
+Training the head is cheap once YAMNet has turned the dataset into embeddings, so they
+are extracted once and every (configuration, fold) pair is trained in its own process
+with a single TensorFlow thread, using all the cores at once. The folds are stratified
+by label and grouped by recording, so embeddings of the same recording never end up
+both in training and validation.
+
+Each configuration is scored on the predictions every fold made for the embeddings it
+left out (out-of-fold predictions), which also gives the threshold to recommend for
+`RETRAINED_MODEL_OUTPUT_THRESHOLD`. The best configuration is then trained on the whole
+dataset and saved as the retrained model.
+"""
+
+import itertools
+import logging
+import multiprocessing
+import os
+import statistics
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from numpy.typing import NDArray
+
+from sound_detector.models.retrained import RetrainedModel, build_head
+
+embeddings_path = os.path.join(
+    os.path.dirname(RetrainedModel.saved_model_path), "embeddings.npz"
+)
+
+hidden_layers_grid = [(512, 200), (512,), (256,), (128,)]
+learning_rate_grid = [0.001, 0.0003]
+
+max_epochs = 20
+
+# Set in each worker process by `_load_worker_dataset`.
+_worker_dataset: Optional[Dict[str, NDArray]] = None
+
+
+class HeadConfig(NamedTuple):
+    hidden_layers: Tuple[int, ...]
+    learning_rate: float
+
+
+class SweepResult(NamedTuple):
+    head_config: HeadConfig
+    f1: float
+    precision: float
+    recall: float
+    threshold: float
+    epochs: int
+
+
+def assign_folds(
+    labels: NDArray, file_indices: NDArray, num_folds: int, seed: int = 0
+) -> NDArray:
+    """Deals the recordings of each label to the folds in turns, in random order.
+
+    Returns:
+        The fold of every embedding.
+    """
+    rng = np.random.default_rng(seed)
+    file_folds = {}
+    for label in np.unique(labels):
+        label_files = rng.permutation(np.unique(file_indices[labels == label]))
+        for position, file_index in enumerate(label_files):
+            file_folds[file_index] = position % num_folds
+
+    return np.array([file_folds[file_index] for file_index in file_indices])
+
+
+def best_threshold(
+    scores: NDArray, labels: NDArray
+) -> Tuple[float, float, float, float]:
+    """Finds the threshold maximizing F1 in one pass over the scores sorted descending.
+
+    Cutting the sorted scores after position k marks the first k as positive, so the
+    true positives of every possible cut are the cumulative sum of the sorted labels.
+
+    Returns:
+        The F1, precision and recall at the best threshold and the threshold itself,
+        halfway between the last score marked positive and the next one.
+    """
+    order = np.argsort(-scores, kind="stable")
+    sorted_scores = scores[order]
+    true_positives = np.cumsum(labels[order])
+    predicted_positives = np.arange(1, len(scores) + 1)
+
+    precision = true_positives / predicted_positives
+    recall = true_positives / max(labels.sum(), 1)
+    with np.errstate(invalid="ignore"):
+        f1 = np.nan_to_num(2 * precision * recall / (precision + recall))
+
+    # Only cut between different scores, otherwise the threshold can't tell them apart.
+    distinct = np.append(sorted_scores[:-1] > sorted_scores[1:], True)
+    f1 = np.where(distinct, f1, -1)
+
+    k = int(np.argmax(f1))
+    next_score = sorted_scores[k + 1] if k + 1 < len(scores) else sorted_scores[k] - 1
+    threshold = float((sorted_scores[k] + next_score) / 2)
+
+    return float(f1[k]), float(precision[k]), float(recall[k]), threshold
+
+
+def _load_worker_dataset(path: str):
+    global _worker_dataset
+
+    import tensorflow as tf
+
+    # One thread per process, the parallelism comes from the pool.
+    tf.config.threading.set_intra_op_parallelism_threads(1)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+    with np.load(path) as dataset:
+        _worker_dataset = dict(dataset)
+
+
+def _train_fold(
+    head_config: HeadConfig, validation_fold: int
+) -> Tuple[HeadConfig, int, NDArray, int]:
+    """Trains a head leaving a fold out and predicts that fold with it.
+
+    The early stopping watches the next fold, which is also left out of the training,
+    so the fold that is scored never decides when the training stops.
+    """
+    import tensorflow as tf
+
+    embeddings = _worker_dataset["embeddings"]
+    labels = _worker_dataset["labels"]
+    folds = _worker_dataset["folds"]
+    validation = folds == validation_fold
+    early_stopping = folds == (validation_fold + 1) % (folds.max() + 1)
+    training = ~(validation | early_stopping)
+
+    head = build_head(head_config.hidden_layers, head_config.learning_rate)
+    history = head.fit(
+        embeddings[training],
+        labels[training],
+        batch_size=16,
+        epochs=max_epochs,
+        validation_data=(embeddings[early_stopping], labels[early_stopping]),
+        callbacks=tf.keras.callbacks.EarlyStopping(
+            monitor="val_loss", patience=3, restore_best_weights=True
+        ),
+        verbose=0,
+    )
+    epochs = int(np.argmin(history.history["val_loss"])) + 1
+
+    scores = head.predict(embeddings[validation], verbose=0)[:, 0]
+    return head_config, validation_fold, scores, epochs
+
+
+def run_sweep(
+    embeddings: NDArray,
+    labels: NDArray,
+    file_indices: NDArray,
+    num_folds: int = 5,
+    workers: Optional[int] = None,
+) -> List[SweepResult]:
+    """Cross-validates every head configuration of the grid in a process pool.
+
+    Returns:
+        A result per configuration, best first.
+    """
+    # A fold is scored and another one stops the training, see `_train_fold`.
+    assert num_folds >= 3, "The sweep needs at least 3 folds."
+
+    folds = assign_folds(labels, file_indices, num_folds)
+    np.savez(embeddings_path, embeddings=embeddings, labels=labels, folds=folds)
+
+    head_configs = [
+        HeadConfig(hidden_layers, learning_rate)
+        for hidden_layers, learning_rate in itertools.product(
+            hidden_layers_grid, learning_rate_grid
+        )
+    ]
+    tasks = list(itertools.product(head_configs, range(num_folds)))
+
+    workers = workers or os.cpu_count()
+    logging.info(
+        f"Training {len(tasks)} heads ({len(head_configs)} configurations, "
+        f"{num_folds} folds) on {len(labels)} embeddings with {workers} processes."
+    )
+
+    out_of_fold_scores = {
+        head_config: np.zeros(len(labels)) for head_config in head_configs
+    }
+    fold_epochs: Dict[HeadConfig, List[int]] = {
+        head_config: [] for head_config in head_configs
+    }
+
+    # TensorFlow does not survive being forked once initialized.
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_load_worker_dataset,
+        initargs=(embeddings_path,),
+    ) as executor:
+        for head_config, validation_fold, scores, epochs in executor.map(
+            _train_fold, *zip(*tasks)
+        ):
+            out_of_fold_scores[head_config][folds == validation_fold] = scores
+            fold_epochs[head_config].append(epochs)
+
+    results = []
+    for head_config in head_configs:
+        f1, precision, recall, threshold = best_threshold(
+            out_of_fold_scores[head_config], labels
+        )
+        epochs = round(statistics.median(fold_epochs[head_config]))
+        results.append(
+            SweepResult(head_config, f1, precision, recall, threshold, epochs)
+        )
+
+    return sorted(results, key=lambda result: result.f1, reverse=True)
+
+
+def run(num_folds: int = 5, workers: Optional[int] = None):
+    """Runs the sweep, prints its results and saves the best head as the model."""
+    retrained_model = RetrainedModel(variant="retrained")
+    embeddings, labels, file_indices = retrained_model.extract_embeddings()
+
+    results = run_sweep(embeddings, labels, file_indices, num_folds, workers)
+
+    print(
+        f"{'hidden layers':<16} {'lr':>8} {'f1':>6} {'precision':>10} {'recall':>7} "
+        f"{'threshold':>10} {'epochs':>7}"
+    )
+    for result in results:
+        hidden_layers = "-".join(map(str, result.head_config.hidden_layers))
+        print(
+            f"{hidden_layers:<16} {result.head_config.learning_rate:>8} "
+            f"{result.f1:>6.3f} {result.precision:>10.3f} {result.recall:>7.3f} "
+            f"{result.threshold:>10.3f} {result.epochs:>7}"
+        )
+
+    best = results[0]
+    logging.info(f"Training the best configuration {best.head_config} on all the data.")
+
+    head = build_head(best.head_config.hidden_layers, best.head_config.learning_rate)
+    head.fit(embeddings, labels, batch_size=16, epochs=best.epochs, verbose=0)
+    retrained_model.save_model(head)
+
+    logging.info(
+        f"Saved the retrained model. Recommended setting: "
+        f"RETRAINED_MODEL_OUTPUT_THRESHOLD={best.threshold:.3f}"
+    )
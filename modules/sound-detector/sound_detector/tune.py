@@ -0,0 +1,340 @@
+"""
+Threshold tuning on a corpus of labelled recordings, scored once and cached.
+
+Each recording is cut in consecutive windows, as the detector records them, and scored
+with the configured model. The scores are cached in `--cache-dir` under the hash of the
+model file and the hash of the recording, so only new recordings (or a new model) are
+scored again, and tuning itself takes seconds:
+
+    python main.py tune --positive dataset/positive --negative recordings/2024/05
+
+For the retrained model the score of a window is its output. For YAMNet only the top
+class and its score are cached, so `MULTICLASS_DETECT_SOUNDS` can change without
+scoring again: the score of a window is the one of its top class if it's one of the
+sounds to detect (as `run_yamnet_inference` decides) and -inf otherwise.
+
+Every threshold is then evaluated at once on the sorted scores, counting the scores
+above each threshold with `np.searchsorted`:
+
+- Per recording, a positive recording is detected when any window is above the
+  threshold, giving the precision, recall and false positive rate (the ROC curve).
+- Per window of the negative recordings, the detections a day of such audio would give
+  for every debounce, that is ignoring the windows within `debounce` windows after
+  another one above the threshold. With `m` the maximum of the `debounce` windows
+  before each window, a window starts a new detection when it's above the threshold
+  and `m` is not, so the detections above a threshold `t` are `#{s > t}` minus
+  `#{min(s, m) > t}`, two sorted arrays counted for all thresholds in one go.
+"""
+
+import csv
+import hashlib
+import logging
+import os
+import wave
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from numpy.typing import NDArray
+
+from sound_detector.config import config
+from sound_detector.exceptions import TaconezException
+from sound_detector.models.retrained import RetrainedModel, dataset_dirs
+from sound_detector.models.shared import file_sha256
+from sound_detector.models.yamnet import YAMNetModel, build_label_masks
+from sound_detector.sources import WavFileSource
+
+default_cache_dir = os.path.join(config.detected_recordings_dir, "score-cache")
+default_debounces = [0, 1, 2, 5, 10]
+
+seconds_per_day = 24 * 60 * 60
+
+
+def read_windows(path: str) -> NDArray:
+    """Cuts a 16 kHz mono recording in consecutive windows of shape (N, samples).
+
+    The samples after the last whole window are left out, as the detector would,
+    unless the recording is shorter than a window, which is then zero padded.
+    """
+    source = WavFileSource(path)
+    try:
+        pcm = np.frombuffer(
+            source.wave_file.readframes(source.wave_file.getnframes()), dtype=np.int16
+        )
+    finally:
+        source.close()
+
+    window_size = config.audio_inference_samples
+    if len(pcm) < window_size:
+        pcm = np.pad(pcm, (0, window_size - len(pcm)))
+
+    num_windows = len(pcm) // window_size
+    windows = pcm[: num_windows * window_size].reshape(num_windows, window_size)
+    return (windows / 32768).astype(np.float32)
+
+
+class ScoreCache:
+    """Per-window scores of recordings, by model hash and recording hash."""
+
+    def __init__(self, cache_dir: str):
+        self.model: Optional[Any] = None
+        if config.use_retrained_model:
+            self.model_class = RetrainedModel
+            self.model_kind = "retrained"
+        else:
+            self.model_class = YAMNetModel
+            self.model_kind = "yamnet"
+
+        # Its class names are needed for the detection scores, and loading it first
+        # downloads the model file if missing.
+        if self.model_kind == "yamnet":
+            self._load_model()
+
+        self.model_hash = self._model_hash()
+        self.cache_dir = os.path.join(cache_dir, f"{self.model_kind}-{self.model_hash}")
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self.num_scored = 0
+        self.num_cached = 0
+
+    def scores(self, path: str) -> Dict[str, NDArray]:
+        """The cached scores of the recording, scoring it first if needed.
+
+        Returns:
+            The `scores` of its windows and, for YAMNet, their `top_classes`.
+        """
+        cache_path = os.path.join(self.cache_dir, f"{file_sha256(path)[:32]}.npz")
+        if os.path.exists(cache_path):
+            self.num_cached += 1
+            with np.load(cache_path) as cached:
+                return dict(cached)
+
+        scores = self.score(read_windows(path))
+        self.num_scored += 1
+
+        with open(f"{cache_path}.tmp", "wb") as f:
+            np.savez(f, **scores)
+        os.replace(f"{cache_path}.tmp", cache_path)
+
+        return scores
+
+    def score(self, windows: NDArray) -> Dict[str, NDArray]:
+        if self.model is None:
+            self._load_model()
+
+        if self.model_kind == "retrained":
+            return {
+                "scores": np.array(
+                    [float(self.model.predict(window)) for window in windows],
+                    dtype=np.float32,
+                )
+            }
+
+        class_scores = np.array(
+            [np.mean(self.model.predict(window), axis=0) for window in windows]
+        )
+        top_classes = np.argmax(class_scores, axis=1)
+        return {
+            "scores": class_scores[np.arange(len(windows)), top_classes].astype(
+                np.float32
+            ),
+            "top_classes": top_classes.astype(np.int16),
+        }
+
+    def detection_scores(self, scores: Dict[str, NDArray]) -> NDArray:
+        """The score each window is compared against the detection threshold with."""
+        if self.model_kind == "retrained":
+            return scores["scores"]
+
+        label_masks = build_label_masks(self.model.class_names)
+        return np.where(
+            np.isin(scores["top_classes"], label_masks.detect_indices),
+            scores["scores"],
+            -np.inf,
+        ).astype(np.float32)
+
+    def _load_model(self):
+        self.model = self.model_class()
+        self.model.initialize()
+
+    def _model_hash(self) -> str:
+        model = self.model_class()
+        if config.use_tflite:
+            return file_sha256(model.tflite_model_path)[:16]
+        if self.model_kind == "retrained":
+            return file_sha256(model.saved_model_path)[:16]
+        # The full YAMNet is loaded from TensorFlow Hub by its handle.
+        return hashlib.sha256(YAMNetModel.model_handle.encode("utf-8")).hexdigest()[:16]
+
+
+def count_above(sorted_values: NDArray, thresholds: NDArray) -> NDArray:
+    """How many of the (ascending) values are above each threshold."""
+    return len(sorted_values) - np.searchsorted(sorted_values, thresholds, side="right")
+
+
+def previous_max(scores: NDArray, debounce: int) -> NDArray:
+    """The maximum of the `debounce` windows before each window, -inf if none."""
+    if debounce == 0:
+        return np.full(len(scores), -np.inf, dtype=scores.dtype)
+
+    padded = np.concatenate([np.full(debounce, -np.inf, dtype=scores.dtype), scores])
+    return np.lib.stride_tricks.sliding_window_view(padded, debounce)[:-1].max(axis=1)
+
+
+def count_detections(
+    file_scores: Sequence[NDArray], thresholds: NDArray, debounce: int
+) -> NDArray:
+    """Detections over all the recordings at each threshold with the given debounce."""
+    scores = np.concatenate(file_scores)
+    debounced = np.concatenate(
+        [
+            np.minimum(file_window_scores, previous_max(file_window_scores, debounce))
+            for file_window_scores in file_scores
+        ]
+    )
+    return count_above(np.sort(scores), thresholds) - count_above(
+        np.sort(debounced), thresholds
+    )
+
+
+def sweep_thresholds(
+    positive_scores: Sequence[NDArray],
+    negative_scores: Sequence[NDArray],
+    thresholds: NDArray,
+    debounces: Sequence[int],
+) -> Dict[str, NDArray]:
+    """Evaluates every threshold on the window scores of the labelled recordings.
+
+    Returns:
+        Arrays with a value per threshold: the recording-level `precision`, `recall`,
+        `f1` and `false_positive_rate`, and the `detections_per_day_<debounce>` of
+        each debounce on the negative recordings.
+    """
+    positive_maxima = np.sort([scores.max() for scores in positive_scores])
+    negative_maxima = np.sort([scores.max() for scores in negative_scores])
+
+    true_positives = count_above(positive_maxima, thresholds)
+    false_positives = count_above(negative_maxima, thresholds)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        precision = np.nan_to_num(true_positives / (true_positives + false_positives))
+        recall = true_positives / max(len(positive_maxima), 1)
+        f1 = np.nan_to_num(2 * precision * recall / (precision + recall))
+
+    results = {
+        "threshold": thresholds,
+        "precision": precision,
+        "recall": recall,
+        "f1": f1,
+        "false_positive_rate": false_positives / max(len(negative_maxima), 1),
+    }
+
+    negative_seconds = sum(map(len, negative_scores)) * config.audio_inference_seconds
+    for debounce in debounces:
+        detections = count_detections(negative_scores, thresholds, debounce)
+        results[f"detections_per_day_{debounce}"] = (
+            detections / max(negative_seconds, 1e-9) * seconds_per_day
+        )
+
+    return results
+
+
+def roc_auc(false_positive_rate: NDArray, recall: NDArray) -> float:
+    # Along the curve: by false positive rate, then recall.
+    order = np.lexsort((recall, false_positive_rate))
+    x = np.concatenate([[0.0], false_positive_rate[order], [1.0]])
+    y = np.concatenate([[0.0], recall[order], [1.0]])
+    return float(np.sum(np.diff(x) * (y[1:] + y[:-1]) / 2))
+
+
+def score_recordings(
+    score_cache: ScoreCache, dirs: Sequence[str]
+) -> Tuple[List[NDArray], int]:
+    """Window scores of every recording under the directories, and how many failed."""
+    file_scores = []
+    num_failed = 0
+    for directory in dirs:
+        for root, _, names in os.walk(directory):
+            for name in sorted(names):
+                if not name.endswith(".wav"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    scores = score_cache.scores(path)
+                except (wave.Error, EOFError, TaconezException) as e:
+                    logging.warning(f"Skipping {path}: {e}")
+                    num_failed += 1
+                    continue
+                file_scores.append(score_cache.detection_scores(scores))
+
+    return file_scores, num_failed
+
+
+def run(
+    positive_dirs: Optional[List[str]] = None,
+    negative_dirs: Optional[List[str]] = None,
+    cache_dir: str = default_cache_dir,
+    num_thresholds: int = 2000,
+    debounces: Sequence[int] = default_debounces,
+    output_path: Optional[str] = None,
+):
+    """Scores the corpus (or reads the cache), sweeps the thresholds and reports."""
+    score_cache = ScoreCache(cache_dir)
+
+    positive_scores, positive_failed = score_recordings(
+        score_cache, positive_dirs or [dataset_dirs[1]]
+    )
+    negative_scores, negative_failed = score_recordings(
+        score_cache, negative_dirs or [dataset_dirs[0]]
+    )
+    logging.info(
+        f"{len(positive_scores)} positive and {len(negative_scores)} negative "
+        f"recordings ({score_cache.num_scored} scored, {score_cache.num_cached} "
+        f"cached, {positive_failed + negative_failed} skipped)."
+    )
+    if not positive_scores or not negative_scores:
+        logging.error("Both positive and negative recordings are needed.")
+        return
+
+    all_scores = np.concatenate(positive_scores + negative_scores)
+    finite_scores = all_scores[np.isfinite(all_scores)]
+    thresholds = np.linspace(finite_scores.min(), finite_scores.max(), num_thresholds)
+
+    results = sweep_thresholds(positive_scores, negative_scores, thresholds, debounces)
+
+    if output_path:
+        with open(output_path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(results.keys())
+            writer.writerows(zip(*results.values()))
+        logging.info(f"Wrote the {num_thresholds} thresholds to {output_path}.")
+
+    best = int(np.argmax(results["f1"]))
+    print(
+        f"ROC AUC {roc_auc(results['false_positive_rate'], results['recall']):.4f} "
+        f"over {len(positive_scores)} positive and {len(negative_scores)} negative "
+        "recordings."
+    )
+    print(
+        f"{'threshold':>10} {'f1':>6} {'precision':>10} {'recall':>7} {'fpr':>6} "
+        + " ".join(f"{f'per day ({d})':>14}" for d in debounces)
+    )
+    for i in sorted({best, *np.linspace(0, num_thresholds - 1, 11).astype(int)}):
+        marker = "  <- best f1" if i == best else ""
+        print(
+            f"{thresholds[i]:>10.3f} {results['f1'][i]:>6.3f} "
+            f"{results['precision'][i]:>10.3f} {results['recall'][i]:>7.3f} "
+            f"{results['false_positive_rate'][i]:>6.3f} "
+            + " ".join(
+                f"{results[f'detections_per_day_{d}'][i]:>14.1f}" for d in debounces
+            )
+            + marker
+        )
+
+    setting = (
+        "RETRAINED_MODEL_OUTPUT_THRESHOLD"
+        if score_cache.model_kind == "retrained"
+        else "MULTICLASS_DETECTION_THRESHOLD"
+    )
+    logging.info(f"Best F1 setting: {setting}={thresholds[best]:.3f}")
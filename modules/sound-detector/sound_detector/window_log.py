@@ -0,0 +1,184 @@
+"""
+Compact per-window log of what the detector heard, for monitoring and gathering data.
+
+With `WINDOW_LOG` every analyzed window is appended as a fixed-width record (see
+`window_dtype`) to rolling binary files in `WINDOW_LOG_DIR`, one per day and machine
+(and more once `WINDOW_LOG_MAX_BYTES` is reached). A `.json` next to each file holds
+its NumPy dtype, so months of windows load in seconds with `read_window_log`:
+
+    from sound_detector.window_log import read_window_log
+    df = read_window_log("/app/recordings/window-log", class_names)
+
+The records are gathered in a preallocated array and written `WINDOW_LOG_BATCH_SIZE`
+at a time by a background thread, so the loop only pays for filling a row.
+"""
+
+import glob
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from datetime import datetime
+from typing import List, Optional
+
+import numpy as np
+
+from numpy.typing import NDArray
+
+from sound_detector.config import config
+
+
+def window_dtype(top_k: int) -> np.dtype:
+    return np.dtype(
+        [
+            # Unix time the window was analyzed at.
+            ("time", "<f8"),
+            ("machine", "S16"),
+            # The high-heel score, NaN if the retrained model was not run.
+            ("retrained_score", "<f4"),
+            # The top YAMNet classes (best first) and their scores, -1 and NaN if YAMNet
+            # was not run.
+            ("top_classes", "<i2", (top_k,)),
+            ("top_scores", "<f4", (top_k,)),
+        ]
+    )
+
+
+class WindowLog:
+    def __init__(self):
+        os.makedirs(config.window_log_dir, exist_ok=True)
+
+        self.top_k = config.window_log_top_k
+        self.dtype = window_dtype(self.top_k)
+        self.machine = config.machine_id.encode("utf-8")[:16]
+
+        self.records = np.zeros(config.window_log_batch_size, dtype=self.dtype)
+        self.num_records = 0
+        self.flushed_at = time.monotonic()
+
+        self.batches: queue.Queue = queue.Queue()
+        self.thread = threading.Thread(target=self.write_batches, daemon=True)
+        self.thread.start()
+
+        logging.info(
+            f"[WindowLog] Logging analyzed windows to {config.window_log_dir}."
+        )
+
+    def add(
+        self,
+        retrained_score: float = np.nan,
+        class_scores: Optional[NDArray] = None,
+    ):
+        """Records a window given its high-heel score and/or its YAMNet class scores."""
+        # Flushing before adding rather than after keeps the last record around, see
+        # `set_last_retrained_score`.
+        if (
+            self.num_records == len(self.records)
+            or time.monotonic() - self.flushed_at >= config.window_log_flush_seconds
+        ):
+            self.flush()
+
+        record = self.records[self.num_records]
+        record["time"] = time.time()
+        record["machine"] = self.machine
+        record["retrained_score"] = retrained_score
+
+        if class_scores is None:
+            record["top_classes"] = -1
+            record["top_scores"] = np.nan
+        else:
+            top_classes = np.argpartition(class_scores, -self.top_k)[-self.top_k :]
+            top_classes = top_classes[np.argsort(-class_scores[top_classes])]
+            record["top_classes"] = top_classes
+            record["top_scores"] = class_scores[top_classes]
+
+        self.num_records += 1
+
+    def set_last_retrained_score(self, retrained_score: float):
+        """Completes the last window recorded, e.g. by YAMNet, with its high-heel score."""
+        self.records[self.num_records - 1]["retrained_score"] = retrained_score
+
+    def flush(self):
+        if self.num_records:
+            self.batches.put(self.records[: self.num_records].copy())
+        self.num_records = 0
+        self.flushed_at = time.monotonic()
+
+    def close(self):
+        """Writes the pending records and waits for the writer to finish."""
+        self.flush()
+        self.batches.put(None)
+        self.thread.join()
+
+    def write_batches(self):
+        while True:
+            batch = self.batches.get()
+            if batch is None:
+                return
+
+            try:
+                with open(self._file_path(batch.nbytes), "ab") as f:
+                    batch.tofile(f)
+            except Exception:
+                logging.exception(f"[WindowLog] Lost {len(batch)} records.")
+
+    def _file_path(self, num_bytes: int) -> str:
+        """Path of the file to append to, starting a new one if it would grow too big."""
+        machine = self.machine.decode("utf-8")
+        prefix = os.path.join(
+            config.window_log_dir, f"windows-{machine}-{datetime.now():%Y-%m-%d}"
+        )
+
+        part = 0
+        while True:
+            path = f"{prefix}-{part}.bin"
+            if not os.path.exists(path):
+                with open(f"{path}.json", "w") as f:
+                    json.dump(np.lib.format.dtype_to_descr(self.dtype), f)
+                return path
+            if os.path.getsize(path) + num_bytes <= config.window_log_max_bytes:
+                return path
+            part += 1
+
+
+def read_window_log(log_dir: str, class_names: Optional[List[str]] = None):
+    """Loads every window logged in the directory into a `pandas.DataFrame`.
+
+    Args:
+        log_dir: The `WINDOW_LOG_DIR` the files were written to.
+        class_names: If given, adds `top{i}_class_name` columns with the names of the
+            YAMNet classes.
+
+    Returns:
+        A row per window with its `time`, `machine`, `retrained_score` and the
+        `top{i}_class` and `top{i}_score` columns for each of the top classes.
+    """
+    import pandas as pd
+
+    frames = []
+    for path in sorted(glob.glob(os.path.join(log_dir, "windows-*.bin"))):
+        with open(f"{path}.json") as f:
+            dtype = np.dtype(np.lib.format.descr_to_dtype(json.load(f)))
+        records = np.fromfile(path, dtype=dtype)
+
+        columns = {
+            "time": pd.to_datetime(records["time"], unit="s"),
+            "machine": np.char.decode(records["machine"], "utf-8"),
+            "retrained_score": records["retrained_score"],
+        }
+        for i in range(records["top_classes"].shape[1]):
+            columns[f"top{i}_class"] = records["top_classes"][:, i]
+            columns[f"top{i}_score"] = records["top_scores"][:, i]
+            if class_names is not None:
+                columns[f"top{i}_class_name"] = pd.Categorical.from_codes(
+                    records["top_classes"][:, i], categories=class_names
+                )
+        frames.append(pd.DataFrame(columns))
+
+    if not frames:
+        return pd.DataFrame()
+
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,15 @@
+import pytest
+
+from sound_detector.sources import AudioSource
+
+
+class SilentAudioSource(AudioSource):
+    """Stands in for the microphone, recording silence."""
+
+    def readinto(self, buffer):
+        buffer[:] = 0
+
+
+@pytest.fixture
+def audio_source():
+    return SilentAudioSource()
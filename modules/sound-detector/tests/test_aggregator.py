@@ -0,0 +1,77 @@
+import os
+
+import pytest
+
+from sound_detector import messages
+from sound_detector.aggregator import (
+    Candidate,
+    EventClusterer,
+    best_candidate,
+    event_recording_path,
+    validate_detection,
+)
+from sound_detector.config import config
+
+
+def detection(detected_by, score, sound="", sound_file_path="a.wav"):
+    frames = messages.encode_detection(
+        sound_file_path, detected_by, b"", when=0, score=score, rate=16000, sound=sound
+    )
+    return messages.decode_detection(frames)
+
+
+def candidate(received_at, detected_by, score):
+    return Candidate(received_at, detection(detected_by, score))
+
+
+def test_candidates_within_the_window_make_one_event():
+    """
+    Given an event clusterer with a window of two seconds
+    When candidates arrive within and after the window of the first one
+    Then the ones within it make one event once it closes, and the next opens another
+    """
+    clusterer = EventClusterer(window_seconds=2.0)
+    assert clusterer.seconds_until_due(0.0) is None
+
+    clusterer.add(candidate(10.0, "rpi-1", 5.5))
+    clusterer.add(candidate(11.0, "rpi-2", 7.0))
+    clusterer.add(candidate(11.5, "rpi-3", 6.0))
+
+    assert clusterer.seconds_until_due(11.5) == 0.5
+    assert clusterer.pop_event(11.9) is None
+
+    event = clusterer.pop_event(12.0)
+    assert [c.detection.detected_by for c in event] == ["rpi-1", "rpi-2", "rpi-3"]
+    assert best_candidate(event).detection.detected_by == "rpi-2"
+
+    # The next candidate opens a new event.
+    clusterer.add(candidate(12.5, "rpi-1", 5.5))
+    assert clusterer.pop_event(14.0) is None
+    assert len(clusterer.pop_event(14.5)) == 1
+
+
+def test_clip_path_is_rebuilt_from_validated_fields(monkeypatch):
+    """
+    Given detections whose sound file path points outside the recordings folder
+    When their clip path is built on the aggregator
+    Then it's inside the recordings folder, and detections with unsafe names are invalid
+    """
+    monkeypatch.setattr(config, "detected_recordings_dir", "/recordings")
+
+    file_path = event_recording_path(
+        detection("rpi-1", 6.1, "high_heel", sound_file_path="../../etc/passwd")
+    )
+
+    assert file_path.startswith("/recordings/")
+    assert os.path.basename(file_path).endswith("_rpi-1_high_heel-6.100.wav")
+
+    validate_detection(detection("rpi-1", 6.1, "high_heel"))
+    for invalid in (
+        detection("../rpi", 6.1),
+        detection("rpi/1", 6.1),
+        detection("rpi_1", 6.1),
+        detection("rpi", 6.1, "high heel/../x"),
+        detection("rpi", float("nan")),
+    ):
+        with pytest.raises(ValueError):
+            validate_detection(invalid)
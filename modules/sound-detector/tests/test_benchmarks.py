@@ -0,0 +1,65 @@
+import pytest
+
+from sound_detector import benchmark
+
+expected_benchmarks = {
+    "record_audio/fake",
+    "yamnet_predict/fake",
+    "retrained_predict/fake",
+    "run_yamnet_inference/fake",
+    "run_retrained_inference/fake",
+    "run_cascade_inference/fake",
+    "write_audio",
+    "play_events_check",
+}
+
+
+def test_runs_every_fake_benchmark():
+    """
+    Given the benchmarks of the hot path with fake interpreters
+    When they are run once
+    Then every one of them is timed
+    """
+    results = benchmark.run_benchmarks(repeat=1, real_tflite=False)
+
+    assert set(results) == expected_benchmarks
+    for result in results.values():
+        assert 0 <= result["min_us"] <= result["median_us"]
+
+
+def test_finds_a_regression_against_the_baseline():
+    """
+    Given a baseline
+    When a benchmark is twice as slow as it and another takes as long
+    Then only the slower one is a regression
+    """
+    baseline = {
+        "yamnet_predict/fake": {"median_us": 100.0, "min_us": 90.0},
+        "write_audio": {"median_us": 100.0, "min_us": 90.0},
+    }
+    results = {
+        "yamnet_predict/fake": {"median_us": 200.0, "min_us": 180.0},
+        "write_audio": {"median_us": 100.0, "min_us": 90.0},
+        "play_events_check": {"median_us": 1000.0, "min_us": 900.0},
+    }
+
+    assert benchmark.find_regressions(results, baseline, tolerance=0.5) == [
+        "yamnet_predict/fake"
+    ]
+
+
+def test_hot_path_has_not_regressed():
+    """
+    Given a stored benchmark baseline
+    When the fake-interpreter benchmarks of the hot path are run
+    Then none of them is slower than the baseline allows
+    """
+    baseline = benchmark.load_baseline()
+    if baseline is None:
+        pytest.skip(
+            "No baseline, store one with `python main.py benchmark --save-baseline`."
+        )
+
+    results = benchmark.run_benchmarks(repeat=20, real_tflite=False)
+
+    assert benchmark.find_regressions(results, baseline, tolerance=0.5) == []
@@ -0,0 +1,87 @@
+import json
+import urllib.request
+
+import pytest
+
+from sound_detector.config import config
+from sound_detector.control import ControlServer, DetectorStats
+
+
+@pytest.fixture
+def control_server(monkeypatch, audio_source):
+    monkeypatch.setattr(config, "control_server_port", 0)
+    monkeypatch.setattr(config, "stealth_mode", False)
+
+    detector_stats = DetectorStats()
+    control_server = ControlServer(detector_stats, object(), audio_source)
+    control_server.start()
+    yield control_server
+    control_server.stop()
+
+
+def request(control_server, path, body=None):
+    host, port = control_server.http_server.server_address[:2]
+    data = None if body is None else json.dumps(body).encode("utf-8")
+    try:
+        with urllib.request.urlopen(
+            f"http://{host}:{port}{path}", data=data
+        ) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+
+def test_stats_report_the_counters(control_server):
+    """
+    Given a control server whose loop recorded, analyzed, skipped and detected
+    When its stats are requested
+    Then they report the counters and the latency per window
+    """
+    detector_stats = control_server.detector_stats
+    detector_stats.add_recorded(10)
+    detector_stats.add_analyzed(8, 0.08)
+    detector_stats.add_skipped(2)
+    detector_stats.add_detection(6.5, "high_heel")
+
+    status, stats = request(control_server, "/stats")
+
+    assert status == 200
+    assert stats["windows"] == {"recorded": 10, "analyzed": 8, "skipped": 2}
+    assert stats["window_latency_ms"]["p50"] == pytest.approx(10.0)
+    assert stats["detections"] == 1
+    assert stats["last_detection"]["class"] == "high_heel"
+    assert stats["paused"] is False
+
+
+def test_commands_are_carried_out_by_the_loop(control_server):
+    """
+    Given a control server
+    When commands are posted to it
+    Then they are carried out when the loop runs them, and unknown ones are refused
+    """
+    status, response = request(control_server, "/stealth", {})
+    assert (status, response["stealth_mode"]) == (202, True)
+    assert config.stealth_mode is False
+
+    control_server.run_pending_commands()
+    assert config.stealth_mode is True
+
+    status, _ = request(control_server, "/profile", {})
+    assert status == 409
+    status, _ = request(control_server, "/reboot", {})
+    assert status == 404
+
+
+def test_pause_waits_until_resumed(control_server):
+    """
+    Given a control server asked to pause and then to resume
+    When the loop runs the pending commands
+    Then it returns resumed, with no commands left
+    """
+    request(control_server, "/pause", {})
+    request(control_server, "/resume", {})
+
+    control_server.run_pending_commands()
+
+    assert not control_server.paused
+    assert control_server.commands.empty()
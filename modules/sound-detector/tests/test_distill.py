@@ -0,0 +1,58 @@
+import numpy as np
+
+from sound_detector.distill import cut_windows, split_folds
+from sound_detector.models.distilled import dft_kernel, fft_size, mel_weights
+
+
+def test_windows_overlap_by_half_and_pad_the_last_one():
+    """
+    Given a waveform that is not a whole number of half windows
+    When it is cut in windows
+    Then they start every half window and the last one is zero padded
+    """
+    waveform = np.arange(1, 11, dtype=np.float32)
+
+    windows = cut_windows(waveform, 4)
+
+    assert windows.tolist() == [
+        [1, 2, 3, 4],
+        [3, 4, 5, 6],
+        [5, 6, 7, 8],
+        [7, 8, 9, 10],
+    ]
+    assert cut_windows(waveform[:3], 4).tolist() == [[1, 2, 3, 0]]
+    assert cut_windows(waveform[:7], 4)[-1].tolist() == [5, 6, 7, 0]
+
+
+def test_dft_kernel_matches_the_fft_of_the_windowed_frame():
+    """
+    Given a frame of noise
+    When it is multiplied by the DFT kernel of the student
+    Then the real and imaginary parts match the FFT of the Hann windowed frame
+    """
+    num_bins = mel_weights().shape[0]
+    frame = np.random.default_rng(0).standard_normal(fft_size).astype(np.float32)
+
+    spectrum = frame @ dft_kernel(num_bins)[:, 0, :]
+
+    expected = np.fft.rfft(frame * np.hanning(fft_size + 1)[:-1])[:num_bins]
+    np.testing.assert_allclose(spectrum[:num_bins], expected.real, atol=1e-3)
+    np.testing.assert_allclose(spectrum[num_bins:], expected.imag, atol=1e-3)
+
+
+def test_folds_split_recordings_in_training_validation_and_test():
+    """
+    Given the windows of several recordings of both labels
+    When they are split for distillation
+    Then each window is in exactly one split and a recording is never in two
+    """
+    labels = np.repeat([1] * 5 + [0] * 10, 4)
+    file_indices = np.repeat(np.arange(15), 4)
+
+    training, validation, test = split_folds(labels, file_indices)
+
+    assert np.all(training.astype(int) + validation + test == 1)
+    for split in (training, validation, test):
+        assert labels[split].any() and not labels[split].all()
+        for file_index in np.unique(file_indices[split]):
+            assert split[file_indices == file_index].all()
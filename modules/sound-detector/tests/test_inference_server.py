@@ -0,0 +1,46 @@
+import json
+
+import zmq
+
+from sound_detector.config import config
+from sound_detector.inference_server import InferenceServer
+
+
+class FakeModel:
+    class_names = ["Speech", "Clip-clop"]
+
+
+def test_malformed_requests_do_not_stop_the_server(monkeypatch):
+    """
+    Given an inference server
+    When a node sends malformed requests among valid ones
+    Then the malformed ones are dropped and the valid ones are still answered
+    """
+    monkeypatch.setattr(config, "use_retrained_model", False)
+    monkeypatch.setattr(config, "zmq_inference_server_bind_addr", "inproc://inference")
+
+    context = zmq.Context()
+    server = InferenceServer(FakeModel(), context)
+    node = context.socket(zmq.DEALER)
+    node.connect("inproc://inference")
+
+    node.send_multipart([b"not json", b""])
+    node.send_multipart([b"[1, 2]", b""])
+    node.send_multipart([b"{}"])
+    node.send_multipart([json.dumps({"id": 1, "op": "describe"}).encode(), b""])
+    node.send_multipart([json.dumps({"id": 2}).encode(), b""])
+
+    for _ in range(5):
+        server.serve_request()
+
+    replies = [json.loads(node.recv_multipart()[0]) for _ in range(2)]
+    assert replies[0] == {
+        "model": "yamnet",
+        "class_names": FakeModel.class_names,
+        "id": 1,
+    }
+    assert replies[1]["id"] == 2 and "error" in replies[1]
+
+    node.close()
+    server.socket.close()
+    context.term()
@@ -0,0 +1,41 @@
+import numpy as np
+
+from sound_detector.config import config
+from sound_detector.load import LoadShedder
+
+
+def test_half_of_the_loud_windows_are_analyzed_at_level_2():
+    """
+    Given a load shedder at level 2
+    When it selects from a batch with two quiet windows and four loud ones
+    Then it keeps the loudest half of the loud ones, in chronological order
+    """
+    load_shedder = LoadShedder()
+    load_shedder.level = 2
+    loudness = [0.0, 0.5, 0.0, 0.2, 0.4, 0.3]
+    waveforms = [
+        np.full(10, level + config.load_shedding_silence_rms * bool(level))
+        for level in loudness
+    ]
+
+    selected = load_shedder.select_waveforms(waveforms)
+
+    assert [w[0] for w in selected] == [waveforms[1][0], waveforms[4][0]]
+
+
+def test_quiet_batches_do_not_raise_the_level(monkeypatch):
+    """
+    Given a load shedder that fell behind on a loud batch
+    When the following batches are all quiet, so nothing is analyzed
+    Then the level stays where the loud batch left it
+    """
+    monkeypatch.setattr(config, "thermal_zone_path", "/nonexistent")
+    load_shedder = LoadShedder()
+
+    assert load_shedder.record_cycle(
+        10 * config.audio_inference_seconds * config.load_shedding_high_rtf, 5, 5
+    )
+    for _ in range(3):
+        assert not load_shedder.record_cycle(0.01, 0, 5)
+
+    assert load_shedder.level == 1
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from sound_detector import messages
+
+
+def test_detection_message_round_trip():
+    """
+    Given a detection with its clip
+    When it's encoded as a binary message and decoded back
+    Then every field and the audio come out unchanged
+    """
+    audio = (np.arange(15600) % 100).astype(np.int16).tobytes()
+    frames = messages.encode_detection(
+        "2024/01/27/2024-01-27T10-19-36_rpi_high_heel-6.100.wav",
+        "rpi",
+        audio,
+        when=1706350776,
+        score=6.1,
+        rate=16000,
+    )
+
+    message = messages.decode_detection(frames)
+
+    assert message.header.version == messages.VERSION
+    assert message.header.rate == 16000
+    assert message.header.when == 1706350776
+    assert message.header.score == pytest.approx(6.1)
+    assert message.sound_file_path.endswith("high_heel-6.100.wav")
+    assert message.detected_by == "rpi"
+    assert bytes(message.audio) == audio
+    assert message.sound == ""
+
+
+def test_detection_message_carries_the_sound_class():
+    """
+    Given a detection of a sound class
+    When it's encoded with its slug
+    Then the decoded message carries the slug
+    """
+    frames = messages.encode_detection(
+        "a.wav", "rpi", b"", when=0, score=0, rate=1, sound="high_heel"
+    )
+
+    assert messages.decode_detection(frames).sound == "high_heel"
+
+
+def test_decode_rejects_other_messages():
+    """
+    Given a JSON message and a binary one with the wrong magic
+    When they are decoded
+    Then a ValueError is raised
+    """
+    with pytest.raises(ValueError):
+        messages.decode_detection([b'{"when": 0}'])
+
+    frames = messages.encode_detection("a.wav", "rpi", b"", when=0, score=0, rate=1)
+    frames[0] = b"XXXX" + frames[0][4:]
+    with pytest.raises(ValueError):
+        messages.decode_detection(frames)
@@ -0,0 +1,155 @@
+import os
+
+from datetime import datetime
+
+import pytest
+
+from sound_detector.audio import write_audio
+from sound_detector.config import config
+from sound_detector.recordings_index import (
+    index_file_name,
+    query_recordings,
+    rebuild_index,
+    record_dtype,
+)
+
+recordings = [
+    ("2024-01-27T10-19-36", "rpi", "high_heel", 6.1),
+    ("2024-01-27T10-19-30", "mac", "high_heel", 2.5),
+    ("2024-01-27T23-59-59", "rpi", "knock", 4.0),
+    ("2024-01-28T08-00-00", "rpi", "high_heel", 8.0),
+]
+
+
+@pytest.fixture
+def recordings_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "detected_recordings_dir", str(tmp_path))
+    monkeypatch.setattr(config, "recordings_index", True)
+
+    for timestamp, machine, sound, score in recordings:
+        day_folder = timestamp[:10].replace("-", "/")
+        write_audio(
+            bytes(config.audio_rate * config.audio_sample_width),
+            file_path=os.path.join(
+                tmp_path, day_folder, f"{timestamp}_{machine}_{sound}-{score:.3f}.wav"
+            ),
+        )
+
+    return tmp_path
+
+
+def query_names(**kwargs):
+    records, paths = query_recordings(**kwargs)
+    assert len(records) == len(paths)
+    return [os.path.basename(path) for path in paths]
+
+
+def test_finds_recordings_by_time_and_score(recordings_dir):
+    """
+    Given recordings of two days indexed as they were saved
+    When they are queried by time, machine, class and score
+    Then only the matching ones are found, by time
+    """
+    assert query_names(
+        start=datetime(2024, 1, 27, 10), end=datetime(2024, 1, 28, 12)
+    ) == [
+        "2024-01-27T10-19-30_mac_high_heel-2.500.wav",
+        "2024-01-27T10-19-36_rpi_high_heel-6.100.wav",
+        "2024-01-27T23-59-59_rpi_knock-4.000.wav",
+        "2024-01-28T08-00-00_rpi_high_heel-8.000.wav",
+    ]
+    assert query_names(
+        start=datetime(2024, 1, 27, 10, 19, 31), end=datetime(2024, 1, 28)
+    ) == [
+        "2024-01-27T10-19-36_rpi_high_heel-6.100.wav",
+        "2024-01-27T23-59-59_rpi_knock-4.000.wav",
+    ]
+    assert query_names(
+        start=datetime(2024, 1, 1),
+        end=datetime(2024, 2, 1),
+        machine="rpi",
+        sound="high_heel",
+        min_score=7,
+    ) == ["2024-01-28T08-00-00_rpi_high_heel-8.000.wav"]
+
+
+def test_records_describe_the_recordings(recordings_dir):
+    """
+    Given an indexed recording
+    When its record is queried
+    Then it holds its score, duration and size
+    """
+    records, _ = query_recordings(
+        start=datetime(2024, 1, 28), end=datetime(2024, 1, 29)
+    )
+
+    assert records["score"].tolist() == pytest.approx([8.0])
+    assert records["duration"].tolist() == pytest.approx([1 / config.audio_channels])
+    assert records["size"][0] > config.audio_rate * config.audio_sample_width
+
+
+def test_rebuild_matches_the_appended_index(recordings_dir):
+    """
+    Given a day index whose last record was cut in half by a crash
+    When the index is rebuilt from the recordings
+    Then it is the index that was appended, without the cut record
+    """
+    day_dir = os.path.join(recordings_dir, "2024", "01", "27")
+    with open(os.path.join(day_dir, index_file_name), "rb") as f:
+        appended = f.read()
+
+    # A record cut in half by a crash is left out and then rewritten.
+    with open(os.path.join(day_dir, index_file_name), "ab") as f:
+        f.write(bytes(record_dtype.itemsize // 2))
+    assert len(query_names(start=datetime(2024, 1, 27), end=datetime(2024, 1, 28))) == 3
+
+    rebuild_index()
+
+    with open(os.path.join(day_dir, index_file_name), "rb") as f:
+        rebuilt = f.read()
+    assert len(rebuilt) == len(appended)
+    assert query_names(start=datetime(2024, 1, 27), end=datetime(2024, 1, 28)) == [
+        "2024-01-27T10-19-30_mac_high_heel-2.500.wav",
+        "2024-01-27T10-19-36_rpi_high_heel-6.100.wav",
+        "2024-01-27T23-59-59_rpi_knock-4.000.wav",
+    ]
+
+
+def test_appends_after_a_cut_record_are_kept(recordings_dir):
+    """
+    Given a day index whose last record was cut in half by a crash
+    When more recordings are saved that day
+    Then the cut record is dropped and the new ones are found
+    """
+    day_dir = os.path.join(recordings_dir, "2024", "01", "28")
+    with open(os.path.join(day_dir, index_file_name), "ab") as f:
+        f.write(bytes(record_dtype.itemsize // 2))
+
+    for timestamp in ("2024-01-28T09-00-00", "2024-01-28T10-00-00"):
+        write_audio(
+            bytes(config.audio_rate * config.audio_sample_width),
+            file_path=os.path.join(day_dir, f"{timestamp}_rpi_knock-3.000.wav"),
+        )
+
+    assert query_names(start=datetime(2024, 1, 28), end=datetime(2024, 1, 29)) == [
+        "2024-01-28T08-00-00_rpi_high_heel-8.000.wav",
+        "2024-01-28T09-00-00_rpi_knock-3.000.wav",
+        "2024-01-28T10-00-00_rpi_knock-3.000.wav",
+    ]
+
+
+def test_failing_to_index_does_not_fail_the_save(recordings_dir):
+    """
+    Given an index that can't be written to
+    When a recording is saved
+    Then it's still saved
+    """
+    day_dir = os.path.join(recordings_dir, "2024", "01", "29")
+    os.makedirs(os.path.join(day_dir, index_file_name))
+
+    file_path = write_audio(
+        b"\x00\x00",
+        file_path=os.path.join(day_dir, "2024-01-29T08-00-00_rpi_knock-3.000.wav"),
+    )
+
+    assert os.path.exists(file_path)
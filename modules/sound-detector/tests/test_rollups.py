@@ -0,0 +1,47 @@
+import numpy as np
+
+from sound_detector.rollups import ScoreRollup
+
+
+def test_rollup_aggregates_scores_into_buckets():
+    """
+    Given a score rollup
+    When scores of a few batches of windows are added
+    Then the flushed fields hold their count, max, mean and histogram
+    """
+    rollup = ScoreRollup()
+    rollup.bucket_edges = np.array([0.0, 5.0], dtype=np.float32)
+    rollup.reset()
+
+    rollup.add_scores([-1.0, 0.0, 3.0])
+    rollup.add_scores([6.0])
+    rollup.add_skipped(2)
+
+    fields = rollup.flush()
+
+    assert fields["count"] == 4
+    assert fields["skipped"] == 2
+    assert fields["max"] == 6.0
+    assert fields["mean"] == 2.0
+    assert fields["bucket_le_0"] == 2
+    assert fields["bucket_le_5"] == 1
+    assert fields["bucket_gt_5"] == 1
+
+
+def test_rollup_counts_top_classes():
+    """
+    Given a score rollup for a multiclass model
+    When windows with different top classes are added
+    Then the flushed fields hold the count and max score of each top class
+    """
+    rollup = ScoreRollup(3, ["Speech", "Clip-clop", "Music"])
+
+    rollup.add_scores([0.2, 0.6, 0.4], [1, 1, 0])
+
+    fields = rollup.flush()
+
+    assert fields["class_clip_clop_count"] == 2
+    assert abs(fields["class_clip_clop_max"] - 0.6) < 1e-6
+    assert fields["class_speech_count"] == 1
+    assert "class_music_count" not in fields
+    assert ScoreRollup(3, ["Speech", "Clip-clop", "Music"]).flush()["count"] == 0
@@ -0,0 +1,30 @@
+import base64
+
+import numpy as np
+
+from sound_detector.config import config
+from sound_detector.sidecars import compute_sidecar
+
+
+def test_sidecar_summarizes_the_clip():
+    """
+    Given a detected clip of two windows of a 1 kHz tone, the second one not analyzed
+    When its sidecar is computed
+    Then it holds its peaks, a log-mel thumbnail peaking around 1 kHz and its scores
+    """
+    t = np.arange(2 * config.audio_inference_samples) / config.audio_rate
+    pcm = (0.5 * 32767 * np.sin(2 * np.pi * 1000 * t)).astype(np.int16)
+
+    sidecar = compute_sidecar(pcm.tobytes(), np.array([6.5, np.nan]))
+
+    assert len(sidecar["peaks"]["min"]) == len(sidecar["peaks"]["max"])
+    assert max(sidecar["peaks"]["max"]) == 63
+    assert min(sidecar["peaks"]["min"]) == -64
+
+    mel = np.frombuffer(base64.b64decode(sidecar["mel"]["values"]), dtype=np.uint8)
+    mel = mel.reshape(sidecar["mel"]["bands"], sidecar["mel"]["frames"])
+    assert mel.shape == (config.sidecar_mel_bands, config.sidecar_mel_frames)
+    loudest_band = np.argmax(mel.mean(axis=1))
+    assert 0 < loudest_band < config.sidecar_mel_bands // 2
+
+    assert sidecar["window_scores"] == [6.5, None]
@@ -0,0 +1,169 @@
+import os
+import threading
+import wave
+
+import numpy as np
+import pytest
+import zmq
+
+from sound_detector.audio import record_audio
+from sound_detector.config import config
+from sound_detector.sources import (
+    CaptureStats,
+    PipeSource,
+    PyAudioSource,
+    WavFileSource,
+    ZMQSource,
+)
+
+
+def make_pcm(num_samples: int) -> np.ndarray:
+    return (np.arange(num_samples) % 2000 - 1000).astype(np.int16)
+
+
+def test_wav_file_source_records_whole_batches(tmp_path):
+    """
+    Given a WAV file holding a batch and a half of audio
+    When batches are recorded from it
+    Then the first batch is its audio and the next one ends the source
+    """
+    batch_samples = config.audio_inference_batch_size * config.audio_inference_samples
+    pcm = make_pcm(batch_samples * 3 // 2)
+
+    path = str(tmp_path / "recording.wav")
+    with wave.open(path, "wb") as wave_file:
+        wave_file.setnchannels(config.audio_channels)
+        wave_file.setsampwidth(config.audio_sample_width)
+        wave_file.setframerate(config.audio_rate)
+        wave_file.writeframes(pcm.tobytes())
+
+    source = WavFileSource(path)
+    waveforms, waveform_binary = record_audio(source)
+
+    assert len(waveforms) == config.audio_inference_batch_size
+    assert waveforms[0].shape == (config.audio_inference_samples,)
+    assert waveforms[0].dtype == np.float32
+    assert waveform_binary == pcm[:batch_samples].tobytes()
+
+    with pytest.raises(EOFError):
+        record_audio(source)
+
+
+def test_pipe_source_fills_the_buffer_across_short_writes():
+    """
+    Given a pipe written to in pieces that do not line up with the samples
+    When a buffer is filled from it
+    Then it holds the audio, and the next one ends the source once the pipe is closed
+    """
+    read_fd, write_fd = os.pipe()
+    pcm = make_pcm(5000)
+
+    def write():
+        with os.fdopen(write_fd, "wb", buffering=0) as f:
+            for start in range(0, pcm.nbytes, 999):
+                f.write(pcm.tobytes()[start : start + 999])
+
+    threading.Thread(target=write).start()
+
+    source = PipeSource(f"/dev/fd/{read_fd}")
+    buffer = np.empty(4000, dtype=np.int16)
+    source.readinto(buffer)
+    np.testing.assert_array_equal(buffer, pcm[:4000])
+
+    with pytest.raises(EOFError):
+        source.readinto(buffer)
+    source.close()
+
+
+def test_zmq_source_splits_messages_across_buffers():
+    """
+    Given a ZMQ source receiving audio messages, with odd-length messages among them
+    When buffers that do not line up with the messages are filled from it
+    Then they hold the audio in order, without the odd-length messages
+    """
+    context = zmq.Context()
+    push_socket = context.socket(zmq.PUSH)
+    push_socket.bind("inproc://audio")
+    source = ZMQSource("inproc://audio", context)
+
+    pcm = make_pcm(3000)
+    for chunk in np.split(pcm, 3):
+        push_socket.send(chunk.tobytes())
+        push_socket.send(b"\x00")
+
+    first, second = np.empty(1500, dtype=np.int16), np.empty(1500, dtype=np.int16)
+    source.readinto(first)
+    source.readinto(second)
+
+    np.testing.assert_array_equal(np.concatenate([first, second]), pcm)
+
+    push_socket.close()
+    source.close()
+    context.term()
+
+
+def test_pyaudio_source_marks_lost_audio_where_it_was_lost():
+    """
+    Given a microphone whose third chunk comes after PortAudio lost a chunk and a half
+    When a buffer is filled from it
+    Then every chunk captured is kept and the lost samples are zero-filled before it
+    """
+    # Skips `__init__`, which would need PortAudio.
+    source = object.__new__(PyAudioSource)
+    source.input_overflow = 2
+    source.callback_continue = 0
+    source.capture_stats = CaptureStats()
+    source.reset_buffer()
+
+    chunk = config.audio_chunk
+    lost = chunk * 3 // 2
+    adc_times = [10.0, 10.0 + chunk / config.audio_rate]
+    adc_times.append(adc_times[-1] + (chunk + lost) / config.audio_rate)
+    for index, (adc_time, status_flags) in enumerate(zip(adc_times, [0, 0, 2])):
+        in_data = np.full(chunk, index + 1, dtype=np.int16).tobytes()
+        time_info = {"input_buffer_adc_time": adc_time}
+        source._on_input(in_data, chunk, time_info, status_flags)
+
+    buffer = np.empty(3 * chunk + lost, dtype=np.int16)
+    source.readinto(buffer)
+
+    np.testing.assert_array_equal(buffer[:chunk], 1)
+    np.testing.assert_array_equal(buffer[chunk : 2 * chunk], 2)
+    np.testing.assert_array_equal(buffer[2 * chunk : 2 * chunk + lost], 0)
+    np.testing.assert_array_equal(buffer[2 * chunk + lost :], 3)
+
+    fields = source.capture_stats.flush()
+    assert fields["capture_overruns"] == 1
+    assert fields["capture_dropped_samples"] == lost
+    assert fields["capture_overrun_rate"] == pytest.approx(lost / len(buffer))
+    assert source.capture_stats.flush()["capture_overruns"] == 0
+
+
+def test_pyaudio_source_drops_the_oldest_chunks_while_the_detector_stalls():
+    """
+    Given a microphone whose chunks are not read for longer than the source buffers
+    When a buffer is filled from it
+    Then the oldest chunks are dropped for the latest ones, as a single zero-filled gap
+    """
+    source = object.__new__(PyAudioSource)
+    source.input_overflow = 2
+    source.callback_continue = 0
+    source.capture_stats = CaptureStats()
+    source.reset_buffer()
+    source.max_chunks = 2
+
+    chunk = config.audio_chunk
+    for index in range(5):
+        in_data = np.full(chunk, index + 1, dtype=np.int16).tobytes()
+        source._on_input(in_data, chunk, {}, 0)
+
+    assert len(source.chunks) == 3
+
+    buffer = np.empty(5 * chunk, dtype=np.int16)
+    source.readinto(buffer)
+
+    np.testing.assert_array_equal(buffer[: 3 * chunk], 0)
+    np.testing.assert_array_equal(buffer[3 * chunk : 4 * chunk], 4)
+    np.testing.assert_array_equal(buffer[4 * chunk :], 5)
+    assert source.capture_stats.total_overruns == 1
+    assert source.capture_stats.total_dropped_samples == 3 * chunk
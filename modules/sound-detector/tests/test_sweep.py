@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from sound_detector.sweep import assign_folds, best_threshold
+
+
+def test_best_threshold_separates_the_scores():
+    """
+    Given scores that separate the positives from the negatives
+    When the best threshold is searched
+    Then it is halfway between them with a perfect F1
+    """
+    scores = np.array([-3.0, -1.0, 0.5, 2.0, 4.0, 6.0])
+    labels = np.array([0, 0, 0, 1, 1, 1], dtype=np.float32)
+
+    f1, precision, recall, threshold = best_threshold(scores, labels)
+
+    assert (f1, precision, recall) == (1.0, 1.0, 1.0)
+    assert threshold == pytest.approx(1.25)
+
+
+def test_folds_keep_recordings_together_and_stratified():
+    """
+    Given the windows of several recordings of both labels
+    When they are assigned to folds
+    Then the windows of a recording share a fold and each fold has as many positives
+    """
+    labels = np.repeat([1, 1, 0, 0, 0, 0], 3)
+    file_indices = np.repeat(np.arange(6), 3)
+
+    folds = assign_folds(labels, file_indices, num_folds=2)
+
+    for file_index in range(6):
+        assert len(set(folds[file_indices == file_index])) == 1
+    for fold in range(2):
+        assert labels[folds == fold].sum() == 3
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from sound_detector.tune import count_detections, roc_auc, sweep_thresholds
+
+
+def count_detections_slowly(file_scores, threshold, debounce):
+    count = 0
+    for scores in file_scores:
+        for i, score in enumerate(scores):
+            previous = scores[max(0, i - debounce) : i]
+            if score > threshold and not np.any(previous > threshold):
+                count += 1
+    return count
+
+
+@pytest.mark.parametrize("debounce", [0, 1, 3])
+def test_detections_match_counting_window_by_window(debounce):
+    """
+    Given the scores of a few recordings, one of them never scoring
+    When the detections are counted for many thresholds at once
+    Then they match counting them window by window with the same debounce
+    """
+    rng = np.random.default_rng(0)
+    file_scores = [rng.normal(size=size).astype(np.float32) for size in (1, 7, 40)]
+    file_scores.append(np.full(3, -np.inf, dtype=np.float32))
+    thresholds = np.linspace(-2, 2, 50)
+
+    counts = count_detections(file_scores, thresholds, debounce)
+
+    expected = [
+        count_detections_slowly(file_scores, threshold, debounce)
+        for threshold in thresholds
+    ]
+    assert counts.tolist() == expected
+
+
+def test_sweep_separates_the_recordings():
+    """
+    Given positive and negative recordings that a threshold separates
+    When the thresholds are swept
+    Then the recall, precision and false positive rate of each are right and the AUC is 1
+    """
+    positive_scores = [np.array([0.0, 6.0]), np.array([7.0])]
+    negative_scores = [np.array([1.0, 2.0, 1.0]), np.array([0.0])]
+    thresholds = np.array([1.5, 3.0, 6.5])
+
+    results = sweep_thresholds(positive_scores, negative_scores, thresholds, [0, 2])
+
+    assert results["recall"].tolist() == [1.0, 1.0, 0.5]
+    assert results["precision"].tolist() == pytest.approx([2 / 3, 1.0, 1.0])
+    assert results["false_positive_rate"].tolist() == [0.5, 0.0, 0.0]
+    assert roc_auc(results["false_positive_rate"], results["recall"]) == 1.0
@@ -0,0 +1,34 @@
+import numpy as np
+
+from sound_detector.config import config
+from sound_detector.window_log import WindowLog, read_window_log
+
+
+def test_window_log_round_trip(tmp_path, monkeypatch):
+    """
+    Given a window log
+    When windows scored by YAMNet, the retrained model or both are recorded
+    Then they are read back by pandas with their top classes and scores
+    """
+    monkeypatch.setattr(config, "window_log_dir", str(tmp_path))
+    monkeypatch.setattr(config, "window_log_top_k", 3)
+    monkeypatch.setattr(config, "window_log_batch_size", 2)
+
+    class_scores = np.array([0.1, 0.7, 0.05, 0.9, 0.3], dtype=np.float32)
+
+    window_log = WindowLog()
+    window_log.add(class_scores=class_scores)
+    window_log.add(retrained_score=6.5)
+    window_log.add(class_scores=class_scores)
+    window_log.set_last_retrained_score(4.0)
+    window_log.close()
+
+    df = read_window_log(str(tmp_path), ["a", "b", "c", "d", "e"])
+
+    assert len(df) == 3
+    assert list(df["top0_class"]) == [3, -1, 3]
+    assert list(df["top1_class_name"][[0, 2]]) == ["b", "b"]
+    assert df["top2_score"][0] == np.float32(0.3)
+    assert np.isnan(df["retrained_score"][0])
+    assert list(df["retrained_score"][1:]) == [6.5, 4.0]
+    assert (df["machine"] == config.machine_id).all()